@@ -0,0 +1,35 @@
+"""
+Benchmarks for the watchmate API. Each module runs on its own against a throwaway
+in-memory test database, e.g.
+
+    python -m benchmarks.token_auth
+"""
+import os
+import time
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchmate.settings.settings_dev')
+    os.environ.setdefault('SECRET_KEY', 'benchmarks')
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+
+def timed(fn, repeat):
+    '''seconds per call of fn, averaged over repeat calls'''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, *rows]:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
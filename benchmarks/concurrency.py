@@ -0,0 +1,206 @@
+"""
+Throughput and latency of the read endpoints at increasing concurrency. They are served three ways:
+by Django's WSGI handler from a pool of threads, as gunicorn's gthread workers would serve them, and
+by its ASGI handler on one event loop, first with the sync views and then with the async views of
+watchlist_app.api.asynchronous. The in-memory SQLite database answers without a round trip, so
+--db-latency adds one to every query, which is where an event loop has other requests to get on with.
+The response cache is off unless --cached, and throttling is off.
+
+    python -m benchmarks.concurrency --concurrency 1,8,32 --db-latency 1
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import cycle, islice
+from unittest import mock
+
+from benchmarks import print_table, setup
+
+setup()
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.urls import clear_url_caches, reverse
+
+from benchmarks import data
+from watchlist_app.api import throttling, urls as watchlist_urls
+from watchlist_app.models import Review, StreamPlatform
+from watchmate import urls as root_urls
+
+
+def read_urls():
+    review = Review.objects.order_by('id').first()
+    platform = StreamPlatform.objects.order_by('id').first()
+    return [
+        reverse('movie-list'),
+        reverse('movie-details', args=(review.watchlist_id,)),
+        reverse('stream-list'),
+        reverse('stream-details', args=(platform.id,)),
+        reverse('reviews-list', args=(review.watchlist_id,)),
+    ]
+    
+def reload_urls():
+    '''rebuild the URLconf, which picks the sync or async views when it is imported'''
+    importlib.reload(watchlist_urls)
+    importlib.reload(root_urls)
+    clear_url_caches()
+    
+def add_latency(seconds):
+    '''sleep before every query on every connection, as a thread waiting on a database server would'''
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+    
+    def install(connection, **kwargs):
+        connection.execute_wrappers.insert(0, wrapper)
+    
+    connection_created.connect(install, weak=False)
+    for alias in connections:
+        if connections[alias].connection is not None:
+            install(connections[alias])
+    
+def environ(url, token):
+    path, _, query = url.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'HTTP_AUTHORIZATION': f'Token {token}',
+    }
+    
+def scope(url, token):
+    path, _, query = url.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    
+def wsgi_get(handler, url, token):
+    statuses = []
+    body = handler(environ(url, token), lambda status, headers: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+    
+async def asgi_get(handler, url, token):
+    messages = []
+    
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    
+    async def send(message):
+        messages.append(message)
+    
+    await handler(scope(url, token), receive, send)
+    return messages[0]['status']
+    
+def summary(latencies, statuses, elapsed):
+    if set(statuses) != {200}:
+        raise RuntimeError(f'unexpected responses: {sorted(set(statuses))}')
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return len(latencies) / elapsed, percentiles[49], percentiles[98]
+    
+def run_wsgi(urls, token, concurrency, requests):
+    handler = WSGIHandler()
+    latencies, statuses = [], []
+    
+    def worker(urls):
+        for url in urls:
+            start = time.perf_counter()
+            statuses.append(wsgi_get(handler, url, token))
+            latencies.append((time.perf_counter() - start) * 1000)
+        # every thread opened its own connection
+        connections.close_all()
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker, share) for share in shares(urls, concurrency, requests)]:
+            future.result()
+    return summary(latencies, statuses, time.perf_counter() - start)
+    
+def run_asgi(urls, token, concurrency, requests):
+    handler = ASGIHandler()
+    latencies, statuses = [], []
+    
+    async def worker(urls):
+        for url in urls:
+            start = time.perf_counter()
+            statuses.append(await asgi_get(handler, url, token))
+            latencies.append((time.perf_counter() - start) * 1000)
+    
+    async def main():
+        await asyncio.gather(*(worker(share) for share in shares(urls, concurrency, requests)))
+    
+    start = time.perf_counter()
+    asyncio.run(main())
+    return summary(latencies, statuses, time.perf_counter() - start)
+    
+def shares(urls, concurrency, requests):
+    '''the requests each of concurrency clients sends, taking turns through urls'''
+    per_client = max(1, requests // concurrency)
+    return [list(islice(cycle(urls), offset, offset + per_client)) for offset in range(concurrency)]
+    
+def main():
+    parser = argparse.ArgumentParser(description='compare the read endpoints under WSGI and ASGI')
+    parser.add_argument('--platforms', type=int, default=20)
+    parser.add_argument('--watchlists', type=int, default=1000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', default='1,8,32', help='comma separated numbers of concurrent clients')
+    parser.add_argument('--requests', type=int, default=400, help='requests per run')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='milliseconds added to every query')
+    parser.add_argument('--cached', action='store_true', help='keep the response cache on')
+    args = parser.parse_args()
+    if args.reviews < 1:
+        parser.error('--reviews must be at least 1, the review list needs a reviewed watchlist')
+    
+    user = data.generate(args.platforms, args.watchlists, args.reviews, seed=args.seed)
+    urls, token = read_urls(), user.auth_token.key
+    levels = [int(level) for level in args.concurrency.split(',')]
+    
+    rates = throttling.CounterRateThrottle.THROTTLE_RATES
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.dict(rates, dict.fromkeys(rates)))
+        if not args.cached:
+            stack.enter_context(override_settings(
+                CACHES={
+                    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                    'uncached': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                },
+                RESPONSE_CACHE_ALIAS='uncached',
+            ))
+        if args.db_latency:
+            add_latency(args.db_latency / 1000)
+    
+        rows = []
+        for name, run, async_views in [('WSGI threads', run_wsgi, False), ('ASGI sync views', run_asgi, False),
+                                       ('ASGI async views', run_asgi, True)]:
+            with override_settings(ASYNC_READ_VIEWS=async_views):
+                reload_urls()
+                # a first pass builds the middleware chain and warms the per-serializer caches
+                run(urls, token, 1, len(urls))
+                for level in levels:
+                    rps, p50, p99 = run(urls, token, level, args.requests)
+                    rows.append((name, level, f'{rps:,.0f}', f'{p50:.2f}', f'{p99:.2f}'))
+        reload_urls()
+    
+    print(f'{connection.vendor}, {args.db_latency:g} ms per query, response cache {"on" if args.cached else "off"}')
+    print_table(('server', 'concurrency', 'requests/s', 'p50 ms', 'p99 ms'), rows)
+    
+    
+if __name__ == '__main__':
+    main()
+    
\ No newline at end of file
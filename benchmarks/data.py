@@ -0,0 +1,68 @@
+"""
+Synthetic catalog for the benchmarks: platforms, watchlists, users with tokens and reviews, the same
+rows for the same seed, written with bulk inserts and indexed for search.
+"""
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+from watchlist_app import search
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+PASSWORD = 'Password@123'
+WORDS = ('night', 'river', 'empire', 'ghost', 'summer', 'city', 'last', 'secret', 'war', 'love', 'storm',
+         'kingdom', 'road', 'dark', 'island', 'heart', 'game', 'star', 'dream', 'house', 'silent', 'blood')
+BATCH_SIZE = 2000
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+    
+def generate(platforms, watchlists, reviews, seed=0):
+    '''
+    seed the database and return a staff user who has written no review. every user shares PASSWORD,
+    and each reviewer reviews a watchlist at most once, so there are as many as it takes to write reviews
+    '''
+    if reviews and not watchlists:
+        raise ValueError('reviews need watchlists')
+    rng = random.Random(seed)
+    
+    platform_objs = StreamPlatform.objects.bulk_create([
+        StreamPlatform(name=f'Platform {i}', about=sentence(rng, 8), website=f'https://platform{i}.example.com')
+        for i in range(max(platforms, 1))
+    ], batch_size=BATCH_SIZE)
+    watchlist_objs = WatchList.objects.bulk_create([
+        WatchList(
+            title=f'{sentence(rng, rng.randint(1, 4)).title()} {i}', storyline=sentence(rng, 20),
+            platform=rng.choice(platform_objs), active=rng.random() > 0.1,
+            imdb_rating=round(rng.uniform(1, 10), 1) if rng.random() > 0.2 else None, imdb_votes=rng.randint(0, 100_000),
+        )
+        for i in range(watchlists)
+    ], batch_size=BATCH_SIZE)
+    
+    # hashing is the slow part of creating users, they all get the same one
+    password = make_password(PASSWORD)
+    reviewer_count = math.ceil(reviews / max(watchlists, 1))
+    staff, *reviewers = User.objects.bulk_create(
+        [User(username='staff', password=password, is_staff=True)] +
+        [User(username=f'user{i}', password=password) for i in range(reviewer_count)],
+        batch_size=BATCH_SIZE,
+    )
+    Token.objects.bulk_create([Token(key='%040x' % rng.getrandbits(160), user=user) for user in [staff, *reviewers]], batch_size=BATCH_SIZE)
+    
+    # reviewer n reviews the watchlists after a random offset, which keeps every (user, watchlist) pair unique
+    offsets = [rng.randrange(watchlists) for _ in reviewers]
+    Review.objects.bulk_create([
+        Review(
+            review_user=reviewers[i // watchlists], watchlist=watchlist_objs[(offsets[i // watchlists] + i) % watchlists],
+            rating=rng.randint(1, 5), description=sentence(rng, 10) if rng.random() > 0.3 else None, active=rng.random() > 0.1,
+        )
+        for i in range(reviews)
+    ], batch_size=BATCH_SIZE)
+    
+    search.rebuild()
+    return staff
+    
\ No newline at end of file
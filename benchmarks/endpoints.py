@@ -0,0 +1,167 @@
+"""
+Latency percentiles, queries and peak allocated memory per request for every route of
+watchlist_app.api.urls and user_app.api.urls, driven through the Django test client against data
+from benchmarks.data. Writes run inside a transaction that is rolled back, so every request sees the
+same rows. Throttling is off, and the response cache is cleared before each request with --cold.
+Results are written as JSON for diffing two runs, and compared with --baseline.
+
+    python -m benchmarks.endpoints --watchlists 10000 --reviews 50000 --output after.json --baseline before.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from unittest import mock
+
+from benchmarks import print_table, setup
+
+setup()
+
+import django
+from django.core.cache import cache
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from benchmarks import data
+from user_app.api import urls as user_urls
+from watchlist_app.api import throttling, urls as watchlist_urls
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+
+def routes(user):
+    '''{route name: (method, url, body)}, one representative request for every route'''
+    watchlist = WatchList.objects.order_by('id').first()
+    platform = StreamPlatform.objects.order_by('id').first()
+    review = Review.objects.select_related('review_user').order_by('id').first()
+    reviewer = review.review_user.username if review else user.username
+    return {
+        'movie-list': ('get', reverse('movie-list'), None),
+        'movie-details': ('get', reverse('movie-details', args=(watchlist.id,)), None),
+        'movie-also-liked': ('get', reverse('movie-also-liked', args=(watchlist.id,)), None),
+        'movie-stats': ('get', reverse('movie-stats', args=(watchlist.id,)), None),
+        'movie-stats-batch': ('get', reverse('movie-stats-batch') + '?ids=' + ','.join(str(watchlist.id + i) for i in range(20)), None),
+        'movie-bulk': ('post', reverse('movie-bulk'), [{'title': f'Bulk {i}', 'storyline': 'story', 'platform': platform.id} for i in range(20)]),
+        'movie-search': ('get', reverse('movie-search') + '?q=night river', None),
+        'movie-export': ('get', reverse('movie-export'), None),
+        'movie-top-rated': ('get', reverse('movie-top-rated'), None),
+        'movie-trending': ('get', reverse('movie-trending'), None),
+        'stream-list': ('get', reverse('stream-list'), None),
+        'stream-details': ('get', reverse('stream-details', args=(platform.id,)), None),
+        'stream-bulk': ('post', reverse('stream-bulk'), [{'name': f'Bulk {i}', 'about': 'about', 'website': 'https://example.com'} for i in range(20)]),
+        'stream-export': ('get', reverse('stream-export'), None),
+        'stream-top-rated': ('get', reverse('stream-top-rated', args=(platform.id,)), None),
+        'stream-trending': ('get', reverse('stream-trending', args=(platform.id,)), None),
+        'review-create': ('post', reverse('review-create', args=(watchlist.id,)), {'rating': 4, 'description': 'Good', 'active': True}),
+        'reviews-list': ('get', reverse('reviews-list', args=(watchlist.id,)), None),
+        'reviews-detail': ('get', reverse('reviews-detail', args=(review.id if review else 0,)), None),
+        'reviews-export': ('get', reverse('reviews-export'), None),
+        'user-reviews': ('get', reverse('user-reviews') + f'?username={reviewer}', None),
+        'register': ('post', reverse('register'), {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'secret', 'password2': 'secret'}),
+        'login': ('post', reverse('login'), {'username': user.username, 'password': data.PASSWORD}),
+        'logout': ('post', reverse('logout'), None),
+    }
+    
+def send(client, method, url, body, cold):
+    '''one request whose writes are rolled back, with a streamed body read to the end'''
+    if cold:
+        cache.clear()
+    with transaction.atomic():
+        response = getattr(client, method)(url, body, format='json') if body is not None else getattr(client, method)(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        transaction.set_rollback(True)
+    return response
+    
+def measure(client, request, repeat, cold):
+    send(client, *request, cold)
+    # the query log is a bounded deque, once full its length no longer tells how many queries ran
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        response = send(client, *request, cold)
+    
+    tracemalloc.start()
+    try:
+        send(client, *request, cold)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        send(client, *request, cold)
+        timings.append((time.perf_counter() - start) * 1000)
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'method': request[0].upper(),
+        'status': response.status_code,
+        'queries': len(queries),
+        'p50_ms': round(percentiles[49], 3),
+        'p90_ms': round(percentiles[89], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+    
+def main():
+    parser = argparse.ArgumentParser(description='benchmark every API route')
+    parser.add_argument('--platforms', type=int, default=50)
+    parser.add_argument('--watchlists', type=int, default=2000)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--cold', action='store_true', help='clear the response cache before every request')
+    parser.add_argument('--routes', help='comma separated route names, all by default')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help='a previous --output to compare the median latency with')
+    args = parser.parse_args()
+    if args.watchlists < 1:
+        parser.error('--watchlists must be at least 1, several routes need a watchlist')
+    
+    user = data.generate(args.platforms, args.watchlists, args.reviews, seed=args.seed)
+    requests = routes(user)
+    names = [pattern.name for pattern in [*watchlist_urls.urlpatterns, *user_urls.urlpatterns]]
+    missing = set(names) - set(requests)
+    if missing:
+        parser.error(f'no benchmark request for {", ".join(sorted(missing))}')
+    if args.routes:
+        names = [name for name in names if name in args.routes.split(',')]
+    
+    # authenticated through the token header, so every request pays for authentication as in production
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + user.auth_token.key)
+    rates = throttling.CounterRateThrottle.THROTTLE_RATES
+    with mock.patch.dict(rates, dict.fromkeys(rates)):
+        results = {name: measure(client, requests[name], args.repeat, args.cold) for name in names}
+    
+    report = {
+        'environment': {
+            'python': platform.python_version(), 'django': django.get_version(), 'database': connection.vendor,
+        },
+        'parameters': {key: getattr(args, key) for key in ('platforms', 'watchlists', 'reviews', 'seed', 'repeat', 'cold')},
+        'routes': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write('\n')
+    
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['routes']
+    rows = []
+    for name, result in results.items():
+        before = baseline.get(name, {}).get('p50_ms')
+        change = f'{result["p50_ms"] / before - 1:+.0%}' if before else ''
+        rows.append((name, result['method'], result['status'], result['queries'], result['p50_ms'], result['p90_ms'],
+                     result['p99_ms'], result['peak_kib'], change))
+    print_table(('route', 'method', 'status', 'queries', 'p50 ms', 'p90 ms', 'p99 ms', 'peak KiB', 'p50 vs baseline'), rows)
+    
+    
+if __name__ == '__main__':
+    main()
+    
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Overhead of watchmate.instrumentation.TimingMiddleware: around a view that does nothing, and on
+whole requests to API routes through the test client, with and without it in MIDDLEWARE.
+
+    python -m benchmarks.instrumentation
+"""
+from benchmarks import print_table, setup, timed
+
+setup()
+
+from unittest import mock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from watchlist_app.api import throttling
+from watchlist_app.models import StreamPlatform, WatchList
+from watchmate.instrumentation import TimingMiddleware
+
+REPEAT = 300
+MIDDLEWARE = 'watchmate.instrumentation.TimingMiddleware'
+
+
+def best_of(*fns, runs=5):
+    '''microseconds per call of each of fns, the best of runs taking turns so drift hits them alike'''
+    best = [float('inf')] * len(fns)
+    for _ in range(runs):
+        for index, fn in enumerate(fns):
+            best[index] = min(best[index], timed(fn, REPEAT) * 1e6)
+    return best
+    
+def client(middleware):
+    with override_settings(MIDDLEWARE=middleware):
+        client = Client()
+        # the middleware chain is built on the first request, under the overridden setting
+        client.get(reverse('movie-list'))
+    return client
+    
+    
+if __name__ == '__main__':
+    request = APIRequestFactory().get('/')
+    bare = lambda request: HttpResponse()
+    timed_bare = TimingMiddleware(bare)
+    rows = [('empty view', *best_of(lambda: bare(request), lambda: timed_bare(request)))]
+    
+    stream = StreamPlatform.objects.create(name='Netflix', about='about', website='https://netflix.com')
+    for i in range(20):
+        WatchList.objects.create(title=f'Movie {i}', storyline='story', platform=stream)
+    others = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+    rates = throttling.CounterRateThrottle.THROTTLE_RATES
+    with mock.patch.dict(rates, dict.fromkeys(rates)):
+        without, with_timing = client(others), client([MIDDLEWARE, *others])
+        for name, args, query in [('movie-list', (), ''), ('stream-details', (stream.id,), ''), ('movie-search', (), '?q=movie')]:
+            url = reverse(name, args=args) + query
+            rows.append((name, *best_of(lambda: without.get(url), lambda: with_timing.get(url))))
+    
+    rows = [(name, f'{off:.1f}', f'{on:.1f}', f'{on - off:+.1f}', f'{on / off - 1:+.1%}') for name, off, on in rows]
+    print_table(('request', 'us without', 'us with', 'overhead us', 'overhead'), rows)
+    
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Page latency against depth on a large review table: DRF's LimitOffsetPagination, which counts the table and
+skips the rows before the page, against the seek paginators of watchlist_app.api.pagination leaving out
+the count, skipping by OFFSET, seeking from the key read at the offset and following a next link.
+
+    python -m benchmarks.pagination --reviews 1000000
+"""
+import argparse
+import time
+
+from benchmarks import print_table, setup, timed
+
+setup()
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from watchlist_app.api import pagination
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+BATCH_SIZE = 100_000
+LIMIT = 10
+
+
+class CountedPagination(LimitOffsetPagination):
+    default_limit = LIMIT
+    
+    
+def populate(reviews, viewers):
+    '''reviews reviews, each of viewers viewers reviewing as many titles'''
+    titles = -(-reviews // viewers)
+    platform = StreamPlatform.objects.create(name='Platform', about='About', website='https://platform.example.com')
+    watchlist_ids = [watchlist.id for watchlist in WatchList.objects.bulk_create(
+        [WatchList(title=f'Title {i}', storyline='Storyline', platform=platform) for i in range(titles)], batch_size=5000)]
+    viewer_ids = [user.id for user in User.objects.bulk_create([User(username=f'viewer{i}') for i in range(viewers)], batch_size=5000)]
+    for start in range(0, reviews, BATCH_SIZE):
+        Review.objects.bulk_create([
+            Review(review_user_id=viewer_ids[i // titles], watchlist_id=watchlist_ids[i % titles], rating=i % 5 + 1)
+            for i in range(start, min(start + BATCH_SIZE, reviews))
+        ], batch_size=5000)
+    
+def page(paginator, url):
+    queryset = Review.objects.order_by(*pagination.SeekLimitOffsetPagination.ordering)
+    rows = paginator.paginate_queryset(queryset, Request(APIRequestFactory().get(url)))
+    return paginator.get_paginated_response([row.id for row in rows]).data
+    
+def main():
+    parser = argparse.ArgumentParser(description='benchmark page latency against depth')
+    parser.add_argument('--reviews', type=int, default=1_000_000)
+    parser.add_argument('--viewers', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5, help='requests timed at every depth')
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    populate(args.reviews, args.viewers)
+    print(f'seeded {args.reviews:,} reviews in {time.perf_counter() - start:.1f}s')
+    
+    depths = sorted({depth for depth in (0, 1000, 10_000, 100_000, args.reviews // 2, args.reviews - 10 * LIMIT) if 0 <= depth < args.reviews})
+    ordered = Review.objects.order_by(*pagination.SeekLimitOffsetPagination.ordering)
+    rows = []
+    for depth in depths:
+        url = f'/reviews/?limit={LIMIT}&offset={depth}'
+        expected = list(ordered.values_list('id', flat=True)[depth:depth + LIMIT])
+        # the link a client reading from the first page would follow to this one
+        before = ordered[depth - 1] if depth else None
+        link = url if before is None else f'{url}&after={pagination.SeekLimitOffsetPagination().encode_key([before.created, before.id])}'
+    
+        timings = [timed(lambda: page(CountedPagination(), url), args.repeat)]
+        with override_settings(PAGINATION={**pagination.settings.PAGINATION, 'SEEK_OFFSET': args.reviews + 1}):
+            assert page(pagination.SeekLimitOffsetPagination(), url)['results'] == expected
+            timings.append(timed(lambda: page(pagination.SeekLimitOffsetPagination(), url), args.repeat))
+        with override_settings(PAGINATION={**pagination.settings.PAGINATION, 'SEEK_OFFSET': 0}):
+            assert page(pagination.SeekLimitOffsetPagination(), url)['results'] == expected
+            timings.append(timed(lambda: page(pagination.SeekLimitOffsetPagination(), url), args.repeat))
+            assert page(pagination.SeekLimitOffsetPagination(), link)['results'] == expected
+            timings.append(timed(lambda: page(pagination.SeekLimitOffsetPagination(), link), args.repeat))
+        rows.append((f'{depth:,}', *(f'{seconds * 1000:.2f} ms' for seconds in timings)))
+    print_table(('offset', 'offset + COUNT(*)', 'offset, no count', 'seek from offset', 'next link'), rows)
+    print()
+    
+    reviews = Review.objects.filter(active=True)
+    counts = [('COUNT(*)', f'{timed(reviews.count, args.repeat) * 1000:.2f} ms')]
+    start = time.perf_counter()
+    pagination.estimated_count(reviews)
+    counts.append(('estimated, first request', f'{(time.perf_counter() - start) * 1000:.2f} ms'))
+    counts.append(('estimated, cached', f'{timed(lambda: pagination.estimated_count(reviews), args.repeat) * 1000:.3f} ms'))
+    print_table(('count', 'time'), counts)
+    
+    
+if __name__ == '__main__':
+    main()
+    
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+The "also liked" neighbours of watchlist_app.recommendations on a synthetic catalog whose viewers pick
+titles by a long tailed popularity: a full build, an incremental refresh after a batch of new reviews,
+mapping the file as a freshly started worker does, and lookups.
+
+    python -m benchmarks.recommendations --reviews 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import print_table, setup, timed
+
+setup()
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from watchlist_app import recommendations
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+BATCH_SIZE = 100_000
+
+
+def populate(watchlists, reviews, per_viewer, seed):
+    '''watchlists titles and reviews reviews, per_viewer from each viewer, popular titles reviewed most'''
+    rng = np.random.default_rng(seed)
+    platform = StreamPlatform.objects.create(name='Platform', about='About', website='https://platform.example.com')
+    watchlist_ids = np.array([watchlist.id for watchlist in WatchList.objects.bulk_create(
+        [WatchList(title=f'Title {i}', storyline='Storyline', platform=platform) for i in range(watchlists)], batch_size=5000)])
+    viewer_ids = np.array([user.id for user in User.objects.bulk_create(
+        [User(username=f'viewer{i}') for i in range(-(-reviews // per_viewer))], batch_size=5000)])
+    
+    # per_viewer distinct titles for every viewer at once: the top keys of log popularity plus Gumbel noise
+    log_popularity = -0.8 * np.log(np.arange(1, watchlists + 1))
+    picks = []
+    for start in range(0, len(viewer_ids), 1000):
+        keys = log_popularity + rng.gumbel(size=(min(1000, len(viewer_ids) - start), watchlists))
+        # copied, a view of the columns would keep the whole partitioned block alive
+        picks.append(np.argpartition(-keys, per_viewer - 1, axis=1)[:, :per_viewer].copy())
+    picks = np.concatenate(picks).ravel()[:reviews]
+    viewers = np.repeat(viewer_ids, per_viewer)[:reviews]
+    ratings = rng.integers(1, 6, size=reviews)
+    
+    for start in range(0, reviews, BATCH_SIZE):
+        stop = start + BATCH_SIZE
+        Review.objects.bulk_create([
+            Review(review_user_id=viewer, watchlist_id=watchlist, rating=rating)
+            for viewer, watchlist, rating in zip(viewers[start:stop].tolist(), watchlist_ids[picks[start:stop]].tolist(), ratings[start:stop].tolist())
+        ], batch_size=5000)
+    return watchlist_ids, viewer_ids
+    
+def add_reviews(count, watchlist_ids, viewer_ids, seed):
+    '''count new reviews by existing viewers, skipping the titles they reviewed already'''
+    rng = np.random.default_rng(seed + 1)
+    reviewed = set(Review.objects.filter(review_user__in=viewer_ids[:count].tolist()).values_list('review_user_id', 'watchlist_id'))
+    pairs = {(viewer, watchlist) for viewer, watchlist in zip(viewer_ids[:count].tolist(), rng.choice(watchlist_ids, count).tolist())}
+    Review.objects.bulk_create([Review(review_user_id=viewer, watchlist_id=watchlist, rating=5) for viewer, watchlist in pairs - reviewed])
+    return len(pairs - reviewed)
+    
+def main():
+    parser = argparse.ArgumentParser(description='benchmark building and serving the "also liked" neighbours')
+    parser.add_argument('--watchlists', type=int, default=20_000)
+    parser.add_argument('--reviews', type=int, default=1_000_000)
+    parser.add_argument('--per-viewer', type=int, default=25, help='reviews written by every viewer')
+    parser.add_argument('--new-reviews', type=int, default=100, help='reviews written before the incremental refresh')
+    parser.add_argument('--lookups', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if not 0 < args.per_viewer <= args.watchlists:
+        parser.error('--per-viewer must be between 1 and --watchlists')
+    
+    start = time.perf_counter()
+    watchlist_ids, viewer_ids = populate(args.watchlists, args.reviews, args.per_viewer, args.seed)
+    print(f'seeded {args.watchlists:,} watchlists and {args.reviews:,} reviews in {time.perf_counter() - start:.1f}s')
+    
+    with tempfile.TemporaryDirectory() as directory, override_settings(RECOMMENDATIONS={
+            **recommendations.settings.RECOMMENDATIONS, 'PATH': os.path.join(directory, 'neighbours.npy')}):
+        path = recommendations.settings.RECOMMENDATIONS['PATH']
+        rows = []
+    
+        start = time.perf_counter()
+        built = recommendations.build()
+        rows.append(('full build', f'{time.perf_counter() - start:.2f} s', f'{built:,} watchlists, {os.path.getsize(path) / 2**20:.1f} MiB'))
+    
+        added = add_reviews(args.new_reviews, watchlist_ids, viewer_ids, args.seed)
+        start = time.perf_counter()
+        refreshed = recommendations.refresh()
+        rows.append(('incremental refresh', f'{time.perf_counter() - start:.2f} s', f'{refreshed:,} watchlists after {added:,} new reviews'))
+    
+        start = time.perf_counter()
+        recommendations.Neighbours().rows()
+        rows.append(('map in a new worker', f'{(time.perf_counter() - start) * 1000:.3f} ms', 'np.load(mmap_mode="r")'))
+        start = time.perf_counter()
+        np.load(path)
+        rows.append(('read in a new worker', f'{(time.perf_counter() - start) * 1000:.3f} ms', 'np.load()'))
+    
+        wanted = iter(np.random.default_rng(args.seed).choice(watchlist_ids, args.lookups).tolist())
+        seconds = timed(lambda: recommendations.also_liked(next(wanted)), args.lookups)
+        rows.append(('lookup', f'{seconds * 1e6:.1f} us', f'mean of {args.lookups:,}'))
+    
+    print_table(('step', 'time', 'detail'), rows)
+    
+    
+if __name__ == '__main__':
+    main()
+    
\ No newline at end of file
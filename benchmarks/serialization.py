@@ -0,0 +1,56 @@
+"""
+Rows per second rendered by the list endpoints' serializers, stock (instances through the narrowed
+queryset and DRF's fields) against the compiled extractors of watchlist_app.api.fastpath reading
+values() rows. Both sides include fetching the rows.
+
+    python -m benchmarks.serialization
+"""
+from benchmarks import print_table, setup, timed
+
+setup()
+
+from django.contrib.auth.models import User
+
+from watchlist_app.api import fastpath, fieldsets, serializers
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+SIZES = (10_000, 100_000)
+REPEAT = 3
+
+
+def populate(size):
+    platforms = StreamPlatform.objects.bulk_create(
+        [StreamPlatform(name=f'Platform {i}', about='About', website=f'https://platform{i}.com') for i in range(size)])
+    watchlists = WatchList.objects.bulk_create(
+        [WatchList(title=f'Title {i}', storyline='Storyline', platform=platforms[i % 100], imdb_rating=7.5 if i % 2 else None)
+         for i in range(size)])
+    users = User.objects.bulk_create([User(username=f'user{i}') for i in range(1000)])
+    Review.objects.bulk_create(
+        [Review(review_user=users[i % 1000], watchlist=watchlists[i // 1000], rating=i % 5 + 1, description=None if i % 3 else 'Good')
+         for i in range(size)], batch_size=5000)
+    
+    
+def rows_per_second(serializer_class, queryset, size):
+    queryset = queryset.order_by('id')[:size]
+    extractor = fastpath.get_extractor(serializer_class, {})
+    stock = fieldsets.narrow(queryset.model.objects.order_by('id'), serializer_class())[:size]
+    
+    stock_seconds = timed(lambda: serializer_class(stock, many=True).data, REPEAT)
+    fast_seconds = timed(lambda: extractor(queryset.values(*extractor.columns)), REPEAT)
+    return size / stock_seconds, size / fast_seconds
+    
+    
+if __name__ == '__main__':
+    populate(max(SIZES))
+    
+    rows = []
+    for serializer_class, queryset in [
+        (serializers.WatchListSerializer, WatchList.objects.all()),
+        (serializers.ReviewSerializer, Review.objects.all()),
+        (serializers.StreamPlatformSerializers, StreamPlatform.objects.all()),
+    ]:
+        for size in SIZES:
+            stock, fast = rows_per_second(serializer_class, queryset, size)
+            rows.append((serializer_class.__name__, f'{size:,}', f'{stock:,.0f}', f'{fast:,.0f}', f'{fast / stock:.1f}x'))
+    print_table(('serializer', 'rows', 'stock rows/s', 'fast rows/s', 'speedup'), rows)
+    
\ No newline at end of file
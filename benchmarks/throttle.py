@@ -0,0 +1,59 @@
+"""
+Time per request and cache footprint per client for DRF's UserRateThrottle, which stores
+every request timestamp, against the fixed and sliding window counters in
+watchlist_app.api.throttling.
+
+    python -m benchmarks.throttle
+"""
+from benchmarks import print_table, setup, timed
+
+setup()
+
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import UserRateThrottle
+
+from watchlist_app.api.throttling import UserCounterThrottle
+
+REPEAT = 5000
+RATES = ('100/min', '10000/min', '1000000/day')
+
+
+class FakeUser:
+    pk = 1
+    is_authenticated = True
+
+
+def fixed_window():
+    throttle = UserCounterThrottle()
+    throttle.sliding = False
+    return throttle
+
+
+def footprint():
+    # locmem keeps values pickled, as a network cache would
+    return sum(len(value) for value in cache._cache.values())
+
+
+def measure(make_throttle, rate, request):
+    cache.clear()
+    throttle = make_throttle()
+    throttle.rate = rate
+    throttle.num_requests, throttle.duration = throttle.parse_rate(rate)
+    micros = timed(lambda: throttle.allow_request(request, None), REPEAT) * 1e6
+    return f'{micros:.1f}', footprint()
+
+
+if __name__ == '__main__':
+    request = APIRequestFactory().get('/')
+    request.user = FakeUser()
+
+    rows = []
+    for rate in RATES:
+        for name, make_throttle in [
+            ('UserRateThrottle', UserRateThrottle),
+            ('UserCounterThrottle, fixed', fixed_window),
+            ('UserCounterThrottle, sliding', UserCounterThrottle),
+        ]:
+            rows.append((rate, name, *measure(make_throttle, rate, request)))
+    print_table(('rate', 'throttle', 'us/request', f'cache bytes after {REPEAT} requests'), rows)
@@ -0,0 +1,46 @@
+"""
+Queries and time per authenticated request for DRF's TokenAuthentication against
+CachedTokenAuthentication, cold and warm.
+
+    python -m benchmarks.token_auth
+"""
+from benchmarks import print_table, setup, timed
+
+setup()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from user_app.api.authentication import CachedTokenAuthentication, token_cache
+
+REPEAT = 2000
+
+
+def measure(authentication, request, before):
+    def call():
+        before()
+        authentication.authenticate(request)
+
+    with CaptureQueriesContext(connection) as queries:
+        call()
+    return len(queries), timed(call, REPEAT) * 1e6
+
+
+if __name__ == '__main__':
+    user = User.objects.create(username='benchmark')
+    token = Token.objects.get(user=user)
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + token.key)
+
+    rows = []
+    for name, authentication, before in [
+        ('TokenAuthentication', TokenAuthentication(), lambda: None),
+        ('CachedTokenAuthentication, cold', CachedTokenAuthentication(), token_cache.clear),
+        ('CachedTokenAuthentication, warm', CachedTokenAuthentication(), lambda: None),
+    ]:
+        queries, micros = measure(authentication, request, before)
+        rows.append((name, queries, f'{micros:.1f}'))
+    print_table(('authentication', 'queries/request', 'us/request'), rows)
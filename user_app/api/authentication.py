@@ -0,0 +1,111 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    '''bounded LRU of token key -> user whose entries expire after ttl seconds'''
+    
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return user
+    
+    def set(self, key, user):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+    
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+    
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user.get(entry[0].pk)
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0].pk]
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    
+token_cache = TokenCache(settings.TOKEN_AUTH_CACHE['MAX_SIZE'], settings.TOKEN_AUTH_CACHE['TTL'])
+
+def shared_cache():
+    alias = settings.TOKEN_AUTH_CACHE['SHARED_CACHE_ALIAS']
+    return caches[alias] if alias else None
+    
+def shared_key(key):
+    return f'auth-token:{key}'
+    
+def forget_token(key):
+    token_cache.discard(key)
+    if shared_cache() is not None:
+        shared_cache().delete(shared_key(key))
+    
+def forget_user(user):
+    token_cache.discard_user(user.pk)
+    if shared_cache() is not None:
+        shared_cache().delete_many([shared_key(key) for key in Token.objects.filter(user=user).values_list('key', flat=True)])
+    
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication that remembers token -> user in process memory and, optionally, in a
+    shared Django cache, so a warm request authenticates without touching the database.
+    entries are purged by the receivers in user_app.signals when a token is deleted or its user saved;
+    other processes drop theirs when the TTL runs out
+    '''
+    
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None and shared_cache() is not None:
+            user = shared_cache().get(shared_key(key))
+            if user is not None:
+                token_cache.set(key, user)
+    
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            if shared_cache() is not None:
+                shared_cache().set(shared_key(key), user, settings.TOKEN_AUTH_CACHE['SHARED_TTL'])
+    
+        # every request gets its own copy, views are free to mutate request.user
+        user = copy.copy(user)
+        return (user, Token(key=key, user=user))
+    
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.authtoken.models import Token
+
+from user_app import provisioning
+
+
+class Command(BaseCommand):
+    help = 'Create users and their API tokens in bulk from a CSV or JSON Lines file of accounts'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('accounts', help='CSV with a header row, or JSON Lines, of username, email, password, first_name and last_name')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='taken from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='accounts checked and inserted per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes hashing passwords, every core by default')
+    
+    def handle(self, *args, **options):
+        path, chunk_size, workers = options['accounts'], options['chunk_size'], options['workers']
+        if chunk_size < 1 or workers < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.verbosity = options['verbosity']
+        # usernames and emails taken earlier in the file, the database only knows of the chunks inserted
+        self.usernames, self.emails = set(), set()
+        self.skipped = 0
+    
+        created = 0
+        start = reported = time.monotonic()
+        try:
+            accounts = provisioning.read_accounts(path, file_format)
+            chunks = iter(lambda: list(islice(accounts, chunk_size)), [])
+            for users in self.hashed(map(self.accepted, chunks), workers):
+                try:
+                    self.insert(users)
+                except IntegrityError as exc:
+                    raise CommandError(f'{exc}, the chunk was rolled back; run the command again to skip the accounts created so far')
+                created += len(users)
+    
+                now = time.monotonic()
+                if self.verbosity > 1 or (self.verbosity and now - reported >= 10):
+                    reported = now
+                    self.stdout.write(f'{created:,} users created, {self.skipped:,} skipped, {created / (now - start):,.0f} users/s')
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+    
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created:,} users, skipped {self.skipped:,}, in {elapsed:.1f}s ({created / max(elapsed, 1e-9):,.0f} users/s)'))
+    
+    def accepted(self, chunk):
+        '''[(User fields, password)] of the valid accounts in chunk whose username and email are free'''
+        accounts = []
+        for number, account in chunk:
+            try:
+                accounts.append((number, *provisioning.clean(account)))
+            except ValidationError as exc:
+                self.skip(number, account.get('username'), '; '.join(exc.messages))
+    
+        # one query for the whole chunk instead of an exists() per account
+        usernames = {fields['username'] for _, fields, _ in accounts}
+        emails = {fields['email'] for _, fields, _ in accounts if fields['email']}
+        taken = User.objects.filter(Q(username__in=usernames) | Q(email__in=emails)).values_list('username', 'email')
+        taken_usernames, taken_emails = set(), set()
+        for username, email in taken:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+    
+        free = []
+        for number, fields, password in accounts:
+            username, email = fields['username'], fields['email']
+            if username in taken_usernames or username in self.usernames:
+                self.skip(number, username, 'username already exists')
+            elif email and (email in taken_emails or email in self.emails):
+                self.skip(number, username, 'email already exists')
+            else:
+                self.usernames.add(username)
+                if email:
+                    self.emails.add(email)
+                free.append((fields, password))
+        return free
+    
+    def skip(self, number, username, reason):
+        self.skipped += 1
+        if self.verbosity > 1:
+            self.stderr.write(f'line {number} ({username}): {reason}')
+    
+    def hashed(self, chunks, workers):
+        '''unsaved Users with hashed passwords, a list per chunk in file order, at most two chunks in flight'''
+        if workers == 1:
+            for accounts in chunks:
+                yield self.users(accounts, provisioning.hash_passwords([password for _, password in accounts]))
+            return
+    
+        with ProcessPoolExecutor(workers, initializer=provisioning.setup_worker) as executor:
+            pending = deque()
+            for accounts in chunks:
+                # every chunk is spread over all the workers
+                passwords = [password for _, password in accounts]
+                size = -(-len(passwords) // workers) or 1
+                futures = [executor.submit(provisioning.hash_passwords, passwords[i:i + size]) for i in range(0, len(passwords), size)]
+                pending.append((accounts, futures))
+                if len(pending) >= 2:
+                    yield self.collect(*pending.popleft())
+            while pending:
+                yield self.collect(*pending.popleft())
+    
+    def collect(self, accounts, futures):
+        return self.users(accounts, [password for future in futures for password in future.result()])
+    
+    def users(self, accounts, passwords):
+        return [User(password=password, **fields) for (fields, _), password in zip(accounts, passwords)]
+    
+    def insert(self, users):
+        # bulk_create sends no post_save, so create_auth_token stays out of it and the tokens go in bulk too
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            if any(user.pk is None for user in users):
+                # backends that return no ids from a bulk insert, MySQL
+                ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+            Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+    
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""
+Readers and password hashing for provision_users. Hashing is slow on purpose, PBKDF2 runs hundreds of
+thousands of rounds per password, so hash_passwords runs in worker processes while the reading, the
+duplicate checks and the inserts stay in bulk in the command.
+"""
+import csv
+import json
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def read_accounts(path, file_format):
+    '''(line number, account) for every account of a CSV file with a header row or of a JSON Lines file'''
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'jsonl':
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    account = json.loads(line)
+                except ValueError as exc:
+                    raise ValueError(f'line {number}: {exc}')
+                if not isinstance(account, dict):
+                    raise ValueError(f'line {number}: expected a JSON object')
+                yield number, account
+        else:
+            reader = csv.DictReader(file)
+            if 'username' not in (reader.fieldnames or ()):
+                raise ValueError(f'{path} has no username column')
+            for account in reader:
+                yield reader.line_num, account
+    
+def clean(account):
+    '''
+    ({User field: value}, password) of an account, validated as the model fields validate them.
+    raises ValidationError. an account without a password gets an unusable one
+    '''
+    fields = {}
+    for name in FIELDS:
+        value = account.get(name)
+        value = '' if value is None else str(value).strip()
+        fields[name] = User._meta.get_field(name).clean(value, None)
+    return fields, account.get('password') or None
+    
+def setup_worker():
+    # spawned workers start without Django, forked ones find it set up already
+    django.setup()
+    
+def hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+    
\ No newline at end of file
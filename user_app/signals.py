@@ -1,9 +1,21 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from user_app.api.authentication import forget_token, forget_user
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+    
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_changed_user(sender, instance, created=False, **kwargs):
+    # deactivation, permission and password changes must not be served from a cached user
+    if not created:
+        forget_user(instance)
\ No newline at end of file
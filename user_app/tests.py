@@ -1,10 +1,23 @@
+import io
+import json
+import os
+import tempfile
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework.authtoken.models import Token
 
+from user_app.api.authentication import CachedTokenAuthentication, TokenCache, token_cache
+
 class RegisterTestCase(APITestCase):
     
     def test_register(self):
@@ -36,4 +49,145 @@ class LoginLogoutTestCase(APITestCase):
         self.token = Token.objects.get(user__username = "example")
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
         response = self.client.post(reverse('logout'))
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+class CachedTokenAuthenticationTestCase(APITestCase):
+    
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='example', password="NewPassword@123")
+        self.token = Token.objects.get(user__username = "example")
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + self.token.key)
+        
+    def authenticate(self):
+        return CachedTokenAuthentication().authenticate(self.request)
+        
+    def test_warm_cache_needs_no_query(self):
+        with self.assertNumQueries(1):
+            user, token = self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+        
+    def test_logout_purges_token(self):
+        self.authenticate()
+        response = self.client.post(reverse('logout'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+            
+    def test_deactivation_purges_user(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+            
+    def test_shared_cache(self):
+        with self.settings(TOKEN_AUTH_CACHE={**settings.TOKEN_AUTH_CACHE, 'SHARED_CACHE_ALIAS': 'default'}):
+            self.authenticate()
+            token_cache.clear()
+            with self.assertNumQueries(0):
+                user, token = self.authenticate()
+            self.assertEqual(user, self.user)
+            
+            self.token.delete()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+                
+    def test_lru_is_bounded(self):
+        lru = TokenCache(max_size=2, ttl=60)
+        for key in 'abc':
+            lru.set(key, self.user)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('a'))
+        
+        expired = TokenCache(max_size=2, ttl=-1)
+        expired.set('a', self.user)
+        self.assertIsNone(expired.get('a'))
+            
+# a fast hasher, the command hashes as many passwords as the tests feed it
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisionUsersTestCase(APITestCase):
+    
+    def setUp(self):
+        self.existing = User.objects.create_user(username='taken', email='taken@example.com', password="NewPassword@123")
+        self.directory = tempfile.TemporaryDirectory()
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            file.write(content)
+        return path
+        
+    def provision(self, path, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('provision_users', path, stdout=out, stderr=err, verbosity=2, **options)
+        return out.getvalue(), err.getvalue()
+        
+    def test_csv(self):
+        path = self.write('accounts.csv', (
+            "username,email,password,first_name\n"
+            "alice,alice@example.com,Secret@123,Alice\n"
+            "bob,,Secret@456,\n"
+            "taken,other@example.com,Secret@123,\n"
+            "carol,taken@example.com,Secret@123,\n"
+            "alice,alice2@example.com,Secret@123,\n"
+            "dave,dave@example.com,,\n"
+            "not a name,eve@example.com,Secret@123,\n"
+            "frank,not an email,Secret@123,\n"
+        ))
+        out, err = self.provision(path, workers=1, chunk_size=3)
+        self.assertIn('Created 3 users, skipped 5', out)
+        self.assertIn('line 4 (taken): username already exists', err)
+        self.assertIn('line 5 (carol): email already exists', err)
+        self.assertIn('line 6 (alice): username already exists', err)
+        
+        alice = User.objects.get(username='alice')
+        self.assertEqual((alice.email, alice.first_name), ('alice@example.com', 'Alice'))
+        self.assertTrue(alice.check_password('Secret@123'))
+        self.assertFalse(User.objects.get(username='dave').has_usable_password())
+        self.assertEqual(Token.objects.filter(user__username__in=['alice', 'bob', 'dave']).count(), 3)
+        
+        response = self.client.post(reverse('login'), data={'username': 'bob', 'password': 'Secret@456'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['token'], Token.objects.get(user__username='bob').key)
+        
+        # a second run finds everyone already there
+        out, _ = self.provision(path, workers=1)
+        self.assertIn('Created 0 users, skipped 8', out)
+        
+    def test_jsonl_hashed_in_worker_processes(self):
+        accounts = [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password': f'Secret@{i}'} for i in range(10)]
+        path = self.write('accounts.jsonl', ''.join(json.dumps(account) + '\n' for account in accounts))
+        out, _ = self.provision(path, workers=2, chunk_size=4)
+        self.assertIn('Created 10 users, skipped 0', out)
+        for i in [0, 5, 9]:
+            user = User.objects.get(username=f'user{i}')
+            self.assertTrue(user.check_password(f'Secret@{i}'))
+            self.assertTrue(Token.objects.filter(user=user).exists())
+        
+    def test_queries_per_chunk(self):
+        accounts = [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'Secret@123'} for i in range(20)]
+        path = self.write('accounts.jsonl', ''.join(json.dumps(account) + '\n' for account in accounts))
+        with CaptureQueriesContext(connection) as queries:
+            self.provision(path, workers=1, chunk_size=10)
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        # per chunk: the duplicate check, the users and the tokens
+        self.assertEqual(len(statements), 2 * 3, statements)
+        self.assertEqual(Token.objects.filter(user__username__startswith='user').count(), 20)
+        
+    def test_bad_input(self):
+        with self.assertRaises(CommandError):
+            self.provision(self.write('accounts.csv', "name,email\nalice,alice@example.com\n"))
+        with self.assertRaises(CommandError):
+            self.provision(self.write('accounts.jsonl', '["alice"]\n'))
+        with self.assertRaises(CommandError):
+            self.provision(os.path.join(self.directory.name, 'missing.csv'))
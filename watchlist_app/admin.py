@@ -1,6 +1,7 @@
 from django.contrib import admin
-from watchlist_app.models import WatchList, StreamPlatform, Review
+from watchlist_app.models import Job, WatchList, StreamPlatform, Review
 
 admin.site.register(WatchList)
 admin.site.register(StreamPlatform)
-admin.site.register(Review)
\ No newline at end of file
+admin.site.register(Review)
+admin.site.register(Job)
\ No newline at end of file
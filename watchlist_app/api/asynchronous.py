@@ -0,0 +1,59 @@
+"""
+Async variants of the hot read paths for ASGI deployments. Under ASGI a sync view holds a thread for the
+whole request; an async one only hands work to the thread the async ORM runs queries in while it waits
+on the database, and keeps the event loop free the rest of the time.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+
+from watchmate import instrumentation
+
+
+def read_view(view, async_view):
+    '''the view a URL serves, its async variant when ASYNC_READ_VIEWS is on as it is under ASGI'''
+    return (async_view if settings.ASYNC_READ_VIEWS else view).as_view()
+    
+class AsyncDispatchMixin:
+    '''
+    APIView whose coroutine handlers run on the event loop. DRF 3.15 only dispatches synchronously, so
+    this does it: authentication, permissions and throttles may query the database or the cache and run
+    in one hop to the sync thread, coroutine handlers are awaited and the inherited sync ones, the writes,
+    run in that thread. The response is rendered here, Django would otherwise hop to a thread to do it
+    '''
+    # the write handlers stay synchronous, Django would refuse the mix
+    view_is_async = True
+    
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+    
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+    
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.rendered(self.response)
+    
+    def rendered(self, response):
+        if not isinstance(response, SimpleTemplateResponse):
+            return response
+        with instrumentation.rendering():
+            response.render()
+        return HttpResponse(response.content, status=response.status_code, headers=response.headers)
+    
\ No newline at end of file
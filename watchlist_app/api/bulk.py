@@ -0,0 +1,89 @@
+from collections import Counter
+
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from watchlist_app.api import parsers, permissions
+
+
+class BulkUpsertAV(APIView):
+    '''
+    create or update a batch of objects posted as a JSON array or as JSON Lines. items that carry an id
+    replace that row and the others are created. invalid items are reported by index, the valid ones are
+    written in chunks inside one transaction and rows that would not change are left alone
+    '''
+    permission_classes = [permissions.IsAdminOrReadOnly]
+    parser_classes = [JSONParser, parsers.JSONLinesParser]
+    model = None
+    serializer_class = None
+    batch_size = 500
+    
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'Error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    
+        # one serializer validates every item, its fields are only built once
+        serializer = self.serializer_class()
+        items, errors = {}, {}
+        for index, data in enumerate(request.data):
+            try:
+                items[index] = serializer.run_validation(data)
+            except serializers.ValidationError as exc:
+                errors[index] = exc.detail
+    
+        self.resolve(items, errors)
+        existing = self.existing(items, errors)
+    
+        created, updated, fields = [], [], set()
+        for data in items.values():
+            pk = data.pop('id', None)
+            if pk is None:
+                created.append(self.model(**data))
+                continue
+    
+            obj = existing[pk]
+            changed = {name for name, value in data.items() if getattr(obj, name) != value}
+            if changed:
+                for name in changed:
+                    setattr(obj, name, data[name])
+                updated.append(obj)
+                fields |= changed
+    
+        with transaction.atomic():
+            if created:
+                self.model.objects.bulk_create(created, batch_size=self.batch_size)
+            if updated:
+                self.model.objects.bulk_update(updated, fields, batch_size=self.batch_size)
+    
+        return Response({
+            'created': len(created),
+            'updated': len(updated),
+            'unchanged': len(items) - len(created) - len(updated),
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }, status=status.HTTP_207_MULTI_STATUS if errors else status.HTTP_200_OK)
+    
+    def resolve(self, items, errors):
+        '''turn references in the validated items into column values, moving failures to errors'''
+        pass
+    
+    def existing(self, items, errors):
+        '''the rows named by an id, fetched in one query'''
+        counts = Counter(data['id'] for data in items.values() if data.get('id') is not None)
+        found = self.model.objects.in_bulk(list(counts)) if counts else {}
+    
+        for index, data in list(items.items()):
+            pk = data.get('id')
+            if pk is None:
+                continue
+            if pk not in found:
+                errors[index] = {'id': ['Not found.']}
+            elif counts[pk] > 1:
+                errors[index] = {'id': ['Appears more than once in the batch.']}
+            else:
+                continue
+            del items[index]
+        return found
+    
\ No newline at end of file
@@ -0,0 +1,114 @@
+import hashlib
+import inspect
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+from rest_framework import permissions, status
+
+from watchlist_app import caching
+from watchlist_app.api.fieldsets import requested
+from watchlist_app.models import Review, StreamPlatform, WatchList
+
+
+# validators are cached under the model versions, so a warm revalidation never reaches the database.
+# selection holds the ?expand= and ?fields= names of a read, which bring related rows into the body
+
+def watchlist_validators(pk, selection=()):
+    if 'reviews' in selection:
+        # the count notices a review deleted without touching any timestamp here
+        return caching.versioned(f'validators:watchlist:{pk}:reviews', (WatchList, StreamPlatform, Review), lambda: (
+            WatchList.objects.filter(pk=pk)
+            .annotate(latest=Max('reviews__updated'), review_count=Count('reviews'))
+            .values_list('updated', 'platform__updated', 'latest', 'review_count').first()))
+    # the platform name is part of a watchlist's representation
+    return caching.versioned(f'validators:watchlist:{pk}', (WatchList, StreamPlatform), lambda: (
+        WatchList.objects.filter(pk=pk).values_list('updated', 'platform__updated').first()))
+    
+def streamplatform_validators(pk, selection=()):
+    # the count notices a title that left the platform without touching any timestamp here
+    return caching.versioned(f'validators:streamplatform:{pk}', (WatchList, StreamPlatform), lambda: (
+        StreamPlatform.objects.filter(pk=pk)
+        .annotate(latest=Max('watchlist__updated'), titles=Count('watchlist'))
+        .values_list('updated', 'latest', 'titles').first()))
+    
+def review_validators(pk, selection=()):
+    if 'watchlist' in selection:
+        return caching.versioned(f'validators:review:{pk}:watchlist', (Review, WatchList, StreamPlatform), lambda: (
+            Review.objects.filter(pk=pk)
+            .values_list('updated', 'review_user__username', 'watchlist__updated', 'watchlist__platform__updated').first()))
+    return caching.versioned(f'validators:review:{pk}', (Review,), lambda: (
+        Review.objects.filter(pk=pk).values_list('updated', 'review_user__username').first()))
+    
+def make_etag(validators):
+    return hashlib.sha1(repr(validators).encode()).hexdigest()
+    
+def selected(request):
+    '''the ?expand= and ?fields= names of a read, each set of them is a representation with an ETag of its own'''
+    if request.method not in permissions.SAFE_METHODS:
+        return ()
+    return tuple(sorted(set(requested(request, 'expand') or ()) | set(requested(request, 'fields') or ())))
+    
+def conditional(lookup):
+    '''
+    answer If-None-Match / If-Modified-Since with 304 and If-Match / If-Unmodified-Since with 412
+    from one narrow query or a cache hit, before the object is loaded or serialized
+    '''
+    def validators(request, pk):
+        if not hasattr(request, '_validators'):
+            request._validators = lookup(pk, selected(request))
+        return request._validators
+    
+    def etag(request, pk, **kwargs):
+        current = validators(request, pk)
+        if not current:
+            return None
+        selection = selected(request)
+        return make_etag((current, selection) if selection else current)
+    
+    def last_modified(request, pk, **kwargs):
+        current = validators(request, pk)
+        if current:
+            return max(value for value in current if isinstance(value, datetime))
+    
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            # condition() cannot wrap a coroutine before Django 5.0, async views only read so this
+            # is its GET and HEAD half, with the validators looked up in the thread queries run in
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                await sync_to_async(validators)(request, kwargs['pk'])
+                current_etag = etag(request, **kwargs)
+                current_etag = quote_etag(current_etag) if current_etag is not None else None
+                modified = last_modified(request, **kwargs)
+                modified = int(modified.timestamp()) if modified else None
+    
+                response = get_conditional_response(request, etag=current_etag, last_modified=modified)
+                if response is None:
+                    response = await method(view, request, *args, **kwargs)
+                if modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(modified)
+                if current_etag:
+                    response.headers.setdefault('ETag', current_etag)
+                return response
+            return async_wrapper
+    
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            handler = condition(etag_func=etag, last_modified_func=last_modified)(
+                lambda request, *args, **kwargs: method(view, request, *args, **kwargs))
+            response = handler(request, *args, **kwargs)
+    
+            # hand the new validator back so the client can chain its next conditional write
+            if request.method not in permissions.SAFE_METHODS and response.status_code in (status.HTTP_200_OK, status.HTTP_201_CREATED):
+                current = lookup(kwargs['pk'])
+                if current:
+                    response['ETag'] = quote_etag(make_etag(current))
+            return response
+        return wrapper
+    return decorator
+    
\ No newline at end of file
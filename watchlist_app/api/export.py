@@ -0,0 +1,65 @@
+from django.http import StreamingHttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+
+from watchlist_app.api import fastpath, fieldsets, renderers
+
+
+def json_lines(chunks):
+    for rows in chunks:
+        yield b''.join(renderers.dumps(row) + b'\n' for row in rows)
+    
+def json_array(chunks):
+    yield b'['
+    separator = b''
+    for rows in chunks:
+        if rows:
+            yield separator + b','.join(map(renderers.dumps, rows))
+            separator = b','
+    yield b']'
+    
+class ExportAV(APIView):
+    '''
+    every row of model as JSON Lines (the default, or ?format=jsonl) or as one JSON array (?format=json),
+    streamed chunk_size rows at a time so memory stays flat whatever the size of the table.
+    ?fields= and ?expand= select fields as on the list endpoints
+    '''
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [renderers.JSONLinesRenderer, JSONRenderer]
+    model = None
+    serializer_class = None
+    chunk_size = 2000
+    
+    def get(self, request):
+        chunks = self.chunks(self.serializer_class.selection(request))
+        if request.accepted_renderer.format == 'json':
+            body, extension = json_array(chunks), 'json'
+        else:
+            body, extension = json_lines(chunks), 'jsonl'
+        response = StreamingHttpResponse(body, content_type=request.accepted_renderer.media_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.model._meta.model_name}.{extension}"'
+        return response
+    
+    def chunks(self, selection):
+        '''lists of rendered rows in primary key order'''
+        pk = self.model._meta.pk.attname
+        extractor = fastpath.get_extractor(self.serializer_class, selection)
+        if extractor is not None:
+            queryset = self.model.objects.order_by(pk).values(*dict.fromkeys([*extractor.columns, pk]))
+            render, last_pk = extractor, lambda row: row[pk]
+        else:
+            queryset = fieldsets.narrow(self.model.objects.order_by(pk), self.serializer_class(**selection))
+            render = lambda rows: self.serializer_class(rows, many=True, **selection).data
+            last_pk = lambda obj: obj.pk
+    
+        # each chunk is its own query after the last key seen, no cursor stays open while a slow client reads
+        page = queryset
+        while True:
+            rows = list(page[:self.chunk_size])
+            if rows:
+                yield render(rows)
+            if len(rows) < self.chunk_size:
+                return
+            page = queryset.filter(pk__gt=last_pk(rows[-1]))
+    
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+A read-only shortcut for list endpoints: rows come from queryset.values() and are turned into the exact
+payload the serializer would render, by a function compiled once per serializer and field selection,
+without building model instances or walking DRF's field machinery for every row. Serializers it cannot
+compile (nested expansions, method fields) keep the stock path.
+"""
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, fields as drf_fields, relations
+from rest_framework.settings import api_settings
+
+from watchlist_app.api import fieldsets
+from watchmate import instrumentation
+
+
+# fields whose to_representation is a plain type conversion, which is a no-op on what the database returns
+IDENTITY = (drf_fields.CharField, drf_fields.EmailField, drf_fields.URLField, drf_fields.SlugField,
+            drf_fields.IntegerField, drf_fields.BooleanField, drf_fields.ReadOnlyField)
+CONVERSIONS = {drf_fields.FloatField: float}
+
+
+class Unsupported(Exception):
+    pass
+    
+def datetime_converter(field):
+    '''
+    DateTimeField.to_representation in ISO 8601 for aware datetimes, which looks the current timezone up
+    for every value; this looks it up once per call of the extractor
+    '''
+    if (getattr(field, 'format', api_settings.DATETIME_FORMAT) or '').lower() != ISO_8601:
+        return None
+    
+    def prepare():
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is None:
+            return field.to_representation
+    
+        def convert(value):
+            if value.utcoffset() is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+    return prepare
+    
+def column(field, model):
+    '''(values() key, whether it can be NULL) of a serializer field reading straight from model'''
+    attrs = field.source_attrs
+    if not attrs:
+        raise Unsupported(field.field_name)
+    try:
+        model_field = model._meta.get_field(attrs[0])
+    except FieldDoesNotExist:
+        raise Unsupported(field.field_name)
+    if not model_field.concrete:
+        raise Unsupported(field.field_name)
+    
+    if len(attrs) == 1:
+        if model_field.is_relation:
+            if type(field) is not relations.PrimaryKeyRelatedField or field.pk_field is not None:
+                raise Unsupported(field.field_name)
+            return model_field.attname, model_field.null
+        return attrs[0], model_field.null
+    
+    if len(attrs) == 2 and model_field.many_to_one:
+        try:
+            related_field = model_field.related_model._meta.get_field(attrs[1])
+        except FieldDoesNotExist:
+            raise Unsupported(field.field_name)
+        if related_field.concrete and not related_field.is_relation:
+            return f'{attrs[0]}__{attrs[1]}', model_field.null or related_field.null
+    raise Unsupported(field.field_name)
+    
+class Extractor:
+    '''
+    renders rows of queryset.values(*extractor.columns) as serializer renders the same rows as instances.
+    a serializer can name how to read a field that is not a plain column in fast_sources,
+    {field name: (values() key, conversion)}
+    '''
+    
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        overrides = getattr(serializer, 'fast_sources', {})
+        self.columns = []
+        items, prepared, namespace = [], [], {}
+    
+        for index, (name, field) in enumerate(serializer.fields.items()):
+            if field.write_only:
+                continue
+            prepare = None
+            if name in overrides:
+                key, convert, nullable = *overrides[name], True
+            elif type(field) is drf_fields.DateTimeField and (prepare := datetime_converter(field)):
+                (key, nullable), convert = column(field, model), None
+            elif type(field) in IDENTITY:
+                (key, nullable), convert = column(field, model), None
+            elif type(field) in CONVERSIONS:
+                (key, nullable), convert = column(field, model), CONVERSIONS[type(field)]
+            elif isinstance(field, drf_fields.Field) and not isinstance(field, (relations.RelatedField, relations.ManyRelatedField)) \
+                    and not hasattr(field, 'fields') and not hasattr(field, 'child'):
+                # a scalar field with its own formatting, dates or decimals for instance
+                (key, nullable), convert = column(field, model), field.to_representation
+            else:
+                raise Unsupported(name)
+    
+            self.columns.append(key)
+            value = f'row[{key!r}]'
+            if prepare is not None:
+                # a converter that depends on the request, built once per call
+                namespace[f'prepare{index}'] = prepare
+                prepared.append(f'    convert{index} = prepare{index}()\n')
+            elif convert is not None:
+                namespace[f'convert{index}'] = convert
+            if prepare is not None or convert is not None:
+                converted = f'convert{index}({value})'
+                value = f'(None if {value} is None else {converted})' if nullable else converted
+            items.append(f'{name!r}: {value}')
+    
+        # one dict display per row, the closest Python gets to a hand written loop
+        source = 'def extract(rows):\n%s    return [{%s} for row in rows]\n' % (''.join(prepared), ', '.join(items))
+        exec(source, namespace)
+        self.extract = namespace['extract']
+    
+    def __call__(self, rows):
+        with instrumentation.serializing():
+            return self.extract(rows)
+    
+@lru_cache(maxsize=64)
+def compile_extractor(serializer_class, fields, expand):
+    try:
+        return Extractor(serializer_class(fields=list(fields) if fields is not None else None, expand=list(expand)))
+    except Unsupported:
+        return None
+    
+def get_extractor(serializer_class, selection):
+    '''the compiled extractor for serializer_class with selection ({} or the result of its selection()), or None'''
+    fields, expand = selection.get('fields'), selection.get('expand') or ()
+    return compile_extractor(serializer_class, tuple(fields) if fields is not None else None, tuple(expand))
+    
+def plan_page(view, queryset, serializer_class, selection):
+    '''(paginator, queryset to page through, function rendering the page) for an APIView'''
+    paginator = view.pagination_class()
+    keep = fieldsets.ordering_fields(view.pagination_class)
+    extractor = get_extractor(serializer_class, selection)
+    if extractor is None:
+        queryset = fieldsets.narrow(queryset, serializer_class(**selection), keep=keep)
+        return paginator, queryset, lambda page: serializer_class(page, many=True, **selection).data
+    return paginator, queryset.values(*dict.fromkeys([*extractor.columns, *keep])), extractor
+    
+def paginate(view, queryset, serializer_class, selection):
+    '''
+    the paginated list response of queryset for an APIView, from values() rows when serializer_class
+    compiles and through a narrowed queryset and the serializer otherwise
+    '''
+    paginator, queryset, render = plan_page(view, queryset, serializer_class, selection)
+    page = paginator.paginate_queryset(queryset, view.request, view=view)
+    return paginator.get_paginated_response(render(page))
+    
+async def apaginate(view, queryset, serializer_class, selection):
+    '''paginate() for async views, the page is read in the thread the async ORM runs queries in'''
+    paginator, queryset, render = plan_page(view, queryset, serializer_class, selection)
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, view.request, view=view)
+    return paginator.get_paginated_response(render(page))
+    
+class FastListMixin:
+    '''ListAPIView whose list() goes through the compiled extractor when the serializer allows it'''
+    
+    def list(self, request, *args, **kwargs):
+        extractor = get_extractor(self.get_serializer_class(), self.get_selection())
+        if extractor is None or self.pagination_class is None:
+            return super().list(request, *args, **kwargs)
+        return self.get_paginated_response(extractor(self.paginate_queryset(self.values(extractor))))
+        
+    async def alist(self, request, *args, **kwargs):
+        '''list() for async views'''
+        extractor = get_extractor(self.get_serializer_class(), self.get_selection())
+        if extractor is None or self.pagination_class is None:
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+        page = await sync_to_async(self.paginate_queryset)(self.values(extractor))
+        return self.get_paginated_response(extractor(page))
+        
+    def values(self, extractor):
+        keep = fieldsets.ordering_fields(self.pagination_class)
+        return self.filter_queryset(self.get_queryset()).values(*dict.fromkeys([*extractor.columns, *keep]))
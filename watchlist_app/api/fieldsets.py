@@ -0,0 +1,146 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import permissions, serializers
+
+
+def requested(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name for name in (name.strip() for name in value.split(',')) if name]
+    
+def ordering_fields(pagination_class):
+    '''the columns a cursor paginator reads from the last row of a page'''
+    return [name.lstrip('-') for name in getattr(pagination_class, 'ordering', None) or ()]
+    
+class SparseFieldsMixin:
+    '''
+    serializer that renders only the fields passed as fields (all when None) plus the expandable_fields
+    named in expand, which are left out unless asked for
+    '''
+    expandable_fields = {}
+    
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name]()
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+    
+    @classmethod
+    def selection(cls, request):
+        '''the fields and expand arguments a request asks for with ?fields= and ?expand='''
+        fields, expand = requested(request, 'fields'), requested(request, 'expand') or []
+        # naming an expandable field in ?fields= asks for it as well
+        expand += [name for name in fields or () if name in cls.expandable_fields and name not in expand]
+        errors = {}
+        unknown = set(fields or ()) - set(cls().fields) - set(cls.expandable_fields)
+        if unknown:
+            errors['fields'] = [f'Unknown field: {name}' for name in sorted(unknown)]
+        unknown = set(expand) - set(cls.expandable_fields)
+        if unknown:
+            errors['expand'] = [f'Cannot expand: {name}' for name in sorted(unknown)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return {'fields': fields, 'expand': expand}
+    
+def collect(serializer, model, prefix, only, related, prefetches):
+    '''gather what serializer reads from model into only/related/prefetches, False when it cannot tell'''
+    for field in serializer.fields.values():
+        if field.source == '*':
+            return False
+        attrs = field.source_attrs
+        try:
+            model_field = model._meta.get_field(attrs[0])
+        except FieldDoesNotExist:
+            return False
+        name = prefix + attrs[0]
+    
+        if model_field.one_to_many:
+            child = getattr(field, 'child', None)
+            if prefix or not isinstance(child, serializers.Serializer):
+                return False
+            remote = model_field.field.name
+            child_plan = plan(model_field.related_model, child, keep=[remote])
+            if child_plan is None:
+                return False
+            # prefetching points every child back at this object, so what they read through it is loaded here
+            child_only, child_related, child_prefetches = child_plan
+            back = remote + '__'
+            only.update(column[len(back):] for column in child_only if column.startswith(back))
+            child_only = {column for column in child_only if not column.startswith(back)}
+            child_related = {name for name in child_related if name != remote and not name.startswith(back)}
+            queryset = model_field.related_model.objects.prefetch_related(*child_prefetches).only(*child_only)
+            if child_related:
+                queryset = queryset.select_related(*child_related)
+            prefetches.append(Prefetch(attrs[0], queryset=queryset))
+        elif model_field.many_to_one or model_field.one_to_one:
+            if isinstance(field, serializers.Serializer):
+                related.add(name)
+                if not collect(field, model_field.related_model, name + '__', only, related, prefetches):
+                    return False
+            elif len(attrs) == 2:
+                related.add(name)
+                only.add(f'{name}__{attrs[1]}')
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                only.add(name)
+            else:
+                # rendered from the whole related object, str() for instance
+                related.add(name)
+                only.update(f'{name}__{column.name}' for column in model_field.related_model._meta.concrete_fields)
+        elif model_field.concrete and len(attrs) == 1:
+            only.add(name)
+        else:
+            return False
+    return True
+    
+def plan(model, serializer, keep=()):
+    only = {model._meta.pk.name}
+    for name in keep:
+        try:
+            if model._meta.get_field(name).concrete:
+                only.add(name)
+        except FieldDoesNotExist:
+            pass
+    related, prefetches = set(), []
+    if not collect(serializer, model, '', only, related, prefetches):
+        return None
+    return only, related, prefetches
+    
+def narrow(queryset, serializer, keep=()):
+    '''
+    queryset loading just the columns serializer renders: only() the selected fields, select_related the
+    foreign keys it follows and prefetch the reverse relations it nests. keep names columns read elsewhere,
+    such as the pagination ordering. a serializer reading something that is not a plain field leaves it as is
+    '''
+    narrowed = plan(queryset.model, serializer, keep)
+    if narrowed is None:
+        return queryset
+    only, related, prefetches = narrowed
+    # the joins the queryset came with may reach columns that are now deferred, and
+    # select_related() without arguments would follow every foreign key
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.prefetch_related(*prefetches).only(*only)
+    
+class SparseFieldsViewMixin:
+    '''generic view answering ?fields= and ?expand= on reads, with a queryset narrowed to match'''
+    
+    def get_selection(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return {}
+        if not hasattr(self, '_selection'):
+            self._selection = self.get_serializer_class().selection(self.request)
+        return self._selection
+    
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.get_selection(), **kwargs)
+    
+    def narrow(self, queryset):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        serializer = self.get_serializer_class()(**self.get_selection())
+        return narrow(queryset, serializer, keep=ordering_fields(self.pagination_class))
+    
\ No newline at end of file
@@ -1,5 +1,305 @@
+"""
+Offset pagination for tables too large to count or to skip through. The seek paginators below fetch a row
+more than the page to tell whether another follows, so they need no COUNT(*) unless count_mode asks for
+one, and an 'estimated' count is the last one taken, kept in the response cache and taken again in the
+background once it is PAGINATION['COUNT_REFRESH'] seconds old. Their next
+links carry the ordering key of the last row, which the next page seeks past on the index instead of
+skipping the rows before it, and an offset of PAGINATION['SEEK_OFFSET'] or more is turned into a seek by
+reading the key at the offset alone.
+"""
+import base64
+import hashlib
+import json
+import math
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from watchlist_app import caching, tasks
+from watchmate import replicas
+
 
+def seek(ordering, key, inclusive=False):
+    '''the rows that come after key in ordering, and the one at key with inclusive'''
+    first, *rest = ordering
+    name = first.lstrip('-')
+    before, after = ('lt', 'lte') if first.startswith('-') else ('gt', 'gte')
+    # bounded on the first column too, so the database can start the index range there
+    bound = Q(**{f'{name}__{after}': key[0]})
+    if not rest:
+        return bound if inclusive else Q(**{f'{name}__{before}': key[0]})
+    return bound & (Q(**{f'{name}__{before}': key[0]}) | Q(**{name: key[0]}) & seek(rest, key[1:], inclusive))
+    
+def whole_table(query):
+    '''whether query counts every row of its model'''
+    return not (query.where or query.distinct or query.group_by or query.combinator or query.is_sliced)
+    
+def count(queryset):
+    '''the rows of queryset, from the table statistics where the database keeps them and nothing filters it'''
+    connection = connections[queryset.db]
+    if connection.vendor == 'mysql' and whole_table(queryset.query):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None and row[0] is not None:
+            return row[0]
+    return queryset.count()
+    
+def store(key, rows):
+    caching.get_cache().set(key, (rows, time.time()), settings.PAGINATION['COUNT_TTL'])
+    
+@tasks.task()
+def recount(key, model, filters=None):
+    '''count the rows of model the filters lookups select again for estimated_count()'''
+    try:
+        store(key, count(apps.get_model(model)._default_manager.filter(**filters or {})))
+    finally:
+        # a failed count is tried again by the next request to find it stale, not a refresh later
+        caching.get_cache().delete(f'{key}:refreshing')
+    
+def estimated_count(queryset, filters=None):
+    '''
+    the rows of queryset as last counted. the first request counts them and later ones get the cached count,
+    the first to find it COUNT_REFRESH seconds old has the task queue count them again. a filtered queryset
+    is only rebuilt by the job from filters, JSON serializable lookups on its model, and without them it is
+    counted again by that request
+    '''
+    query = queryset.query.chain()
+    query.clear_ordering(force=True)
+    if query.is_empty():
+        return 0
+    label = queryset.model._meta.label
+    try:
+        key = 'page-count:' + hashlib.sha256(f'{label}:{query}'.encode()).hexdigest()
+    except EmptyResultSet:
+        # filtered on an empty list
+        return 0
+    cache = caching.get_cache()
+    cached = cache.get(key)
+    if cached is None:
+        rows = count(queryset)
+        store(key, rows)
+        return rows
+    rows, counted = cached
+    refresh = settings.PAGINATION['COUNT_REFRESH']
+    # held at most one refresh period, the count goes stale again that soon after a lost marker
+    if time.time() - counted < refresh or not cache.add(f'{key}:refreshing', True, refresh):
+        return rows
+    if whole_table(query):
+        filters = {}
+    if filters is None:
+        try:
+            rows = count(queryset)
+            store(key, rows)
+        finally:
+            cache.delete(f'{key}:refreshing')
+        return rows
+    # the client never reads the job back, it need not read from default after queueing it
+    with replicas.unrecorded():
+        recount.defer(key, label, filters, key=key)
+    return rows
+    
+class OffsetSeekMixin:
+    '''
+    offset pagination over an ordering that ends in a unique column. count_mode is None for no count,
+    'estimated' for estimated_count() or 'exact' for a COUNT(*) on every page
+    '''
+    ordering = ('-created', '-id')
+    count_mode = None
+    seek_query_param = 'after'
+    invalid_seek_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = self.get_count(queryset, request, view)
+        self.offset, self.limit = self.get_window(request)
+        if self.limit is None:
+            return None
+        rows, self.has_next = self.fetch(queryset, request, self.offset, self.limit)
+        self.last_key = self.get_key(rows[-1]) if rows else None
+        return rows
+    
+    def get_count(self, queryset, request, view=None):
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'estimated':
+            return estimated_count(queryset, self.get_count_filters(queryset, request, view))
+        return None
+    
+    def get_count_filters(self, queryset, request, view=None):
+        '''lookups on the model that select queryset, for estimated_count() to count it in the background'''
+        return None
+    
+    def get_window(self, request):
+        '''the (offset, limit) of the page asked for, (None, None) to leave the queryset whole'''
+        raise NotImplementedError
+    
+    def fetch(self, queryset, request, offset, limit):
+        '''the rows of the page of limit rows at offset, or after the key in the request, and whether more follow'''
+        names = [name.lstrip('-') for name in self.ordering]
+        queryset = queryset.order_by(*self.ordering)
+        after = self.decode_key(request, queryset.model)
+        if after is not None:
+            queryset = queryset.filter(seek(self.ordering, after))
+        elif offset >= settings.PAGINATION['SEEK_OFFSET']:
+            # the skipped rows are only read from the index the ordering uses, not fetched whole
+            boundary = queryset.values_list(*names)[offset:offset + 1]
+            boundary = boundary[0] if boundary else None
+            if boundary is None:
+                return [], False
+            queryset = queryset.filter(seek(self.ordering, boundary, inclusive=True))
+        else:
+            queryset = queryset[offset:]
+        rows = list(queryset[:limit + 1])
+        return rows[:limit], len(rows) > limit
+    
+    def get_key(self, row):
+        names = [name.lstrip('-') for name in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        values = []
+        for name in names:
+            try:
+                values.append(getattr(row, row._meta.get_field(name).attname))
+            except FieldDoesNotExist:
+                # an annotation
+                values.append(getattr(row, name))
+        return values
+    
+    def encode_key(self, key):
+        return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode().rstrip('=')
+    
+    def decode_key(self, request, model):
+        encoded = request.query_params.get(self.seek_query_param)
+        if not encoded:
+            return None
+        names = [name.lstrip('-') for name in self.ordering]
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError(encoded)
+            key = []
+            for name, value in zip(names, values):
+                try:
+                    key.append(model._meta.get_field(name).to_python(value))
+                except FieldDoesNotExist:
+                    key.append(value)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_seek_message)
+        return key
+    
+    def get_paginated_response(self, data):
+        body = {} if self.count is None else {'count': self.count}
+        return Response({
+            **body,
+            'has_next': self.has_next,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['has_next', 'results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'has_next': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+    
+class SeekLimitOffsetPagination(OffsetSeekMixin, LimitOffsetPagination):
+    default_limit = 10
+    max_limit = 100
+    
+    def get_window(self, request):
+        return self.get_offset(request), self.get_limit(request)
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        url = replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+        return replace_query_param(url, self.seek_query_param, self.encode_key(self.last_key))
+    
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.seek_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        if self.offset - self.limit <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, self.offset - self.limit)
+    
+class SeekPageNumberPagination(OffsetSeekMixin, PageNumberPagination):
+    '''the last page, ?page=last, takes a count_mode'''
+    page_size = 10
+    
+    def get_window(self, request):
+        size = self.get_page_size(request)
+        if not size:
+            return None, None
+        number = request.query_params.get(self.page_query_param) or 1
+        if number in self.last_page_strings:
+            if self.count is None:
+                raise NotFound(self.invalid_page_message.format(page_number=number, message='the last page needs a count'))
+            number = max(1, math.ceil(self.count / size))
+        try:
+            number = int(number)
+            if number < 1:
+                raise ValueError(number)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(page_number=number, message='That page number is not an integer'))
+        self.number = number
+        return (number - 1) * size, size
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = super().paginate_queryset(queryset, request, view)
+        if rows == [] and self.number > 1:
+            raise NotFound(self.invalid_page_message.format(page_number=self.number, message='That page contains no results'))
+        return rows
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+        return replace_query_param(url, self.seek_query_param, self.encode_key(self.last_key))
+    
+    def get_previous_link(self):
+        if self.number <= 1:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.seek_query_param)
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
+    
+class ReviewSeekPagination(SeekLimitOffsetPagination):
+    '''the reviews of a watchlist by offset and an estimated count, with PAGINATION['REVIEW_LIST'] set to seek'''
+    count_mode = 'estimated'
+    
+    def get_count_filters(self, queryset, request, view=None):
+        # the watchlist in the URL and the filterset of the view, the rest of the queryset leaves the count alone
+        if view is None or 'pk' not in view.kwargs:
+            return None
+        filterset = DjangoFilterBackend().get_filterset(request, queryset, view)
+        if filterset is not None and not filterset.is_valid():
+            return None
+        lookups = {} if filterset is None else filterset.form.cleaned_data
+        return {'watchlist': view.kwargs['pk'], **{name: value for name, value in lookups.items() if value not in (None, '')}}
+    
 class WatchListPagination(PageNumberPagination):
     page_size = 7
     page_query_param = 'p'
@@ -10,6 +310,51 @@ class WatchListPagination(PageNumberPagination):
 class WatchListLOPagination(LimitOffsetPagination):
     default_limit = 5
     
-class WatchListCPagination(CursorPagination):
-    page_size = 5
-    ordering = 'created'
\ No newline at end of file
+class KeysetPagination(CursorPagination):
+    '''
+    cursor pagination over an indexed (created, id) ordering, so a deep page costs the same as the first one.
+    the total is only counted when the client asks for it with ?count=true
+    '''
+    page_size = 10
+    page_size_query_param = 'size'
+    max_page_size = 100
+    ordering = ('-created', '-id')
+    count_query_param = 'count'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+    
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
+    
+class WatchListCPagination(KeysetPagination):
+    pass
+
+class StreamPlatformCPagination(KeysetPagination):
+    # platforms carry no timestamp, the primary key already grows with creation order
+    ordering = ('id',)
+    
+class ReviewCPagination(KeysetPagination):
+    pass
+    
+def review_list_pagination():
+    return ReviewSeekPagination if settings.PAGINATION['REVIEW_LIST'] == 'seek' else ReviewCPagination
+    
+class SearchCPagination(KeysetPagination):
+    # most relevant first, the id breaks ties in score
+    ordering = ('-score', '-id')
+    
+class TopRatedCPagination(KeysetPagination):
+    # watchlist_top_rated_idx and watchlist_platform_top_idx hold the rows in this order
+    ordering = ('-weighted_rating', '-id')
+    
+class LeaderboardPagination(LimitOffsetPagination):
+    '''pages of a ranked list kept whole in the cache, which is short enough to count'''
+    default_limit = 10
+    max_limit = 100
@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    
+    
+def dumps(data):
+    '''compact UTF-8 JSON, encoded by orjson when it is installed and by the standard library otherwise'''
+    if orjson is not None:
+        return orjson.dumps(data, default=encoders.JSONEncoder().default)
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    
+class JSONLinesRenderer(BaseRenderer):
+    '''one JSON document per line, a list renders one line per item'''
+    media_type = 'application/jsonl'
+    format = 'jsonl'
+    charset = None
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(dumps(item) + b'\n' for item in items)
+    
\ No newline at end of file
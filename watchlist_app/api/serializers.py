@@ -1,25 +1,72 @@
 from rest_framework import serializers
+from watchlist_app.api.fieldsets import SparseFieldsMixin
 from watchlist_app.models import WatchList, StreamPlatform, Review
+from watchmate.instrumentation import TimedListSerializer, TimedSerializerMixin
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     review_user = serializers.StringRelatedField(read_only=True)
+    # str() of a User is its username, see watchlist_app.api.fastpath
+    fast_sources = {'review_user': ('review_user__username', None)}
+    expandable_fields = {
+        'watchlist': lambda: WatchListSerializer(read_only=True),
+    }
+    
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         exclude = ['watchlist']
         # fields ='__all__'
         
-class WatchListSerializer(serializers.ModelSerializer):
+class WatchListSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     # reviews = ReviewSerializer(many=True, read_only=True)
     platform = serializers.CharField(source='platform.name')
+    expandable_fields = {
+        'reviews': lambda: ReviewSerializer(many=True, read_only=True),
+    }
 
     class Meta:
         model = WatchList
+        list_serializer_class = TimedListSerializer
         fields = '__all__'
+        read_only_fields = ['avg_rating', 'number_rating', 'rating_sum', 'weighted_rating', 'imdb_id', 'imdb_rating', 'imdb_votes']
+        
+class StreamPlatformSerializers(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    # titles are left out of the representation unless asked for with ?expand=watchlist
+    expandable_fields = {
+        'watchlist': lambda: WatchListSerializer(many=True, read_only=True),
+    }
+    
+    class Meta:
+        model = StreamPlatform
+        list_serializer_class = TimedListSerializer
+        fields = '__all__'
+        read_only_fields = StreamPlatform.stats_fields
+        
+class PlatformReferenceField(serializers.Field):
+    default_error_messages = {'invalid': 'Expected a platform id or name.'}
+    
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('invalid')
+        return data
+    
+    def to_representation(self, value):
+        return value
+    
+class WatchListBulkSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    platform = PlatformReferenceField()
+    
+    class Meta:
+        model = WatchList
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'title', 'storyline', 'platform', 'active']
         
-class StreamPlatformSerializers(serializers.ModelSerializer):
-    watchlist = WatchListSerializer(many=True, read_only=True)
+class StreamPlatformBulkSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     
     class Meta:
         model = StreamPlatform
-        fields = '__all__'
\ No newline at end of file
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'name', 'about', 'website']
@@ -1,7 +1,86 @@
-from rest_framework.throttling import UserRateThrottle
+from rest_framework import throttling
 
-class ReviewCreateThrottle(UserRateThrottle):
-    scope = 'review-create'
 
-class ReviewListThrottle(UserRateThrottle):
-    scope = 'review-list'
\ No newline at end of file
+class CounterRateThrottle(throttling.SimpleRateThrottle):
+    '''
+    count requests per window instead of keeping a list of timestamps, so every check costs a couple of
+    cache round trips and one integer per key whatever the rate. the sliding variant weighs the previous
+    window by how much of it still overlaps the last `duration` seconds; set sliding = False for plain
+    fixed windows
+    '''
+    sliding = True
+    
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+    
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+    
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+    
+        if self.sliding:
+            counts = self.cache.get_many([current_key, previous_key])
+            self.previous = counts.get(previous_key, 0)
+        else:
+            counts = {current_key: self.cache.get(current_key, 0)}
+            self.previous = 0
+        self.current = counts.get(current_key, 0)
+        if self.estimate(self.current + 1) > self.num_requests:
+            return self.throttle_failure()
+    
+        # the check above is a read, concurrent requests can both pass it; the increment settles the race
+        self.current = self.increment(current_key)
+        if self.estimate(self.current) > self.num_requests:
+            self.cache.decr(current_key)
+            self.current -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+    
+    def estimate(self, current):
+        return self.previous * (1 - self.elapsed / self.duration) + current
+    
+    def increment(self, key):
+        # the previous window is still read during the next one, so counters outlive it
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            if self.cache.add(key, 1, self.duration * 2):
+                return 1
+            return self.cache.incr(key)
+    
+    def throttle_success(self):
+        return True
+    
+    def wait(self):
+        remaining = self.duration - self.elapsed
+        if not self.sliding:
+            return remaining
+    
+        if self.current >= self.num_requests:
+            # this window becomes the previous one and has to fade until one more request fits
+            return remaining + self.duration * (1 - (self.num_requests - 1) / self.current)
+        if self.previous:
+            return max(0.0, self.duration * (1 - (self.num_requests - self.current - 1) / self.previous) - self.elapsed)
+        return 0.0
+    
+class AnonCounterThrottle(throttling.AnonRateThrottle, CounterRateThrottle):
+    pass
+    
+class UserCounterThrottle(throttling.UserRateThrottle, CounterRateThrottle):
+    pass
+    
+class ScopedCounterThrottle(throttling.ScopedRateThrottle, CounterRateThrottle):
+    pass
+    
+class ReviewCreateThrottle(UserCounterThrottle):
+    scope = 'review-create'
+    
+class ReviewListThrottle(UserCounterThrottle):
+    scope = 'review-list'
+    
\ No newline at end of file
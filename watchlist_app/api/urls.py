@@ -1,18 +1,32 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from watchlist_app.api import views
+from watchlist_app.api.asynchronous import read_view
 
 
 urlpatterns = [
-    path('', views.WatchListAV.as_view(), name='movie-list'), 
-    path('<int:pk>/', views.WatchDetailAV.as_view(), name='movie-details'),
+    path('', read_view(views.WatchListAV, views.AsyncWatchListAV), name='movie-list'), 
+    path('<int:pk>/', read_view(views.WatchDetailAV, views.AsyncWatchDetailAV), name='movie-details'),
+    path('<int:pk>/also-liked/', views.AlsoLikedAV.as_view(), name='movie-also-liked'),
+    path('<int:pk>/stats/', views.ReviewStatsAV.as_view(), name='movie-stats'),
+    path('bulk/', views.WatchListBulkAV.as_view(), name='movie-bulk'),
+    path('search/', views.WatchListSearch.as_view(), name='movie-search'),
+    path('export/', views.WatchListExportAV.as_view(), name='movie-export'),
+    path('stats/', views.ReviewStatsBatchAV.as_view(), name='movie-stats-batch'),
+    path('top-rated/', views.TopRatedList.as_view(), name='movie-top-rated'),
+    path('trending/', views.TrendingAV.as_view(), name='movie-trending'),
 
-    path('stream/', views.StreamPlatformListAV.as_view(), name='stream-list'),
-    path('stream/<int:pk>/', views.StreamPlatformDetailAV.as_view(), name='stream-details'),
+    path('stream/', read_view(views.StreamPlatformListAV, views.AsyncStreamPlatformListAV), name='stream-list'),
+    path('stream/<int:pk>/', read_view(views.StreamPlatformDetailAV, views.AsyncStreamPlatformDetailAV), name='stream-details'),
+    path('stream/bulk/', views.StreamPlatformBulkAV.as_view(), name='stream-bulk'),
+    path('stream/export/', views.StreamPlatformExportAV.as_view(), name='stream-export'),
+    path('stream/<int:pk>/top-rated/', views.TopRatedList.as_view(), name='stream-top-rated'),
+    path('stream/<int:pk>/trending/', views.TrendingAV.as_view(), name='stream-trending'),
     
     path('<int:pk>/reviews/create/', views.ReviewCreate.as_view(), name='review-create'),
-    path('<int:pk>/reviews/', views.ReviewList.as_view(), name='reviews-list'),
+    path('<int:pk>/reviews/', read_view(views.ReviewList, views.AsyncReviewList), name='reviews-list'),
     path('reviews/<int:pk>/', views.ReviewDetail.as_view(), name='reviews-detail'),
+    path('reviews/export/', views.ReviewExportAV.as_view(), name='reviews-export'),
     
     path('user-reviews/', views.UserReview.as_view(), name='user-reviews'),
 ]
\ No newline at end of file
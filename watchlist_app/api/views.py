@@ -1,32 +1,36 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, generics, status, viewsets
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
-from rest_framework.throttling import AnonRateThrottle, ScopedRateThrottle, UserRateThrottle
 from rest_framework.views import APIView
 
-from watchlist_app.api import pagination, permissions, serializers, throttling
+from watchlist_app import caching, leaderboards, recommendations, review_stats, search
+from watchlist_app.api import asynchronous, bulk, export, fastpath, fieldsets, pagination, permissions, serializers, throttling
+from watchlist_app.api.conditional import conditional, review_validators, streamplatform_validators, watchlist_validators
 from watchlist_app.models import Review, StreamPlatform, WatchList
 
 
-class UserReview(generics.ListAPIView):
+class UserReview(fastpath.FastListMixin, fieldsets.SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = serializers.ReviewSerializer
+    pagination_class = pagination.ReviewCPagination
     
     '''filtering against a query parameter'''
     def get_queryset(self):
-        queryset = Review.objects.all()
+        queryset = Review.objects.select_related('review_user')
         username = self.request.query_params.get('username')
         if username is not None:
             queryset = queryset.filter(review_user__username=username)
-        return queryset
+        return self.narrow(queryset)
 
 class ReviewCreate(generics.CreateAPIView):
     serializer_class = serializers.ReviewSerializer
     permission_classes = [IsAuthenticated]
-    throttle_classes = [UserRateThrottle, throttling.ReviewCreateThrottle]
+    throttle_classes = [throttling.UserCounterThrottle, throttling.ReviewCreateThrottle]
     
     
     def get_queryset(self):
@@ -37,48 +41,76 @@ class ReviewCreate(generics.CreateAPIView):
         watchlist = WatchList.objects.get(pk=pk)
         
         review_user = self.request.user
-        review_queryset = Review.objects.filter(watchlist=watchlist, review_user=review_user)
         
-        if review_queryset.exists():
-            raise ValidationError('A review already exists for this user')
-        
-        
-        if watchlist.number_rating == 0:
-            watchlist.avg_rating = serializer.validated_data['rating']
-        else:
-            watchlist.avg_rating = (watchlist.avg_rating + serializer.validated_data['rating']) / 2
-            
-        watchlist.number_rating = watchlist.number_rating + 1
-        
-        watchlist.save()
-        
-        return serializer.save(watchlist=watchlist, review_user=review_user)
+        # unique_review_per_user turns the duplicate check into the insert itself,
+        # the watchlist rating follows from the post_save receiver in watchlist_app.signals
+        try:
+            with transaction.atomic():
+                return serializer.save(watchlist=watchlist, review_user=review_user)
+        except IntegrityError:
+            # anything else, a watchlist deleted meanwhile for one, is not the client's to fix
+            if Review.objects.filter(watchlist=watchlist, review_user=review_user).exists():
+                raise ValidationError('A review already exists for this user')
+            raise
 
-class ReviewList(generics.ListAPIView):
+class ReviewList(fastpath.FastListMixin, fieldsets.SparseFieldsViewMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
-    throttle_classes = [UserRateThrottle, throttling.ReviewListThrottle]
+    throttle_classes = [throttling.UserCounterThrottle, throttling.ReviewListThrottle]
     serializer_class = serializers.ReviewSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['review_user__username', 'active']
     
+    @property
+    def pagination_class(self):
+        return pagination.review_list_pagination()
+    
     def get_queryset(self):
         pk = self.kwargs.get('pk')
-        return Review.objects.filter(watchlist=pk)
+        return self.narrow(Review.objects.filter(watchlist=pk).select_related('review_user'))
+    
+class AsyncReviewList(asynchronous.AsyncDispatchMixin, ReviewList):
+    
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
     
-class ReviewDetail(generics.RetrieveUpdateDestroyAPIView):
+class ReviewExportAV(export.ExportAV):
+    model = Review
+    serializer_class = serializers.ReviewSerializer
+    
+class ReviewDetail(fieldsets.SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsReviewUserOrReadOnly]
-    queryset = Review
+    queryset = Review.objects.select_related('review_user')
     serializer_class = serializers.ReviewSerializer
     throttle_scope = 'review-throttle'
-    throttle_classes = [ScopedRateThrottle, UserRateThrottle]
+    throttle_classes = [throttling.ScopedCounterThrottle, throttling.UserCounterThrottle]
 
+    def get_queryset(self):
+        return self.narrow(super().get_queryset())
+    
+    @conditional(review_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
+    @conditional(review_validators)
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+    
+    @conditional(review_validators)
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+    
+    @conditional(review_validators)
+    def delete(self, request, *args, **kwargs):
+        return super().delete(request, *args, **kwargs)
+    
 class WatchListAV(APIView):
     permission_classes = [permissions.IsAdminOrReadOnly]
+    pagination_class = pagination.WatchListCPagination
     
+    @caching.cache_response(WatchList, StreamPlatform, Review)
     def get(self, request):
-        movies = WatchList.objects.all()
-        serializer = serializers.WatchListSerializer(movies, many=True)
-        return Response(data=serializer.data)
+        selection = serializers.WatchListSerializer.selection(request)
+        return fastpath.paginate(self, WatchList.objects.all(), serializers.WatchListSerializer, selection)
     
     def post(self, request):
         serializer = serializers.WatchListSerializer(data=request.data)
@@ -88,18 +120,143 @@ class WatchListAV(APIView):
         else:
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
         
+class AsyncWatchListAV(asynchronous.AsyncDispatchMixin, WatchListAV):
+    
+    @caching.cache_response(WatchList, StreamPlatform, Review)
+    async def get(self, request):
+        selection = serializers.WatchListSerializer.selection(request)
+        return await fastpath.apaginate(self, WatchList.objects.all(), serializers.WatchListSerializer, selection)
+    
+class WatchListBulkAV(bulk.BulkUpsertAV):
+    model = WatchList
+    serializer_class = serializers.WatchListBulkSerializer
+    
+    def resolve(self, items, errors):
+        '''platforms are named by id or by name, every reference in the batch is looked up in one query'''
+        references = {data['platform'] for data in items.values()}
+        ids = {reference for reference in references if isinstance(reference, int)}
+        names = references - ids
+        platforms = StreamPlatform.objects.filter(Q(pk__in=ids) | Q(name__in=names)).values_list('id', 'name') if references else []
+        
+        found, by_name = set(), {}
+        for pk, name in platforms:
+            found.add(pk)
+            by_name.setdefault(name, []).append(pk)
+        
+        for index, data in list(items.items()):
+            reference = data.pop('platform')
+            if isinstance(reference, int):
+                matches = [reference] if reference in found else []
+            else:
+                matches = by_name.get(reference, [])
+            if len(matches) == 1:
+                data['platform_id'] = matches[0]
+                continue
+            errors[index] = {'platform': ['Not found.' if not matches else 'More than one platform has this name, use its id.']}
+            del items[index]
+        
+class WatchListSearch(fastpath.FastListMixin, fieldsets.SparseFieldsViewMixin, generics.ListAPIView):
+    serializer_class = serializers.WatchListSerializer
+    pagination_class = pagination.SearchCPagination
+    
+    '''ranked full-text search over titles and storylines with ?q='''
+    def get_queryset(self):
+        return self.narrow(search.search(self.request.query_params.get('q', '')))
+    
+class TopRatedList(fastpath.FastListMixin, fieldsets.SparseFieldsViewMixin, generics.ListAPIView):
+    '''active titles by weighted rating, of the whole catalog or of the platform pk'''
+    serializer_class = serializers.WatchListSerializer
+    pagination_class = pagination.TopRatedCPagination
+    
+    def get_queryset(self):
+        return self.narrow(leaderboards.top_rated(self.kwargs.get('pk')))
+    
+class RecommendationsUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Recommendations need numpy and scipy installed.'
+    default_code = 'recommendations_unavailable'
+    
+class RankedWatchListAV(APIView):
+    '''a page of a ranked [(watchlist id, score)] list as watchlists, each with its score as score_field'''
+    pagination_class = pagination.LeaderboardPagination
+    score_field = None
+    
+    def ranked(self, pk):
+        raise NotImplementedError
+    
+    def get(self, request, pk=None):
+        selection = serializers.WatchListSerializer.selection(request)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(self.ranked(pk), request, view=self)
+    
+        queryset = fieldsets.narrow(WatchList.objects.filter(active=True), serializers.WatchListSerializer(**selection))
+        watchlists = queryset.in_bulk([watchlist_id for watchlist_id, _ in page])
+        # rankings are computed ahead, titles taken down since drop out of them
+        ranked = [(watchlists[watchlist_id], score) for watchlist_id, score in page if watchlist_id in watchlists]
+        data = serializers.WatchListSerializer([watchlist for watchlist, _ in ranked], many=True, **selection).data
+        for item, (_, score) in zip(data, ranked):
+            item[self.score_field] = score
+        return paginator.get_paginated_response(data)
+    
+class TrendingAV(RankedWatchListAV):
+    '''the titles reviewed most of late, of the whole catalog or of the platform pk, with recent_reviews'''
+    score_field = 'recent_reviews'
+    
+    def ranked(self, pk):
+        return leaderboards.trending(pk)
+    
+class AlsoLikedAV(RankedWatchListAV):
+    '''the titles the viewers who liked pk liked too, most similar first, with their similarity'''
+    score_field = 'similarity'
+    
+    def ranked(self, pk):
+        if not recommendations.available():
+            raise RecommendationsUnavailable()
+        return recommendations.also_liked(pk)
+    
+class ReviewStatsAV(APIView):
+    '''rating histogram, active and inactive reviews and recent reviews per day of the watchlist pk'''
+    
+    def get(self, request, pk):
+        stats = review_stats.get_stats([pk])
+        if pk not in stats:
+            return Response({'Error': 'WatchList not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(stats[pk])
+    
+class ReviewStatsBatchAV(APIView):
+    '''the review statistics of the watchlists in ?ids=, comma separated, in that order; unknown ids are left out'''
+    max_ids = 100
+    
+    def get(self, request):
+        try:
+            ids = list(dict.fromkeys(int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()))
+        except ValueError:
+            raise ValidationError({'ids': 'A comma separated list of watchlist ids is required.'})
+        if not ids or len(ids) > self.max_ids:
+            raise ValidationError({'ids': f'Between 1 and {self.max_ids} watchlist ids are required.'})
+        stats = review_stats.get_stats(ids)
+        return Response({'results': [stats[watchlist_id] for watchlist_id in ids if watchlist_id in stats]})
+    
+class WatchListExportAV(export.ExportAV):
+    model = WatchList
+    serializer_class = serializers.WatchListSerializer
+    
 class WatchDetailAV(APIView):
     permission_classes = [permissions.IsAdminOrReadOnly]
     
+    @conditional(watchlist_validators)
+    @caching.cache_response(WatchList, StreamPlatform, Review)
     def get(self, request, pk):
+        selection = serializers.WatchListSerializer.selection(request)
         try:
-            movie = WatchList.objects.get(pk=pk)
+            movie = fieldsets.narrow(WatchList.objects.all(), serializers.WatchListSerializer(**selection)).get(pk=pk)
         except WatchList.DoesNotExist:
             return Response({'Error': 'WatchList not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = serializers.WatchListSerializer(movie)
+        serializer = serializers.WatchListSerializer(movie, **selection)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
+    @conditional(watchlist_validators)
     def put(self, request, pk):
         try:
             movie = WatchList.objects.get(pk=pk)
@@ -112,6 +269,7 @@ class WatchDetailAV(APIView):
         except WatchList.DoesNotExist:
             return Response({'Error': 'WatchList not found'}, status=status.HTTP_404_NOT_FOUND)
         
+    @conditional(watchlist_validators)
     def delete(self, request, pk):
         try:
             movie = WatchList.objects.get(pk=pk)
@@ -120,14 +278,28 @@ class WatchDetailAV(APIView):
         except WatchList.DoesNotExist:
             return Response({'Error': 'WatchList not found'}, status=status.HTTP_404_NOT_FOUND)
     
+class AsyncWatchDetailAV(asynchronous.AsyncDispatchMixin, WatchDetailAV):
+    
+    @conditional(watchlist_validators)
+    @caching.cache_response(WatchList, StreamPlatform, Review)
+    async def get(self, request, pk):
+        selection = serializers.WatchListSerializer.selection(request)
+        try:
+            movie = await fieldsets.narrow(WatchList.objects.all(), serializers.WatchListSerializer(**selection)).aget(pk=pk)
+        except WatchList.DoesNotExist:
+            return Response({'Error': 'WatchList not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = serializers.WatchListSerializer(movie, **selection)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    
 class StreamPlatformListAV(APIView):
     permission_classes = [permissions.IsAdminOrReadOnly]
+    pagination_class = pagination.StreamPlatformCPagination
     
-    
+    @caching.cache_response(WatchList, StreamPlatform, Review)
     def get(self, request):
-        platforms = StreamPlatform.objects.all()
-        serializer = serializers.StreamPlatformSerializers(platforms, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        selection = serializers.StreamPlatformSerializers.selection(request)
+        return fastpath.paginate(self, StreamPlatform.objects.all(), serializers.StreamPlatformSerializers, selection)
         
     def post(self, request):
         serializer = serializers.StreamPlatformSerializers(data=request.data)
@@ -138,18 +310,37 @@ class StreamPlatformListAV(APIView):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST) 
         
+class AsyncStreamPlatformListAV(asynchronous.AsyncDispatchMixin, StreamPlatformListAV):
+    
+    @caching.cache_response(WatchList, StreamPlatform, Review)
+    async def get(self, request):
+        selection = serializers.StreamPlatformSerializers.selection(request)
+        return await fastpath.apaginate(self, StreamPlatform.objects.all(), serializers.StreamPlatformSerializers, selection)
+        
+class StreamPlatformBulkAV(bulk.BulkUpsertAV):
+    model = StreamPlatform
+    serializer_class = serializers.StreamPlatformBulkSerializer
+    
+class StreamPlatformExportAV(export.ExportAV):
+    model = StreamPlatform
+    serializer_class = serializers.StreamPlatformSerializers
+    
 class StreamPlatformDetailAV(APIView):
     permission_classes = [permissions.IsAdminOrReadOnly]
     
+    @conditional(streamplatform_validators)
+    @caching.cache_response(WatchList, StreamPlatform, Review)
     def get(self, request, pk):
+        selection = serializers.StreamPlatformSerializers.selection(request)
         try:
-            platform = StreamPlatform.objects.get(pk=pk)
+            platform = fieldsets.narrow(StreamPlatform.objects.all(), serializers.StreamPlatformSerializers(**selection)).get(pk=pk)
         except StreamPlatform.DoesNotExist:
             return Response({'Error': 'Streaming platform not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = serializers.StreamPlatformSerializers(platform)
+        serializer = serializers.StreamPlatformSerializers(platform, **selection)
         return Response(serializer.data, status=status.HTTP_200_OK)
         
+    @conditional(streamplatform_validators)
     def put(self, request, pk):
         try:
             platform = StreamPlatform.objects.get(pk=pk)
@@ -163,10 +354,23 @@ class StreamPlatformDetailAV(APIView):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+    @conditional(streamplatform_validators)
     def delete(self, request, pk):
+        # the titles and reviews go in a statement per table rather than row by row, see StreamPlatformQuerySet.purge
+        if not StreamPlatform.objects.filter(pk=pk).purge():
+            return Response({'Error': 'Streaming platform not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+        
+class AsyncStreamPlatformDetailAV(asynchronous.AsyncDispatchMixin, StreamPlatformDetailAV):
+    
+    @conditional(streamplatform_validators)
+    @caching.cache_response(WatchList, StreamPlatform, Review)
+    async def get(self, request, pk):
+        selection = serializers.StreamPlatformSerializers.selection(request)
         try:
-            platform = StreamPlatform.objects.get(pk=pk)
-            StreamPlatform.delete(platform)
+            platform = await fieldsets.narrow(StreamPlatform.objects.all(), serializers.StreamPlatformSerializers(**selection)).aget(pk=pk)
         except StreamPlatform.DoesNotExist:
-            raise Response({'Error': 'Streaming platform not found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+            return Response({'Error': 'Streaming platform not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = serializers.StreamPlatformSerializers(platform, **selection)
+        return Response(serializer.data, status=status.HTTP_200_OK)
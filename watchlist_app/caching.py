@@ -0,0 +1,116 @@
+import hashlib
+import inspect
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from watchmate import replicas
+
+
+MISSING = object()
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+    
+def version_key(model):
+    return f'version:{model._meta.label_lower}'
+    
+def initial_version():
+    # a version lost to eviction restarts above every number handed out before it
+    return time.time_ns() // 1000
+    
+def get_versions(models):
+    cache = get_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+    
+async def aget_versions(models):
+    cache = get_cache()
+    keys = [version_key(model) for model in models]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, initial_version(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+    
+def _bump(model):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), initial_version(), timeout=None)
+    
+def bump_version(model):
+    '''
+    invalidate every cached response that depends on model. the bump happens right away so the writer
+    reads its own write, and again on commit so nothing cached from the pre-commit rows survives
+    '''
+    _bump(model)
+    transaction.on_commit(lambda: _bump(model))
+    
+def versioned(name, models, compute, timeout=None):
+    '''the value of compute(), cached until one of models changes'''
+    cache = get_cache()
+    versions = '.'.join(str(version) for version in get_versions(models))
+    key = f'{name}:{versions}'
+    
+    value = cache.get(key, MISSING)
+    if value is MISSING:
+        with replicas.primary():
+            value = compute()
+        cache.set(key, value, timeout or settings.RESPONSE_CACHE_TIMEOUT)
+    return value
+    
+def response_key(view, request, versions):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'response:{view.__class__.__name__}:{".".join(str(version) for version in versions)}:{path}'
+    
+def cache_response(*models, timeout=None):
+    '''
+    cache the data of successful GET responses until one of models changes, for sync and async handlers.
+    misses are read from the primary database
+    '''
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                cache = get_cache()
+                key = response_key(view, request, await aget_versions(models))
+                data = await cache.aget(key)
+                if data is not None:
+                    return Response(data, status=status.HTTP_200_OK)
+    
+                # a lagging replica would cache what it has under the versions the write moved to
+                with replicas.primary():
+                    response = await method(view, request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    await cache.aset(key, response.data, timeout or settings.RESPONSE_CACHE_TIMEOUT)
+                return response
+            return async_wrapper
+    
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_cache()
+            key = response_key(view, request, get_versions(models))
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, status=status.HTTP_200_OK)
+    
+            with replicas.primary():
+                response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout or settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
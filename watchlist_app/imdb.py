@@ -0,0 +1,80 @@
+"""
+Readers for the public IMDb TSV dumps (https://developer.imdb.com/non-commercial-datasets/).
+They touch neither Django nor the database so the parsing can run in worker processes.
+"""
+import gzip
+
+NULL = '\\N'
+
+
+def open_tsv(path):
+    '''a text stream over a plain or gzipped dump, decompressed lazily as lines are read'''
+    opener = gzip.open if path.endswith('.gz') else open
+    return opener(path, 'rt', encoding='utf-8', newline='\n')
+    
+def title_number(tconst):
+    # tconst is "tt" and a zero padded number that grew from 7 to 8 digits, the dumps are in numeric order
+    return int(tconst[2:])
+    
+def describe(title_type, start_year, runtime, genres):
+    parts = [title_type]
+    if start_year != NULL:
+        parts.append(start_year)
+    if genres != NULL:
+        parts.append(genres.replace(',', ', '))
+    if runtime != NULL:
+        parts.append(f'{runtime} min')
+    return ' | '.join(parts)
+    
+def parse_basics(lines, title_types, include_adult, title_length, storyline_length):
+    '''
+    (number of lines read, [(tconst, title, storyline)]) for the wanted titles among raw title.basics
+    lines. malformed lines are skipped
+    '''
+    rows = []
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 9:
+            continue
+        tconst, title_type, primary_title, _, adult, start_year, _, runtime, genres = fields
+        if title_type not in title_types or (adult == '1' and not include_adult):
+            continue
+        rows.append((tconst, primary_title[:title_length], describe(title_type, start_year, runtime, genres)[:storyline_length]))
+    return len(lines), rows
+    
+def read_ratings(path):
+    '''(title number, average rating, votes) for every line of title.ratings, in file order'''
+    with open_tsv(path) as lines:
+        next(lines, None)
+        last = -1
+        for line in lines:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                continue
+            number = title_number(fields[0])
+            if number <= last:
+                raise ValueError(f'{path} is not sorted by tconst at {fields[0]}')
+            last = number
+            yield number, float(fields[1]), int(fields[2])
+    
+class RatingLookup:
+    '''walks the sorted ratings dump alongside the sorted titles, so neither has to fit in memory'''
+    
+    def __init__(self, ratings):
+        self.ratings = iter(ratings)
+        self.current = next(self.ratings, None)
+        self.last = -1
+    
+    def get(self, tconst):
+        '''(average rating, votes) of tconst, which must come after every tconst asked for before'''
+        number = title_number(tconst)
+        if number <= self.last:
+            raise ValueError(f'title.basics is not sorted by tconst at {tconst}')
+        self.last = number
+    
+        while self.current is not None and self.current[0] < number:
+            self.current = next(self.ratings, None)
+        if self.current is not None and self.current[0] == number:
+            return self.current[1:]
+        return None, 0
+    
\ No newline at end of file
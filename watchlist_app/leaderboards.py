@@ -0,0 +1,44 @@
+"""
+Leaderboards of the catalog, over every platform or one. Top rated needs no structure of its own:
+WatchList.weighted_rating moves in the same UPDATE as the running rating on every review write, and
+indexes on it hand out a page of the ranking without sorting anything. Trending ranks titles by the
+reviews they got in the last TRENDING_WINDOW seconds, a count that changes as the window slides and not
+only on writes, so the ranking is computed at most once every TRENDING_REFRESH seconds and kept in the
+response cache.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from watchlist_app import caching
+from watchlist_app.models import Review, WatchList
+
+
+def top_rated(platform_id=None):
+    '''the watchlists on the top rated leaderboard, ranked by pagination.TopRatedCPagination'''
+    queryset = WatchList.objects.filter(active=True, number_rating__gte=settings.LEADERBOARDS['MIN_REVIEWS'])
+    if platform_id is not None:
+        queryset = queryset.filter(platform=platform_id)
+    return queryset
+    
+def rank_trending(platform_id=None):
+    since = timezone.now() - timedelta(seconds=settings.LEADERBOARDS['TRENDING_WINDOW'])
+    reviews = Review.objects.filter(created__gte=since, active=True, watchlist__active=True)
+    if platform_id is not None:
+        reviews = reviews.filter(watchlist__platform=platform_id)
+    ranked = (reviews.values('watchlist').annotate(reviews=Count('id')).order_by('-reviews', '-watchlist')
+              .values_list('watchlist', 'reviews'))
+    return list(ranked[:settings.LEADERBOARDS['TRENDING_SIZE']])
+    
+def trending(platform_id=None):
+    '''[(watchlist id, reviews in the window)] of the most reviewed active watchlists of late, most first'''
+    cache = caching.get_cache()
+    key = f'leaderboard:trending:{platform_id}'
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank_trending(platform_id)
+        cache.set(key, ranked, settings.LEADERBOARDS['TRENDING_REFRESH'])
+    return ranked
+    
\ No newline at end of file
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from watchlist_app import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Compute the "also liked" neighbours of every watchlist, or with --incremental of those reviewed since the last run'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='recompute only what reviews written since the last run touched')
+    
+    def handle(self, *args, **options):
+        if not recommendations.available():
+            raise CommandError('recommendations need numpy and scipy, pip install numpy scipy')
+        path = settings.RECOMMENDATIONS['PATH']
+        if options['incremental']:
+            count = recommendations.refresh()
+            self.stdout.write(self.style.SUCCESS(f'Recomputed the neighbours of {count:,} watchlists in {path}'))
+        else:
+            count = recommendations.build()
+            self.stdout.write(self.style.SUCCESS(f'Wrote the neighbours of {count:,} watchlists to {path}'))
+    
\ No newline at end of file
@@ -0,0 +1,131 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from watchlist_app import imdb
+from watchlist_app.models import StreamPlatform, WatchList
+
+
+class Command(BaseCommand):
+    help = 'Upsert titles from local IMDb dumps (title.basics.tsv.gz and optionally title.ratings.tsv.gz) into the catalog'
+    
+    # the platform a title was put on is left alone when it is imported again
+    update_fields = ['title', 'storyline', 'imdb_rating', 'imdb_votes', 'updated']
+    
+    def add_arguments(self, parser):
+        parser.add_argument('basics', help='path to title.basics.tsv(.gz)')
+        parser.add_argument('--ratings', help='path to title.ratings.tsv(.gz)')
+        parser.add_argument('--platform', default='IMDb', help='stream platform new titles are added to, created if missing')
+        parser.add_argument('--title-types', default='movie', help='comma separated titleType values to import')
+        parser.add_argument('--include-adult', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='lines parsed and upserted per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='processes parsing chunks in parallel')
+        parser.add_argument('--checkpoint', help='JSON file recording progress, the import resumes from it if it exists')
+    
+    def handle(self, *args, **options):
+        basics = options['basics']
+        chunk_size = options['chunk_size']
+        if chunk_size < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+    
+        checkpoint = self.read_checkpoint(options['checkpoint'], basics)
+        platform = self.get_platform(options['platform'])
+        parse = partial(
+            imdb.parse_basics,
+            title_types=set(options['title_types'].split(',')),
+            include_adult=options['include_adult'],
+            title_length=WatchList._meta.get_field('title').max_length,
+            storyline_length=WatchList._meta.get_field('storyline').max_length,
+        )
+        ratings = imdb.RatingLookup(imdb.read_ratings(options['ratings']) if options['ratings'] else ())
+    
+        # MySQL upserts on any unique key and refuses to be told which one
+        conflicts = {'update_conflicts': True, 'update_fields': self.update_fields}
+        if connection.features.supports_update_conflicts_with_target:
+            conflicts['unique_fields'] = ['imdb_id']
+    
+        lines_done, imported = checkpoint['lines'], checkpoint['imported']
+        start = reported = time.monotonic()
+        lines_read = 0
+        try:
+            with imdb.open_tsv(basics) as lines:
+                next(lines, None)
+                deque(islice(lines, lines_done), maxlen=0)
+                chunks = iter(lambda: list(islice(lines, chunk_size)), [])
+    
+                for count, rows in self.parsed(chunks, parse, options['workers']):
+                    objs = []
+                    for tconst, title, storyline in rows:
+                        rating, votes = ratings.get(tconst)
+                        objs.append(WatchList(
+                            imdb_id=tconst, title=title, storyline=storyline, platform=platform,
+                            imdb_rating=rating, imdb_votes=votes,
+                        ))
+                    with transaction.atomic():
+                        WatchList.objects.bulk_create(objs, batch_size=chunk_size, **conflicts)
+    
+                    lines_done += count
+                    lines_read += count
+                    imported += len(objs)
+                    self.write_checkpoint(options['checkpoint'], basics, lines_done, imported)
+    
+                    now = time.monotonic()
+                    if options['verbosity'] > 1 or (options['verbosity'] and now - reported >= 10):
+                        reported = now
+                        self.stdout.write(f'{lines_done:,} rows read, {imported:,} titles imported, {lines_read / (now - start):,.0f} rows/s')
+        except ValueError as exc:
+            raise CommandError(exc)
+    
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported:,} titles from {lines_done:,} rows in {elapsed:.1f}s ({lines_read / max(elapsed, 1e-9):,.0f} rows/s)'))
+    
+    def parsed(self, chunks, parse, workers):
+        '''parse results in file order, with at most two chunks per worker in flight'''
+        if workers == 1:
+            yield from map(parse, chunks)
+            return
+    
+        with ProcessPoolExecutor(workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(parse, chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def get_platform(self, name):
+        platform = StreamPlatform.objects.filter(name=name).order_by('id').first()
+        if platform is None:
+            platform = StreamPlatform.objects.create(name=name, about='Titles imported from the IMDb datasets', website='https://www.imdb.com')
+        return platform
+    
+    def read_checkpoint(self, path, basics):
+        if not path or not os.path.exists(path):
+            return {'lines': 0, 'imported': 0}
+    
+        with open(path) as file:
+            checkpoint = json.load(file)
+        if checkpoint.get('basics') != os.path.abspath(basics):
+            raise CommandError(f'{path} records progress through {checkpoint.get("basics")}, not {basics}')
+        self.stdout.write(f'Resuming after {checkpoint["lines"]:,} rows')
+        return checkpoint
+    
+    def write_checkpoint(self, path, basics, lines, imported):
+        # written after the chunk committed and swapped in whole, so it never runs ahead of the database
+        if not path:
+            return
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'basics': os.path.abspath(basics), 'lines': lines, 'imported': imported}, file)
+        os.replace(path + '.tmp', path)
+    
\ No newline at end of file
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from watchlist_app import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the watchlist search index from scratch'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='watchlists read and indexed per batch')
+    
+    def handle(self, *args, **options):
+        watchlists, postings = search.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {watchlists:,} watchlists into {postings:,} postings'))
+    
\ No newline at end of file
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from watchlist_app.models import WatchList
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ratings, weighted ratings and platform statistics from the reviews, after LEADERBOARDS changes'
+    
+    def handle(self, *args, **options):
+        updated = WatchList.objects.recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed the ratings of {updated:,} watchlists'))
+    
\ No newline at end of file
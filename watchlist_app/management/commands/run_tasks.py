@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from watchlist_app import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run the deferred tasks of watchlist_app.tasks from the job queue on a pool of threads'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.TASKS['THREADS'])
+        parser.add_argument('--batch-size', type=int, default=settings.TASKS['BATCH_SIZE'], help='jobs a batch task takes at once')
+        parser.add_argument('--once', action='store_true', help='exit once no job is due rather than wait for more')
+    
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--threads and --batch-size must be at least 1')
+        stop = threading.Event()
+    
+        def worker():
+            # every thread has a connection of its own, dropped when it breaks or outlives CONN_MAX_AGE
+            try:
+                return tasks.work(stop, options['batch_size'], options['once'], between=db.close_old_connections)
+            finally:
+                db.connection.close()
+    
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            workers = [executor.submit(worker) for _ in range(options['threads'])]
+            try:
+                done = sum(future.result() for future in workers)
+            except KeyboardInterrupt:
+                # the jobs that are running finish, nothing new is claimed
+                stop.set()
+                done = sum(future.result() for future in workers)
+        self.stdout.write(self.style.SUCCESS(f'Ran {done:,} jobs'))
+    
\ No newline at end of file
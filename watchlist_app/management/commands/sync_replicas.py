@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite default database over the SQLite REPLICA_DATABASES standing in for replicas in development'
+    
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('REPLICA_DATABASES is empty, set REPLICAS to the number of replicas to simulate')
+        aliases = [DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES]
+        vendors = {connections[alias].vendor for alias in aliases}
+        if vendors != {'sqlite'}:
+            raise CommandError('only SQLite databases are copied, real replicas follow their primary on their own')
+    
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        for alias in settings.REPLICA_DATABASES:
+            target = connections[alias]
+            target.ensure_connection()
+            # the online backup API copies a consistent snapshot while the primary stays usable
+            source.connection.backup(target.connection)
+            self.stdout.write(f'Copied {source.settings_dict["NAME"]} to {target.settings_dict["NAME"]}')
+        self.stdout.write(self.style.SUCCESS('Replicas up to date'))
+    
\ No newline at end of file
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0007_watchlist_avg_rating_watchlist_number_rating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created', 'id'], name='review_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['created', 'id'], name='watchlist_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 09:05
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_ratings(apps, schema_editor):
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    Review = apps.get_model('watchlist_app', 'Review')
+
+    reviews = Review.objects.filter(watchlist=OuterRef('pk'), active=True).order_by().values('watchlist')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+    WatchList.objects.update(
+        avg_rating=Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0), output_field=FloatField()),
+        rating_sum=total,
+        number_rating=count,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0008_created_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def drop_duplicate_reviews(apps, schema_editor):
+    '''keep the first review of every (watchlist, user) pair so the unique constraint can be added'''
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    Review = apps.get_model('watchlist_app', 'Review')
+
+    duplicates = (Review.objects.values('watchlist', 'review_user')
+                  .annotate(first=Min('id'), copies=Count('id')).filter(copies__gt=1))
+    affected = set()
+    for row in duplicates:
+        Review.objects.filter(watchlist=row['watchlist'], review_user=row['review_user']).exclude(pk=row['first']).delete()
+        affected.add(row['watchlist'])
+    if not affected:
+        return
+
+    reviews = Review.objects.filter(watchlist=OuterRef('pk'), active=True).order_by().values('watchlist')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+    WatchList.objects.filter(pk__in=affected).update(
+        avg_rating=Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0), output_field=FloatField()),
+        rating_sum=total,
+        number_rating=count,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0009_watchlist_rating_sum'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['watchlist', 'active', 'created'], name='review_wl_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['review_user', 'created'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['platform', 'active', 'created'], name='watchlist_platform_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('watchlist', 'review_user'), name='unique_review_per_user'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0010_review_watchlist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamplatform',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0011_watchlist_streamplatform_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='imdb_id',
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='imdb_rating',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='watchlist',
+            name='imdb_votes',
+            field=models.IntegerField(default=0),
+        ),
+    ]
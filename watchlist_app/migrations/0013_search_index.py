@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 09:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0012_watchlist_imdb_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('term', models.CharField(max_length=40)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchtrigram',
+            constraint=models.UniqueConstraint(fields=('trigram', 'term'), name='unique_search_trigram'),
+        ),
+        migrations.AddField(
+            model_name='searchterm',
+            name='watchlist',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='watchlist_app.watchlist'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'watchlist'), name='unique_search_term'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 10:15
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_stats(apps, schema_editor):
+    StreamPlatform = apps.get_model('watchlist_app', 'StreamPlatform')
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+
+    titles = WatchList.objects.filter(platform=OuterRef('pk'), active=True).order_by().values('platform')
+    count = Coalesce(Subquery(titles.annotate(count=Count('id')).values('count')), 0)
+    total = Coalesce(Subquery(titles.annotate(total=Sum('rating_sum')).values('total')), 0)
+    reviews = Coalesce(Subquery(titles.annotate(reviews=Sum('number_rating')).values('reviews')), 0)
+    StreamPlatform.objects.update(
+        avg_rating=Coalesce(Cast(total, FloatField()) / NullIf(reviews, 0), Value(0.0), output_field=FloatField()),
+        active_titles=count,
+        rating_sum=total,
+        number_rating=reviews,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamplatform',
+            name='active_titles',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='number_rating',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamplatform',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 10:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+import watchlist_app.models
+
+
+def backfill_weighted_ratings(apps, schema_editor):
+    WatchList = apps.get_model('watchlist_app', 'WatchList')
+    prior = settings.LEADERBOARDS['PRIOR_REVIEWS']
+    mean = float(settings.LEADERBOARDS['PRIOR_MEAN'])
+    WatchList.objects.update(weighted_rating=(Cast(F('rating_sum'), FloatField()) + prior * mean) / (F('number_rating') + prior))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchlist_app', '0014_streamplatform_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='weighted_rating',
+            field=models.FloatField(default=watchlist_app.models.prior_mean),
+        ),
+        migrations.RunPython(backfill_weighted_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['active', '-weighted_rating', '-id'], name='watchlist_top_rated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['platform', 'active', '-weighted_rating', '-id'], name='watchlist_platform_top_idx'),
+        ),
+    ]
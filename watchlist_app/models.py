@@ -1,16 +1,261 @@
-from django.db import models
+from collections import Counter
+
+from django.db import connections, models, router, transaction
+from django.db.models import Count, F, FloatField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.lookups import Exact
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from watchlist_app import review_stats, tasks
+from watchlist_app.caching import bump_version
 
 
+class VersionedQuerySet(models.QuerySet):
+    # bulk writes send no model signals, so they invalidate cached responses themselves
+    # and move the auto_now timestamp that conditional requests are validated against
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        bump_version(self.model)
+        return objs
+    
+    def update(self, **kwargs):
+        kwargs.setdefault('updated', timezone.now())
+        rows = super().update(**kwargs)
+        bump_version(self.model)
+        return rows
+
+def rating_average(total, count):
+    return Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0), output_field=FloatField())
+    
+def prior_mean():
+    return float(settings.LEADERBOARDS['PRIOR_MEAN'])
+    
+def weighted_average(total, count):
+    '''the Bayesian average: the mean rating pulled towards PRIOR_MEAN as though PRIOR_REVIEWS more reviews had it'''
+    prior = settings.LEADERBOARDS['PRIOR_REVIEWS']
+    return (Cast(total, FloatField()) + prior * prior_mean()) / (count + prior)
+    
+def maintained_separately(instance, fields, kwargs):
+    '''
+    save() arguments that leave fields out of the UPDATE of an existing row. they move in UPDATEs of
+    their own, and writing back the values the instance was loaded with would undo the ones since
+    '''
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+    update_fields = [field.name for field in instance._meta.concrete_fields if not field.primary_key and field.name not in fields]
+    return {**kwargs, 'update_fields': update_fields}
+    
+class StreamPlatformQuerySet(VersionedQuerySet):
+    
+    def apply_stats(self, titles, total, count):
+        '''shift the active title count and the running rating sum and count in a single UPDATE'''
+        rating_sum = F('rating_sum') + total
+        number_rating = F('number_rating') + count
+        # assigned before the columns it is computed from, see WatchListQuerySet.apply_rating
+        return self.update(
+            avg_rating=rating_average(rating_sum, number_rating),
+            active_titles=F('active_titles') + titles,
+            rating_sum=rating_sum,
+            number_rating=number_rating,
+        )
+    
+    def recompute_stats(self):
+        '''rebuild the statistics of every platform in the queryset from its active watchlists'''
+        titles = WatchList.objects.filter(platform=OuterRef('pk'), active=True).order_by().values('platform')
+        count = Coalesce(Subquery(titles.annotate(count=Count('id')).values('count')), 0)
+        total = Coalesce(Subquery(titles.annotate(total=Sum('rating_sum')).values('total')), 0)
+        reviews = Coalesce(Subquery(titles.annotate(reviews=Sum('number_rating')).values('reviews')), 0)
+        return self.update(avg_rating=rating_average(total, reviews), active_titles=count, rating_sum=total, number_rating=reviews)
+    
+    def purge(self):
+        '''
+        delete the platforms with their watchlists, reviews and search postings in a statement for each table.
+        a cascade sends the signals of every review and watchlist, which only move aggregates that go too
+        '''
+        watchlists = WatchList.objects.filter(platform__in=self.values('pk'))
+        # children first, every table that points at the deleted rows is listed here. see
+        # PlatformStatsTestCase.test_purge_covers_every_relation
+        with transaction.atomic(using=self.db):
+            watchlist_ids = list(watchlists.values_list('pk', flat=True))
+            Review.objects.filter(watchlist__in=watchlists.values('pk'))._raw_delete(self.db)
+            SearchTerm.objects.filter(watchlist__in=watchlists.values('pk'))._raw_delete(self.db)
+            watchlists._raw_delete(self.db)
+            rows = self._raw_delete(self.db)
+            for model in (Review, WatchList, StreamPlatform):
+                bump_version(model)
+            review_stats.forget(watchlist_ids)
+        return rows
+    
 class StreamPlatform(models.Model):
     name = models.CharField(max_length=30)
     about = models.CharField(max_length=150)
     website = models.URLField(max_length=100)
+    updated = models.DateTimeField(auto_now=True)
+    # what the active watchlists on the platform add up to, kept in step by watchlist_app.signals
+    active_titles = models.IntegerField(default=0)
+    number_rating = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+    
+    objects = StreamPlatformQuerySet.as_manager()
+    
+    stats_fields = ['active_titles', 'number_rating', 'rating_sum', 'avg_rating']
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **maintained_separately(self, self.stats_fields, kwargs))
+    
+class IndexedBooleanExact(Exact):
+    '''
+    compare as "active = true" rather than the bare column Django emits for booleans,
+    which neither SQLite nor MySQL can match against a composite index
+    '''
+    def as_sql(self, compiler, connection):
+        return super(Exact, self).as_sql(compiler, connection)
+    
+def shift_stats(*changes):
+    '''apply (listing_state, rating_sum, number_rating, sign) changes to the platform statistics, one UPDATE per platform'''
+    titles, totals, counts = Counter(), Counter(), Counter()
+    for (platform_id, active), total, count, sign in changes:
+        if active:
+            titles[platform_id] += sign
+            totals[platform_id] += sign * total
+            counts[platform_id] += sign * count
+    for platform_id in titles:
+        if titles[platform_id] or totals[platform_id] or counts[platform_id]:
+            StreamPlatform.objects.filter(pk=platform_id).apply_stats(titles[platform_id], totals[platform_id], counts[platform_id])
+    
+class WatchListQuerySet(VersionedQuerySet):
+    # the fields that decide which platform statistics a watchlist counts towards, and what it adds to them
+    listing_fields = {'platform', 'platform_id', 'active'}
+    stats_fields = listing_fields | {'rating_sum', 'number_rating'}
+    # the fields watchlist_app.search indexes
+    indexed_fields = {'title', 'storyline'}
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            conflicts = kwargs.get('update_conflicts') or kwargs.get('ignore_conflicts')
+            numbered = connections[self.db].features.can_return_rows_from_bulk_insert and not conflicts
+            newest = None if numbered else self.aggregate(newest=Max('pk'))['newest'] or 0
+            if not kwargs.get('update_conflicts') and not kwargs.get('ignore_conflicts'):
+                inserted, platforms = objs, None
+            else:
+                key = self.key_field(objs, kwargs.get('unique_fields'))
+                stored = self.filter(**{f'{key}__in': [getattr(obj, key) for obj in objs]}) if key else None
+                if self.stats_fields.isdisjoint(kwargs.get('update_fields') or ()) and stored is not None:
+                    # rows that already exist keep counting as they did, only the inserted ones add to their platform
+                    keys = set(stored.values_list(key, flat=True))
+                    inserted, platforms = [obj for obj in objs if getattr(obj, key) not in keys], None
+                elif stored is not None:
+                    inserted, platforms = None, set(stored.values_list('platform_id', flat=True).distinct())
+                else:
+                    inserted, platforms = None, set(StreamPlatform.objects.values_list('pk', flat=True))
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if inserted is None:
+                StreamPlatform.objects.filter(pk__in=platforms | {obj.platform_id for obj in objs}).recompute_stats()
+            else:
+                shift_stats(*[(obj.listing_state, obj.rating_sum, obj.number_rating, 1) for obj in inserted])
+            self.index_written(objs, newest, kwargs.get('unique_fields'), upsert=kwargs.get('update_conflicts'))
+        for obj in objs:
+            obj.remember_listing()
+        return objs
+    
+    def index_written(self, objs, newest, unique_fields, upsert):
+        '''
+        replace the search postings of the rows bulk_create() wrote. newest is None when the database numbered
+        every inserted row, otherwise they are past it and upserted rows are found by the field they conflict on
+        '''
+        from watchlist_app import search
+        if newest is None:
+            # new rows, no postings to replace
+            search.write(objs)
+            return
+        unnumbered = [obj for obj in objs if obj.pk is None]
+        written = Q(pk__in=[obj.pk for obj in objs if obj.pk is not None]) | Q(pk__gt=newest)
+        if upsert and unnumbered:
+            key = self.key_field(unnumbered, unique_fields)
+            if key is None:
+                search.rebuild()
+                return
+            written |= Q(**{f'{key}__in': [getattr(obj, key) for obj in unnumbered]})
+        search.index(WatchList.objects.filter(written).only('id', 'title', 'storyline'))
+    
+    def key_field(self, objs, unique_fields):
+        '''the single field an upsert of objs conflicts on, None when there is none to tell stored rows by'''
+        if unique_fields:
+            names = unique_fields if len(unique_fields) == 1 else []
+        elif any(obj.pk is not None for obj in objs):
+            # MySQL upserts on the primary key as well when it is given
+            names = []
+        else:
+            names = [field.name for field in self.model._meta.fields if field.unique and not field.primary_key and not field.is_relation]
+        for name in names:
+            if all(getattr(obj, name) is not None for obj in objs):
+                return name
+        return None
+    
+    def bulk_update(self, objs, fields, batch_size=None):
+        if self.stats_fields.isdisjoint(fields) and self.indexed_fields.isdisjoint(fields):
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+    
+        pks = [obj.pk for obj in objs]
+        with transaction.atomic(using=self.db, savepoint=False):
+            if self.stats_fields.isdisjoint(fields):
+                rows = super().bulk_update(objs, fields, batch_size=batch_size)
+            else:
+                affected = set(self.filter(pk__in=pks).values_list('platform_id', flat=True).distinct())
+                rows = super().bulk_update(objs, fields, batch_size=batch_size)
+                StreamPlatform.objects.filter(pk__in=affected | {obj.platform_id for obj in objs}).recompute_stats()
+            if not self.indexed_fields.isdisjoint(fields):
+                from watchlist_app import search
+                search.index(objs if self.indexed_fields <= set(fields) else WatchList.objects.filter(pk__in=pks).only('id', 'title', 'storyline'))
+        for obj in objs:
+            obj.remember_listing()
+        return rows
+    
+    def update(self, **kwargs):
+        if self.listing_fields.isdisjoint(kwargs):
+            return super().update(**kwargs)
+    
+        with transaction.atomic(using=self.db, savepoint=False):
+            pks = list(self.values_list('pk', flat=True))
+            affected = set(self.values_list('platform_id', flat=True).distinct())
+            rows = super().update(**kwargs)
+            affected |= set(WatchList.objects.filter(pk__in=pks).values_list('platform_id', flat=True).distinct())
+            StreamPlatform.objects.filter(pk__in=affected).recompute_stats()
+        return rows
+    
+
+    def apply_rating(self, total, count):
+        '''shift the running rating sum and count in a single UPDATE, without reading them first'''
+        rating_sum = F('rating_sum') + total
+        number_rating = F('number_rating') + count
+        # MySQL evaluates SET assignments left to right against the already updated row,
+        # so the averages have to be assigned before the columns they are computed from
+        return self.update(
+            avg_rating=rating_average(rating_sum, number_rating),
+            weighted_rating=weighted_average(rating_sum, number_rating),
+            rating_sum=rating_sum,
+            number_rating=number_rating,
+        )
+    
+    def recompute_ratings(self):
+        '''rebuild the rating aggregates of every watchlist in the queryset from its active reviews'''
+        reviews = Review.objects.filter(watchlist=OuterRef('pk'), active=True).order_by().values('watchlist')
+        total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+        count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+        rows = self.update(avg_rating=rating_average(total, count), weighted_rating=weighted_average(total, count),
+                           rating_sum=total, number_rating=count)
+        StreamPlatform.objects.filter(pk__in=self.values('platform_id')).recompute_stats()
+        return rows
+    
 class WatchList(models.Model):
     title         = models.CharField(max_length=50)
     storyline     = models.CharField(max_length=200)
@@ -18,11 +263,108 @@ class WatchList(models.Model):
     active        = models.BooleanField(default=True)
     avg_rating    = models.FloatField(default=0)
     number_rating = models.IntegerField(default=0)
+    rating_sum    = models.IntegerField(default=0)
+    # what the top rated leaderboard ranks by, see weighted_average
+    weighted_rating = models.FloatField(default=prior_mean)
+    imdb_id       = models.CharField(max_length=12, unique=True, null=True, blank=True)
+    imdb_rating   = models.FloatField(null=True, blank=True)
+    imdb_votes    = models.IntegerField(default=0)
     created       = models.DateTimeField(auto_now_add=True)
+    updated       = models.DateTimeField(auto_now=True)
+    
+    objects = WatchListQuerySet.as_manager()
+    
+    rating_fields = ['avg_rating', 'number_rating', 'rating_sum', 'weighted_rating']
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='watchlist_created_id_idx'),
+            models.Index(fields=['platform', 'active', 'created'], name='watchlist_platform_active_idx'),
+            models.Index(fields=['active', '-weighted_rating', '-id'], name='watchlist_top_rated_idx'),
+            models.Index(fields=['platform', 'active', '-weighted_rating', '-id'], name='watchlist_platform_top_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'platform_id', 'active'}.issubset(field_names):
+            instance.remember_listing()
+        return instance
+    
+    @property
+    def listing_state(self):
+        '''the (platform, active) pair that decides which platform statistics this watchlist counts towards'''
+        return (self.platform_id, self.active)
+    
+    def remember_listing(self):
+        self._stored_listing_state = self.listing_state
+    
+    def save(self, *args, **kwargs):
+        # the post_save receiver that moves the platform statistics runs inside this transaction
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(WatchList, instance=self), savepoint=False):
+            super().save(*args, **maintained_separately(self, WatchList.rating_fields, kwargs))
+    
+@tasks.task(batch=True)
+def recompute_watchlist_ratings(batch):
+    '''the task behind recompute_ratings_later(), one recompute of every watchlist in the batch'''
+    WatchList.objects.filter(pk__in={watchlist_id for watchlist_id, in batch}).recompute_ratings()
+    
+def recompute_ratings_later(watchlist_ids):
+    '''rebuild the ratings of the watchlists from their reviews after the write, once for all the writes queued meanwhile'''
+    recompute_watchlist_ratings.defer_many([([watchlist_id], watchlist_id) for watchlist_id in sorted(set(watchlist_ids) - {None})])
+    
+@tasks.task(batch=True)
+def recompute_platform_stats(batch):
+    '''the task behind recompute_stats_later(), one recompute of every platform in the batch'''
+    StreamPlatform.objects.filter(pk__in={platform_id for platform_id, in batch}).recompute_stats()
+    
+def recompute_stats_later(platform_ids):
+    '''rebuild the statistics of the platforms from their watchlists after the write, once for all the writes queued meanwhile'''
+    recompute_platform_stats.defer_many([([platform_id], platform_id) for platform_id in sorted(set(platform_ids) - {None})])
+    
+class ReviewQuerySet(VersionedQuerySet):
+    # writes that skip the model signals keep the watchlist ratings exact by recomputing them,
+    # deferred to watchlist_app.tasks, and send the review statistics of the watchlists back to the table
+    rating_fields = {'rating', 'active', 'watchlist', 'watchlist_id'}
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            affected = {obj.watchlist_id for obj in objs}
+            recompute_ratings_later(affected)
+            review_stats.forget(affected)
+        for obj in objs:
+            obj.remember_rating()
+        return objs
+    
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        if self.rating_fields.union({'created'}).intersection(fields):
+            stored = (getattr(obj, '_stored_rating_state', None) for obj in objs)
+            review_stats.forget({obj.watchlist_id for obj in objs} | {state[0] for state in stored if state})
+        for obj in objs:
+            obj.remember_rating()
+        return rows
+    
+    def update(self, **kwargs):
+        if not self.rating_fields.intersection(kwargs):
+            return super().update(**kwargs)
+    
+        with transaction.atomic(using=self.db):
+            affected = set(self.values_list('watchlist_id', flat=True).distinct())
+            if {'watchlist', 'watchlist_id'}.intersection(kwargs):
+                pks = list(self.values_list('pk', flat=True))
+                rows = super().update(**kwargs)
+                affected |= set(Review.objects.filter(pk__in=pks).values_list('watchlist_id', flat=True).distinct())
+            else:
+                rows = super().update(**kwargs)
+            recompute_ratings_later(affected)
+            review_stats.forget(affected)
+        return rows
+    
 class Review(models.Model):
     review_user = models.ForeignKey(User, on_delete=models.CASCADE)
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
@@ -32,5 +374,86 @@ class Review(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     
+    objects = ReviewQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='review_created_id_idx'),
+            models.Index(fields=['watchlist', 'active', 'created'], name='review_wl_active_created_idx'),
+            models.Index(fields=['review_user', 'created'], name='review_user_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['watchlist', 'review_user'], name='unique_review_per_user'),
+        ]
+    
+    def __str__(self):
+        return f"{self.rating} | {self.watchlist.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {'watchlist_id', 'rating', 'active'}.issubset(field_names):
+            instance.remember_rating()
+        return instance
+    
+    @property
+    def rating_state(self):
+        '''the (watchlist, rating, active) triple that decides what this review adds to a watchlist rating'''
+        return (self.watchlist_id, self.rating, self.active)
+    
+    def remember_rating(self):
+        self._stored_rating_state = self.rating_state
+    
+    def save(self, *args, **kwargs):
+        # the post_save receiver that moves the watchlist rating runs inside this transaction
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Review, instance=self), savepoint=False):
+            super().save(*args, **kwargs)
+            
+class SearchTerm(models.Model):
+    '''a posting of the search index in watchlist_app.search, how strongly term describes a watchlist'''
+    term = models.CharField(max_length=40)
+    watchlist = models.ForeignKey(WatchList, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.FloatField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'watchlist'], name='unique_search_term'),
+        ]
+        
+class SearchTrigram(models.Model):
+    '''the trigrams of every indexed term, which match a misspelled query word to the terms it was meant as'''
+    trigram = models.CharField(max_length=3)
+    term = models.CharField(max_length=40)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'term'], name='unique_search_trigram'),
+        ]
+        
+class Job(models.Model):
+    '''a deferred run of a watchlist_app.tasks task, deleted once it has run'''
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    # unique among pending jobs, claiming a job clears it
+    key = models.CharField(max_length=200, unique=True, null=True)
+    state = models.CharField(max_length=10, default=tasks.PENDING,
+                             choices=[(tasks.PENDING, 'Pending'), (tasks.RUNNING, 'Running'), (tasks.FAILED, 'Failed')])
+    run_after = models.DateTimeField(default=timezone.now)
+    owner = models.CharField(max_length=32, blank=True)
+    claimed = models.DateTimeField(null=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='job_state_id_idx'),
+            models.Index(fields=['state', 'task', 'id'], name='job_state_task_id_idx'),
+            models.Index(fields=['owner'], name='job_owner_idx'),
+        ]
+        
     def __str__(self):
-        return f"{self.rating} | {self.watchlist.title}"
\ No newline at end of file
+        return f"{self.task} {self.args}"
+        
+WatchList._meta.get_field('active').register_lookup(IndexedBooleanExact, lookup_name='exact')
+Review._meta.get_field('active').register_lookup(IndexedBooleanExact, lookup_name='exact')
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+"Viewers who rated this highly also rated" neighbours of every watchlist. A review of LIKE_RATING stars or
+more is a like, and two watchlists are as similar as the cosine of their likes: the viewers who liked both
+over the geometric mean of the viewers who liked each. build() computes the top NEIGHBOURS of every
+watchlist from a sparse viewer x watchlist matrix; refresh() recomputes only the watchlists that reviews
+written since the last build touched. Both write one file of fixed size rows sorted by watchlist, which
+every worker memory-maps rather than reads, and a lookup is a binary search and one row.
+
+numpy and scipy are optional: without them nothing gets built and the endpoint is unavailable.
+"""
+import json
+import os
+from datetime import datetime
+from itertools import chain
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+    
+from watchlist_app.models import Review
+
+# bytes of dense scores worked on at once, the similarities of a block of watchlists to every other one
+BLOCK_BYTES = 64 * 2**20
+
+
+def available():
+    return np is not None and sparse is not None
+    
+def state_path(path):
+    return f'{path}.json'
+    
+def row_dtype(k):
+    return np.dtype([('watchlist', '<i8'), ('neighbours', '<i8', (k,)), ('scores', '<f4', (k,))])
+    
+def liked():
+    return Review.objects.filter(active=True, watchlist__active=True, rating__gte=settings.RECOMMENDATIONS['LIKE_RATING'])
+    
+def pairs(queryset):
+    '''(viewer ids, watchlist ids) of the reviews in queryset, read straight into arrays'''
+    rows = queryset.order_by().values_list('review_user_id', 'watchlist_id').iterator(chunk_size=10_000)
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+    return flat[0::2], flat[1::2]
+    
+def matrix(viewers, watchlists):
+    '''(sorted watchlist ids, viewer x watchlist like matrix with a column per id)'''
+    items, columns = np.unique(watchlists, return_inverse=True)
+    _, rows = np.unique(viewers, return_inverse=True)
+    likes = sparse.csr_matrix((np.ones(len(columns), dtype=np.float32), (rows, columns)),
+                              shape=(rows.max(initial=-1) + 1, len(items)))
+    return items, likes
+    
+def similar(items, likes, targets):
+    '''rows of the top NEIGHBOURS neighbours of the target columns of likes, the viewer x items matrix'''
+    k, min_common = settings.RECOMMENDATIONS['NEIGHBOURS'], settings.RECOMMENDATIONS['MIN_COMMON']
+    counts = np.asarray(likes.sum(axis=0), dtype=np.float32).ravel()
+    rows = np.zeros(len(targets), dtype=row_dtype(k))
+    rows['watchlist'] = items[targets]
+    rows['neighbours'] = -1
+    by_watchlist = likes.T.tocsr()
+    width = min(k, len(items))
+    block = max(1, BLOCK_BYTES // (4 * max(len(items), 1)))
+    
+    for start in range(0, len(targets), block):
+        columns = targets[start:start + block]
+        common = (by_watchlist[columns] @ likes).toarray()
+        common[np.arange(len(columns)), columns] = 0
+        common[common < min_common] = 0
+        scores = common / np.sqrt(counts[columns, None] * counts[None, :])
+    
+        top = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        # most similar first, ties in watchlist order
+        order = np.lexsort((top, -top_scores), axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        found = top_scores > 0
+        rows['neighbours'][start:start + block, :width] = np.where(found, items[top], -1)
+        rows['scores'][start:start + block, :width] = np.where(found, top_scores, 0)
+    # watchlists no one else shares a viewer with have nothing to offer
+    return rows[rows['neighbours'][:, 0] >= 0]
+    
+def build(path=None):
+    '''compute the neighbours of every liked watchlist and replace the file with them, returns the row count'''
+    path = str(path or settings.RECOMMENDATIONS['PATH'])
+    started = timezone.now()
+    items, likes = matrix(*pairs(liked()))
+    rows = similar(items, likes, np.arange(len(items)))
+    save(path, rows, started)
+    return len(rows)
+    
+def refresh(path=None):
+    '''
+    recompute the neighbours of the watchlists reviewed since the last build and of the others their
+    reviewers liked, returns how many. reading the likes is linear, comparing every watchlist with every
+    other is what a build spends its time on. the like counts the other rows were scored with move too,
+    a little, and stay as they were until the next build()
+    '''
+    path = str(path or settings.RECOMMENDATIONS['PATH'])
+    try:
+        with open(state_path(path)) as file:
+            since = datetime.fromisoformat(json.load(file)['built'])
+        current = np.load(path)
+    except (OSError, KeyError, ValueError):
+        return build(path)
+    if current.dtype != row_dtype(settings.RECOMMENDATIONS['NEIGHBOURS']):
+        return build(path)
+    
+    started = timezone.now()
+    # deleted reviews leave nothing behind to find, they are forgotten by the next build()
+    changed = list(Review.objects.filter(updated__gte=since).order_by().values_list('review_user_id', 'watchlist_id'))
+    if not changed:
+        save(path, current, started)
+        return 0
+    changed_viewers, changed_watchlists = (np.array(ids, dtype=np.int64) for ids in zip(*changed))
+    
+    viewers, watchlists = pairs(liked())
+    targets = np.union1d(changed_watchlists, watchlists[np.isin(viewers, changed_viewers)])
+    items, likes = matrix(viewers, watchlists)
+    # targets nobody likes any more lose their row
+    fresh = similar(items, likes, np.flatnonzero(np.isin(items, targets)))
+    
+    rows = np.concatenate([current[~np.isin(current['watchlist'], targets)], fresh])
+    save(path, rows[np.argsort(rows['watchlist'], kind='stable')], started)
+    return len(targets)
+    
+def save(path, rows, built):
+    # replaced whole, workers that mapped the old file keep reading it until they notice
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        np.save(file, rows)
+    os.replace(temporary, path)
+    with open(temporary, 'w') as file:
+        json.dump({'built': built.isoformat(), 'rows': len(rows)}, file)
+    os.replace(temporary, state_path(path))
+    
+class Neighbours:
+    '''the neighbours file of this process, mapped again when a build replaces it'''
+    
+    def __init__(self):
+        self.mapped = (None, None)
+    
+    def rows(self):
+        path = str(settings.RECOMMENDATIONS['PATH'])
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (path, stat.st_ino, stat.st_mtime_ns)
+        mapped_key, rows = self.mapped
+        if mapped_key != key:
+            rows = np.load(path, mmap_mode='r')
+            self.mapped = (key, rows)
+        return rows
+    
+    def get(self, watchlist_id):
+        '''[(watchlist id, similarity)] most similar first'''
+        rows = self.rows()
+        if rows is None or not len(rows):
+            return []
+        ids = rows['watchlist']
+        index = int(np.searchsorted(ids, watchlist_id))
+        if index == len(rows) or ids[index] != watchlist_id:
+            return []
+        row = rows[index]
+        return [(int(neighbour), float(score)) for neighbour, score in zip(row['neighbours'], row['scores']) if neighbour >= 0]
+    
+neighbours = Neighbours()
+
+def also_liked(watchlist_id):
+    return neighbours.get(watchlist_id)
+    
\ No newline at end of file
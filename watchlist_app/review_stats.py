@@ -0,0 +1,119 @@
+"""
+Review statistics of watchlists: the active reviews per star, the inactive reviews and the reviews written
+on each of the last VELOCITY_DAYS days. Each figure of each watchlist is a counter in the response cache.
+Watchlists missing any of theirs are filled in with one grouped query, and review writes move the
+counters with cache.incr() once they commit, which reads nothing and loses nothing to concurrent writers.
+A counter that missed a write, because its watchlist was being filled in at the time, is off until
+REVIEW_STATS['TIMEOUT'] expires it.
+"""
+from collections import Counter
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from watchlist_app import caching
+from watchmate import replicas
+
+RATINGS = range(1, 6)
+
+
+def today():
+    return timezone.now().astimezone(dt_timezone.utc).date().toordinal()
+    
+def days(until):
+    '''the day numbers of the velocity window ending on until, oldest first'''
+    return range(until - settings.REVIEW_STATS['VELOCITY_DAYS'] + 1, until + 1)
+    
+def rating_key(watchlist_id, rating):
+    return f'review-stats:{watchlist_id}:rating:{rating}'
+    
+def inactive_key(watchlist_id):
+    return f'review-stats:{watchlist_id}:inactive'
+    
+def day_key(watchlist_id, day):
+    return f'review-stats:{watchlist_id}:day:{day}'
+    
+def keys(watchlist_id, until):
+    return ([rating_key(watchlist_id, rating) for rating in RATINGS] + [inactive_key(watchlist_id)] +
+            [day_key(watchlist_id, day) for day in days(until)])
+    
+def compute(watchlist_ids, until):
+    '''{counter key: count} of every existing watchlist among watchlist_ids, in one grouped query'''
+    since = datetime.combine(date.fromordinal(days(until)[0]), time.min, tzinfo=dt_timezone.utc)
+    # reviews older than the window share one group per star and state
+    day = Case(When(reviews__created__gte=since, then=TruncDate('reviews__created', tzinfo=dt_timezone.utc)))
+    # looked up rather than imported, the model's bulk writes call forget()
+    watchlists = apps.get_model('watchlist_app', 'WatchList').objects.filter(pk__in=watchlist_ids).order_by()
+    rows = watchlists.annotate(day=day).values_list('id', 'reviews__rating', 'reviews__active', 'day').annotate(count=Count('reviews'))
+    
+    counters = {}
+    for watchlist_id, rating, active, created, count in rows:
+        if watchlist_id not in counters:
+            counters[watchlist_id] = dict.fromkeys(keys(watchlist_id, until), 0)
+        if not count:
+            continue
+        key = rating_key(watchlist_id, rating) if active else inactive_key(watchlist_id)
+        counters[watchlist_id][key] += count
+        if created is not None:
+            counters[watchlist_id][day_key(watchlist_id, created.toordinal())] += count
+    return {key: count for watchlist_counters in counters.values() for key, count in watchlist_counters.items()}
+    
+def present(watchlist_id, counters, until):
+    histogram = {str(rating): counters[rating_key(watchlist_id, rating)] for rating in RATINGS}
+    daily = [counters[day_key(watchlist_id, day)] for day in days(until)]
+    return {
+        'watchlist': watchlist_id,
+        'histogram': histogram,
+        'active_reviews': sum(histogram.values()),
+        'inactive_reviews': counters[inactive_key(watchlist_id)],
+        'recent_reviews': sum(daily),
+        'reviews_per_day': round(sum(daily) / len(daily), 2),
+        'daily_reviews': daily,
+    }
+    
+def get_stats(watchlist_ids):
+    '''{watchlist id: statistics} of the existing watchlists among watchlist_ids'''
+    cache = caching.get_cache()
+    until = today()
+    wanted = {watchlist_id: keys(watchlist_id, until) for watchlist_id in watchlist_ids}
+    counters = cache.get_many([key for watchlist_keys in wanted.values() for key in watchlist_keys])
+    
+    missing = [watchlist_id for watchlist_id, watchlist_keys in wanted.items() if any(key not in counters for key in watchlist_keys)]
+    if missing:
+        # cached for every request after this one, so not from a replica that may lag behind
+        with replicas.primary():
+            computed = compute(missing, until)
+        cache.set_many(computed, settings.REVIEW_STATS['TIMEOUT'])
+        counters.update(computed)
+    return {watchlist_id: present(watchlist_id, counters, until) for watchlist_id in wanted if rating_key(watchlist_id, 1) in counters}
+    
+def shift(*changes):
+    '''apply ((watchlist, rating, active), created, sign) changes to the counters once the transaction commits'''
+    deltas = Counter()
+    for (watchlist_id, rating, active), created, sign in changes:
+        deltas[rating_key(watchlist_id, rating) if active else inactive_key(watchlist_id)] += sign
+        deltas[day_key(watchlist_id, created.astimezone(dt_timezone.utc).date().toordinal())] += sign
+    transaction.on_commit(lambda: apply(deltas))
+    
+def apply(deltas):
+    cache = caching.get_cache()
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # not cached, the next read counts it from the table
+            pass
+    
+def forget(watchlist_ids):
+    '''drop the counters of watchlists whose reviews changed in ways shift() cannot follow'''
+    watchlist_ids = set(watchlist_ids)
+    transaction.on_commit(lambda: caching.get_cache().delete_many(
+        [key for watchlist_id in watchlist_ids for key in keys(watchlist_id, today())]))
+    
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+A full-text index over watchlist titles and storylines kept in two tables, so it behaves the same on
+SQLite and MySQL. SearchTerm holds one weighted posting per (term, watchlist) and SearchTrigram the
+trigrams of every indexed term, which lets a misspelled query word fall back to the terms it resembles.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from watchlist_app import caching
+from watchlist_app.models import SearchTerm, SearchTrigram, WatchList
+
+TITLE_WEIGHT = 3
+MAX_QUERY_TERMS = 8
+# a query word that is not indexed matches up to this many terms at least this similar to it
+CANDIDATES = 3
+MIN_SIMILARITY = 0.3
+
+
+def tokenize(text):
+    '''lowercase words with the accents stripped'''
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    max_length = SearchTerm._meta.get_field('term').max_length
+    return [word for word in re.findall(r'\w+', text) if 1 < len(word) <= max_length]
+    
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+def similarity(first, second):
+    first, second = trigrams(first), trigrams(second)
+    return len(first & second) / len(first | second)
+    
+def postings(watchlist):
+    weights = Counter()
+    for term in tokenize(watchlist.title):
+        weights[term] += TITLE_WEIGHT
+    for term in tokenize(watchlist.storyline):
+        weights[term] += 1
+    return [SearchTerm(term=term, watchlist_id=watchlist.pk, weight=weight) for term, weight in weights.items()]
+    
+def write(watchlists):
+    terms = [posting for watchlist in watchlists for posting in postings(watchlist)]
+    SearchTerm.objects.bulk_create(terms)
+    vocabulary = {posting.term for posting in terms}
+    SearchTrigram.objects.bulk_create(
+        [SearchTrigram(trigram=trigram, term=term) for term in vocabulary for trigram in trigrams(term)],
+        ignore_conflicts=True,
+    )
+    return len(terms)
+    
+def index(watchlists):
+    '''replace the postings of watchlists, called on save() and on the bulk writes of WatchListQuerySet'''
+    watchlists = list(watchlists)
+    with transaction.atomic():
+        SearchTerm.objects.filter(watchlist__in=[watchlist.pk for watchlist in watchlists]).delete()
+        write(watchlists)
+    
+def rebuild(batch_size=2000):
+    '''index every watchlist from scratch, for after writes that go around WatchList. returns (watchlists, postings)'''
+    watchlists = postings_written = 0
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        SearchTrigram.objects.all().delete()
+        batch = []
+        for watchlist in WatchList.objects.only('id', 'title', 'storyline').iterator(chunk_size=batch_size):
+            batch.append(watchlist)
+            if len(batch) == batch_size:
+                postings_written += write(batch)
+                watchlists += len(batch)
+                batch = []
+        postings_written += write(batch)
+        watchlists += len(batch)
+    return watchlists, postings_written
+    
+def document_frequencies(terms):
+    return dict(SearchTerm.objects.filter(term__in=terms).values('term').annotate(df=Count('id')).values_list('term', 'df'))
+    
+def query_weights(query):
+    '''{indexed term: weight} for the words of query, misspelled words replaced by the terms they resemble'''
+    words = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not words:
+        return {}
+    
+    frequencies = document_frequencies(words)
+    factors = {word: 1.0 for word in words if word in frequencies}
+    for word in words:
+        if word in frequencies:
+            continue
+        candidates = (SearchTrigram.objects.filter(trigram__in=trigrams(word)).values('term')
+                      .annotate(shared=Count('id')).order_by('-shared', 'term').values_list('term', flat=True)[:CANDIDATES * 4])
+        scored = sorted(((similarity(word, term), term) for term in candidates), reverse=True)[:CANDIDATES]
+        for score, term in scored:
+            if score >= MIN_SIMILARITY:
+                factors[term] = max(factors.get(term, 0), score)
+    
+    missing = [term for term in factors if term not in frequencies]
+    if missing:
+        frequencies.update(document_frequencies(missing))
+    
+    # rarer terms say more about a title
+    total = caching.versioned('search:watchlists', (WatchList,), WatchList.objects.count)
+    return {term: factor * math.log(1 + total / frequencies[term]) for term, factor in factors.items() if term in frequencies}
+    
+def search(query):
+    '''the watchlists matching query, annotated with a relevance score'''
+    weights = query_weights(query)
+    if not weights:
+        return WatchList.objects.annotate(score=Value(0.0)).none()
+    
+    relevance = Case(*[When(search_terms__term=term, then=Value(weight)) for term, weight in weights.items()],
+                     default=Value(0.0), output_field=FloatField())
+    return WatchList.objects.filter(search_terms__term__in=weights).annotate(score=Sum(F('search_terms__weight') * relevance))
+    
\ No newline at end of file
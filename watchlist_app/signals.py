@@ -0,0 +1,111 @@
+from collections import Counter
+
+from django.db.models import Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from watchlist_app import review_stats, search, tasks
+from watchlist_app.caching import bump_version
+from watchlist_app.models import Review, StreamPlatform, WatchList, recompute_ratings_later, recompute_stats_later, shift_stats
+
+
+def shift_ratings(*changes):
+    '''
+    apply (rating_state, sign) pairs to the watchlist aggregates and to the statistics of the platforms
+    the watchlists are active on, one UPDATE of each per touched watchlist
+    '''
+    totals, counts = Counter(), Counter()
+    for (watchlist_id, rating, active), sign in changes:
+        if active:
+            totals[watchlist_id] += sign * rating
+            counts[watchlist_id] += sign
+    for watchlist_id in totals.keys() | counts.keys():
+        if totals[watchlist_id] or counts[watchlist_id]:
+            WatchList.objects.filter(pk=watchlist_id).apply_rating(totals[watchlist_id], counts[watchlist_id])
+            listed = WatchList.objects.filter(pk=watchlist_id, active=True).values('platform_id')
+            StreamPlatform.objects.filter(pk=Subquery(listed)).apply_stats(0, totals[watchlist_id], counts[watchlist_id])
+
+# connected ahead of update_rating_on_save, which makes the saved state the stored one
+@receiver(post_save, sender=Review)
+def update_review_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_stored_rating_state', None)
+    if raw or (previous is None and not created):
+        review_stats.forget([instance.watchlist_id])
+    elif created:
+        review_stats.shift((instance.rating_state, instance.created, 1))
+    elif previous != instance.rating_state:
+        review_stats.shift((previous, instance.created, -1), (instance.rating_state, instance.created, 1))
+    
+@receiver(post_delete, sender=Review)
+def update_review_stats_on_delete(sender, instance, **kwargs):
+    review_stats.shift((getattr(instance, '_stored_rating_state', instance.rating_state), instance.created, -1))
+    
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_stored_rating_state', None)
+    if raw or (previous is None and not created):
+        # fixtures carry their own aggregates and an unloaded instance says nothing
+        # about the row it replaced, so rebuild from the table
+        recompute_ratings_later([instance.watchlist_id])
+    elif not tasks.eager():
+        # a worker rebuilds them, once for every review a busy title gets meanwhile,
+        # rather than every writer queueing on the lock of the title's row
+        if created or previous != instance.rating_state:
+            recompute_ratings_later([instance.watchlist_id, previous[0] if previous else None])
+    elif created:
+        shift_ratings((instance.rating_state, 1))
+    else:
+        shift_ratings((previous, -1), (instance.rating_state, 1))
+    instance.remember_rating()
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    state = getattr(instance, '_stored_rating_state', instance.rating_state)
+    if tasks.eager():
+        shift_ratings((state, -1))
+    else:
+        recompute_ratings_later([state[0]])
+    
+@receiver(post_save, sender=WatchList)
+def update_platform_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_stored_listing_state', None)
+    if created and not raw:
+        shift_stats((instance.listing_state, instance.rating_sum, instance.number_rating, 1))
+    elif raw or previous != instance.listing_state:
+        # moved, listed or unlisted, or nothing is known about the row it replaced
+        platforms = {instance.platform_id, previous[0] if previous else None} - {None}
+        StreamPlatform.objects.filter(pk__in=platforms).recompute_stats()
+    instance.remember_listing()
+    
+@receiver(post_delete, sender=WatchList)
+def update_platform_stats_on_delete(sender, instance, **kwargs):
+    state = getattr(instance, '_stored_listing_state', instance.listing_state)
+    if tasks.eager():
+        # the cascade deleted the reviews first, and they took their ratings off the platform with them
+        shift_stats((state, 0, 0, -1))
+    else:
+        # the reviews only queued recomputes of a watchlist that is gone. take off what it counted for
+        # as loaded, and have a worker rebuild the platform from the table in case that was stale
+        shift_stats((state, instance.rating_sum, instance.number_rating, -1))
+        recompute_stats_later([state[0]])
+    
+@receiver(post_delete, sender=WatchList)
+def forget_review_stats_on_delete(sender, instance, **kwargs):
+    # the cascade moved the counters of its reviews, the counters themselves would outlive the watchlist
+    review_stats.forget([instance.pk])
+    
+@receiver(post_save, sender=WatchList)
+def index_watchlist(sender, instance, update_fields=None, **kwargs):
+    # postings go with their watchlist through the foreign key cascade, a save replaces them
+    if update_fields is None or {'title', 'storyline'}.intersection(update_fields):
+        search.index([instance])
+    
+@receiver(post_save, sender=WatchList)
+@receiver(post_save, sender=StreamPlatform)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=WatchList)
+@receiver(post_delete, sender=StreamPlatform)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_version(sender)
+    
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Work a write can leave for later. Deferring a task inserts a Job row in the write's own transaction, so the
+job exists exactly when the write committed, and `python manage.py run_tasks` runs the jobs from a pool of
+threads. A job deferred with a key is dropped while a pending job has the same key, and a batch task is
+handed every due job of its kind at once, up to BATCH_SIZE of them: a title reviewed 500 times before a
+worker gets to it is recomputed once. A task runs in a transaction with the deletion of its jobs, and one
+that raises is retried after RETRY_DELAY seconds, twice as long each time, until it has been tried
+MAX_ATTEMPTS times and is kept as failed. With EAGER, as in development, a task runs where it is deferred.
+"""
+import logging
+import threading
+import traceback
+import uuid
+from importlib import import_module
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger('watchmate.tasks')
+
+PENDING, RUNNING, FAILED = 'pending', 'running', 'failed'
+
+registry = {}
+
+# the threads of a worker take turns to claim, SQLite has no row locks to keep them apart
+claiming = threading.Lock()
+
+
+def job_model():
+    # looked up rather than imported, watchlist_app.models defers tasks of its own
+    return apps.get_model('watchlist_app', 'Job')
+    
+def eager():
+    return settings.TASKS['EAGER']
+    
+class Task:
+    '''a function that runs after the write that defers it, see task()'''
+    
+    def __init__(self, function, batch):
+        self.function = function
+        self.batch = batch
+        self.name = f'{function.__module__}.{function.__qualname__}'
+    
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+    
+    def defer(self, *args, key=None):
+        '''run the task with the JSON serializable args later, not again for a key already pending'''
+        self.defer_many([(args, key)])
+    
+    def defer_many(self, calls):
+        '''defer a run for every (args, key) pair of calls, in one INSERT'''
+        calls = [(list(args), key) for args, key in calls]
+        if not calls:
+            return
+        if eager():
+            self.run([args for args, key in calls])
+            return
+        Job = job_model()
+        Job.objects.bulk_create([Job(task=self.name, args=args, key=None if key is None else f'{self.name}:{key}')
+                                 for args, key in calls], ignore_conflicts=True)
+    
+    def run(self, batch):
+        '''run the task for a list of argument lists, a batch task takes them all in one call'''
+        if self.batch:
+            self.function(batch)
+        else:
+            for args in batch:
+                self.function(*args)
+    
+def task(batch=False):
+    '''
+    register the decorated function as a task. a batch task is called with the argument lists of
+    every job in the batch and has to be as good as calling it once for each
+    '''
+    def register(function):
+        registered = Task(function, batch)
+        registry[registered.name] = registered
+        return registered
+    return register
+    
+def lookup(name):
+    '''the task registered as name, importing its module when nothing has yet, as a worker may not have'''
+    if name not in registry:
+        try:
+            import_module(name.rsplit('.', 1)[0])
+        except ImportError:
+            pass
+    return registry.get(name)
+    
+def claim(batch_size):
+    '''mark the oldest due job running, with the other due jobs of its task if that is a batch task, and return them'''
+    Job = job_model()
+    now = timezone.now()
+    due = Job.objects.filter(state=PENDING, run_after__lte=now).order_by('id')
+    # row locks keep workers off each other's jobs where the database has them. SQLite locks the whole
+    # database instead, and a transaction that read first cannot wait for a writer to be done, so there
+    # the UPDATE claims whichever of the rows are still pending and the owner token tells which it got
+    locking = connections[Job.objects.db].features.has_select_for_update
+    with claiming, transaction.atomic() if locking else nullcontext():
+        name = due.select_for_update(skip_locked=True).values_list('task', flat=True).first()
+        if name is None:
+            return []
+        registered = lookup(name)
+        limit = batch_size if registered is not None and registered.batch else 1
+        ids = list(due.filter(task=name).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        owner = uuid.uuid4().hex
+        # a write from now on defers a job of its own, this one may have read the rows before it
+        due.filter(pk__in=ids).update(state=RUNNING, key=None, owner=owner, claimed=now, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(owner=owner).order_by('id'))
+    
+def run(jobs):
+    '''run the claimed jobs of one task, False when they failed and were put back or given up on'''
+    Job = job_model()
+    registered = lookup(jobs[0].task)
+    try:
+        if registered is None:
+            raise LookupError(f'no task is registered as {jobs[0].task}')
+        with transaction.atomic():
+            registered.run([job.args for job in jobs])
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+    except Exception:
+        logger.exception('%s failed for %d jobs', jobs[0].task, len(jobs))
+        retry(jobs, traceback.format_exc())
+        return False
+    return True
+    
+def retry(jobs, error):
+    Job = job_model()
+    now = timezone.now()
+    for job in jobs:
+        if job.attempts >= settings.TASKS['MAX_ATTEMPTS']:
+            changes = {'state': FAILED}
+        else:
+            changes = {'state': PENDING, 'run_after': now + timedelta(seconds=settings.TASKS['RETRY_DELAY'] * 2 ** (job.attempts - 1))}
+        Job.objects.filter(pk=job.pk).update(owner='', error=error, **changes)
+    
+def requeue_stale():
+    '''put back the jobs that have been running for longer than TIMEOUT, their worker is taken to be gone'''
+    Job = job_model()
+    stale = Job.objects.filter(state=RUNNING, claimed__lt=timezone.now() - timedelta(seconds=settings.TASKS['TIMEOUT']))
+    given_up = stale.filter(attempts__gte=settings.TASKS['MAX_ATTEMPTS']).update(state=FAILED, owner='', error='timed out')
+    return given_up + stale.update(state=PENDING, owner='')
+    
+def work(stop, batch_size=None, once=False, between=None):
+    '''
+    claim and run jobs until stop is set, or with once until none is due, and return how many ran.
+    between is called before every claim, the place for a thread's connection housekeeping
+    '''
+    batch_size = batch_size or settings.TASKS['BATCH_SIZE']
+    done = 0
+    while not stop.is_set():
+        if between is not None:
+            between()
+        try:
+            jobs = claim(batch_size)
+            if not jobs:
+                requeue_stale()
+        except DatabaseError as error:
+            # a worker outlives a busy or restarting database
+            logger.warning('the job queue is unavailable: %s', error)
+            jobs = None
+        if jobs:
+            if run(jobs):
+                done += len(jobs)
+        elif once and jobs is not None:
+            break
+        else:
+            stop.wait(settings.TASKS['POLL_INTERVAL'])
+    return done
+    
\ No newline at end of file
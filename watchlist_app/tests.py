@@ -1,16 +1,56 @@
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, Q, Sum
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve as urls_resolve, reverse
+from django.utils import timezone
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.exceptions import NotFound
+
+from user_app.api.authentication import token_cache
+from watchlist_app.api import asynchronous, export, fastpath, pagination, serializers, throttling, urls, views
+from watchlist_app import leaderboards, models, recommendations, tasks
+from watchmate import instrumentation, replicas
 
-from watchlist_app.api import serializers
-from watchlist_app import models
+# the global anon and user rates apply to every request, lift them for tests that browse
+unthrottled = mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'anon': None, 'user': None})
+
+# tasks run where they are deferred in development, as they are queued in production
+deferred = override_settings(TASKS={**settings.TASKS, 'EAGER': False})
+
+@tasks.task()
+def failing_task(message):
+    raise ValueError(message)
+    
 
 class StreamPlatformTestCase(APITestCase):
     
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="example", password="Password@123")
         self.token = Token.objects.get(user__username = self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
@@ -38,6 +78,7 @@ class StreamPlatformTestCase(APITestCase):
 class WatchListTestCase(APITestCase):
     
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="example", password="Password@123")
         self.token = Token.objects.get(user__username = self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
@@ -69,6 +110,7 @@ class WatchListTestCase(APITestCase):
 class ReviewTestCase(APITestCase):
     
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="example", password="Password@123")
         self.token = Token.objects.get(user__username = self.user)
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
@@ -138,4 +180,2073 @@ class ReviewTestCase(APITestCase):
         
     def test_review_user(self):
         response = self.client.get("/api/watch/user-reviews/?username=" + self.user.username)
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+@deferred
+class QueryBudgetTestCase(APITestCase):
+    '''every route in watchlist_app.api.urls must answer in a fixed number of queries'''
+    
+    budgets = {
+        'movie-list': 2,
+        'movie-details': 3,
+        'movie-bulk': 16,
+        'movie-search': 6,
+        'movie-also-liked': 2,
+        'movie-export': 2,
+        'movie-stats': 2,
+        'movie-stats-batch': 2,
+        'movie-top-rated': 2,
+        'movie-trending': 3,
+        'stream-list': 2,
+        'stream-details': 3,
+        'stream-bulk': 6,
+        'stream-export': 2,
+        'stream-top-rated': 2,
+        'stream-trending': 3,
+        'review-create': 6,
+        'reviews-list': 2,
+        'reviews-detail': 3,
+        'reviews-export': 2,
+        'user-reviews': 2,
+    }
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="example", password="Password@123", is_staff=True)
+        self.token = Token.objects.get(user__username = self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", active=True, platform=self.stream)
+        self.review = models.Review.objects.create(review_user=self.user, rating=5, description="An okay movie", watchlist=self.watchlist)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def seed(self, count):
+        for i in range(count):
+            stream = models.StreamPlatform.objects.create(name=f"Platform {i}", about="about", website="https://example.com")
+            watchlist = models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=stream)
+            models.WatchList.objects.create(title=f"Movie {i} II", storyline="story", platform=self.stream)
+            user = User.objects.create_user(username=f"user{i}", password="Password@123")
+            models.Review.objects.create(review_user=user, rating=3, watchlist=watchlist)
+            models.Review.objects.create(review_user=user, rating=4, watchlist=self.watchlist)
+            
+    def request(self, name):
+        # throttle history lives in the cache, keep it from tripping between requests,
+        # and budget for a cold token lookup
+        cache.clear()
+        token_cache.clear()
+        if name == 'review-create':
+            watchlist = models.WatchList.objects.create(title="Fresh movie", storyline="story", platform=self.stream)
+            with self.assertNumQueries(self.budgets[name]):
+                return self.client.post(reverse(name, args=(watchlist.id,)), data={"rating": 4, "description": "Good", "active": True})
+        
+        if name == 'movie-also-liked':
+            also_liked = models.WatchList.objects.create(title="Liked too", storyline="story", platform=self.stream)
+            models.Review.objects.create(review_user=self.user, rating=5, watchlist=also_liked)
+            with tempfile.TemporaryDirectory() as directory, override_settings(RECOMMENDATIONS={
+                    **settings.RECOMMENDATIONS, 'PATH': os.path.join(directory, 'neighbours.npy'), 'MIN_COMMON': 1}):
+                recommendations.build()
+                with self.assertNumQueries(self.budgets[name]):
+                    return self.client.get(reverse(name, args=(self.watchlist.id,)))
+        
+        # a fixed mix of inserts, one changed row and one unchanged row
+        if name == 'movie-bulk':
+            items = [{"title": f"Bulk {i}", "storyline": "story", "platform": "Netflix"} for i in range(3)]
+            items.append({"id": self.watchlist.id, "title": f"Renamed {models.WatchList.objects.count()}", "storyline": "Example story", "platform": self.stream.id})
+            with self.assertNumQueries(self.budgets[name]):
+                return self.client.post(reverse(name), data=items, format='json')
+        if name == 'stream-bulk':
+            items = [{"name": f"Bulk {i}", "about": "about", "website": "https://example.com"} for i in range(3)]
+            items.append({"id": self.stream.id, "name": "Netflix", "about": f"{models.StreamPlatform.objects.count()} platforms", "website": "https://neflix.com"})
+            with self.assertNumQueries(self.budgets[name]):
+                return self.client.post(reverse(name), data=items, format='json')
+        
+        args = {
+            'movie-details': (self.watchlist.id,),
+            'stream-details': (self.stream.id,),
+            'reviews-list': (self.watchlist.id,),
+            'reviews-detail': (self.review.id,),
+            'movie-stats': (self.watchlist.id,),
+            'stream-top-rated': (self.stream.id,),
+            'stream-trending': (self.stream.id,),
+        }.get(name, ())
+        url = reverse(name, args=args)
+        if name == 'user-reviews':
+            url += '?username=' + self.user.username
+        if name == 'movie-search':
+            url += '?q=example movei'
+        if name == 'movie-stats-batch':
+            url += f'?ids={self.watchlist.id},{self.watchlist.id + 1},0'
+        with self.assertNumQueries(self.budgets[name]):
+            response = self.client.get(url)
+            # exports query while their body streams out
+            if response.streaming:
+                response.content_length = sum(map(len, response.streaming_content))
+            return response
+        
+    def test_every_route_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names - set(self.budgets), set())
+        
+    def test_budget_is_independent_of_row_count(self):
+        for rows in (0, 10):
+            self.seed(rows)
+            for name in self.budgets:
+                if name == 'movie-also-liked' and not recommendations.available():
+                    continue
+                with self.subTest(name=name, rows=rows):
+                    response = self.request(name)
+                    self.assertLess(response.status_code, 400)
+                    
+@unthrottled
+class PaginationTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        for i in range(25):
+            models.WatchList.objects.create(title=f"Movie {i}", storyline="Example story", platform=self.stream)
+            
+    def test_watchlist_pages_are_disjoint(self):
+        seen = []
+        url = reverse('movie-list')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 10)
+            seen += [movie['id'] for movie in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(models.WatchList.objects.values_list('id', flat=True)))
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        
+    def test_count_is_opt_in(self):
+        response = self.client.get(reverse('movie-list'))
+        self.assertNotIn('count', response.data)
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('movie-list') + '?count=true&size=5')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+        
+    def test_streamplatform_list_is_paginated(self):
+        response = self.client.get(reverse('stream-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], "Netflix")
+        self.assertIsNone(response.data['next'])
+        
+class RatingAggregateTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        self.other = models.WatchList.objects.create(title="Other movie", storyline="Example story", platform=self.stream)
+        self.users = [User.objects.create_user(username=f"user{i}", password="Password@123") for i in range(4)]
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def assertRating(self, watchlist, total, count):
+        watchlist.refresh_from_db()
+        self.assertEqual((watchlist.rating_sum, watchlist.number_rating), (total, count))
+        self.assertAlmostEqual(watchlist.avg_rating, total / count if count else 0)
+        
+    def test_create_update_delete(self):
+        first = models.Review.objects.create(review_user=self.users[0], rating=5, watchlist=self.watchlist)
+        second = models.Review.objects.create(review_user=self.users[1], rating=2, watchlist=self.watchlist)
+        models.Review.objects.create(review_user=self.users[2], rating=4, watchlist=self.watchlist)
+        self.assertRating(self.watchlist, 11, 3)
+        
+        second.rating = 3
+        second.save()
+        self.assertRating(self.watchlist, 12, 3)
+        
+        second.active = False
+        second.save()
+        self.assertRating(self.watchlist, 9, 2)
+        
+        first.watchlist = self.other
+        first.save()
+        self.assertRating(self.watchlist, 4, 1)
+        self.assertRating(self.other, 5, 1)
+        
+        models.Review.objects.get(pk=first.pk).delete()
+        self.assertRating(self.other, 0, 0)
+        
+    def test_review_detail_update_and_delete(self):
+        review = models.Review.objects.create(review_user=self.users[0], rating=5, watchlist=self.watchlist)
+        token = Token.objects.get(user=self.users[0])
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        
+        response = self.client.put(reverse("reviews-detail", args=(review.id,)), data={"rating": 1, "description": "Worse on rewatch"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRating(self.watchlist, 1, 1)
+        
+        cache.clear()
+        response = self.client.delete(reverse("reviews-detail", args=(review.id,)))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertRating(self.watchlist, 0, 0)
+        
+    def test_bulk_writes(self):
+        reviews = models.Review.objects.bulk_create([
+            models.Review(review_user=user, rating=rating, watchlist=self.watchlist)
+            for user, rating in zip(self.users, [1, 2, 3, 4])
+        ])
+        self.assertRating(self.watchlist, 10, 4)
+        
+        models.Review.objects.filter(rating__lte=2).update(active=False)
+        self.assertRating(self.watchlist, 7, 2)
+        
+        reviews[3].watchlist = self.other
+        models.Review.objects.bulk_update(reviews, ['watchlist'])
+        self.assertRating(self.watchlist, 3, 1)
+        self.assertRating(self.other, 4, 1)
+        
+        models.Review.objects.all().delete()
+        self.assertRating(self.watchlist, 0, 0)
+        self.assertRating(self.other, 0, 0)
+        
+        
+class PlatformStatsTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.platforms = [models.StreamPlatform.objects.create(name=name, about="about", website="https://example.com")
+                          for name in ["Netflix", "Prime", "Hulu"]]
+        self.users = [User.objects.create_user(username=f"user{i}", password="Password@123") for i in range(6)]
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def assertReconciled(self):
+        '''the maintained statistics of every platform against a recomputation from the reviews'''
+        # deferred recomputes land once a worker has run them
+        tasks.work(threading.Event(), once=True)
+        listed = Q(watchlist__active=True, watchlist__reviews__active=True)
+        expected = models.StreamPlatform.objects.annotate(
+            titles=Count('watchlist', filter=Q(watchlist__active=True), distinct=True),
+            total=Sum('watchlist__reviews__rating', filter=listed),
+            reviews=Count('watchlist__reviews', filter=listed),
+        )
+        for platform in expected:
+            with self.subTest(platform=platform.name):
+                self.assertEqual((platform.active_titles, platform.rating_sum, platform.number_rating),
+                                 (platform.titles, platform.total or 0, platform.reviews))
+                self.assertAlmostEqual(platform.avg_rating, (platform.total or 0) / platform.reviews if platform.reviews else 0)
+        
+    def test_single_writes(self):
+        netflix, prime, hulu = self.platforms
+        first = models.WatchList.objects.create(title="First", storyline="story", platform=netflix)
+        second = models.WatchList.objects.create(title="Second", storyline="story", platform=netflix, active=False)
+        review = models.Review.objects.create(review_user=self.users[0], rating=4, watchlist=first)
+        models.Review.objects.create(review_user=self.users[1], rating=2, watchlist=first)
+        models.Review.objects.create(review_user=self.users[0], rating=5, watchlist=second)
+        self.assertReconciled()
+        netflix.refresh_from_db()
+        self.assertEqual((netflix.active_titles, netflix.number_rating, netflix.avg_rating), (1, 2, 3.0))
+        
+        review.rating = 1
+        review.save()
+        second.active = True
+        second.save()
+        self.assertReconciled()
+        
+        first.platform = prime
+        first.save()
+        self.assertReconciled()
+        
+        review.delete()
+        models.WatchList.objects.get(pk=second.pk).delete()
+        self.assertReconciled()
+        
+        # a stale instance saved over the row leaves the statistics alone
+        stale = models.StreamPlatform.objects.get(pk=prime.pk)
+        models.Review.objects.create(review_user=self.users[2], rating=3, watchlist=first)
+        stale.about = "Renamed"
+        stale.save()
+        self.assertReconciled()
+        
+    def test_bulk_writes(self):
+        netflix, prime, hulu = self.platforms
+        watchlists = models.WatchList.objects.bulk_create([
+            models.WatchList(title=f"Movie {i}", storyline="story", platform=self.platforms[i % 3], active=i % 4 != 0, imdb_id=f"tt{i:07}")
+            for i in range(12)
+        ])
+        models.Review.objects.bulk_create([
+            models.Review(review_user=user, rating=(i + j) % 5 + 1, watchlist=watchlist)
+            for i, watchlist in enumerate(watchlists) for j, user in enumerate(self.users[:3])
+        ])
+        self.assertReconciled()
+        
+        models.WatchList.objects.filter(platform=netflix).update(active=False)
+        self.assertReconciled()
+        models.WatchList.objects.filter(platform=prime).update(platform=hulu)
+        self.assertReconciled()
+        for watchlist in watchlists[:4]:
+            watchlist.platform = prime
+        models.WatchList.objects.bulk_update(watchlists[:4], ['platform'])
+        self.assertReconciled()
+        models.Review.objects.filter(rating__gte=4).update(active=False)
+        self.assertReconciled()
+        
+        # upserts as the IMDb import runs them: existing rows keep counting as they did
+        models.WatchList.objects.bulk_create(
+            [models.WatchList(title=f"Upserted {i}", storyline="story", platform=netflix, imdb_id=f"tt{i:07}") for i in range(8, 16)],
+            update_conflicts=True, update_fields=['title'], unique_fields=['imdb_id'],
+        )
+        self.assertReconciled()
+        models.WatchList.objects.bulk_create(
+            [models.WatchList(title=f"Moved {i}", storyline="story", platform=netflix, imdb_id=f"tt{i:07}") for i in range(4)],
+            update_conflicts=True, update_fields=['platform'], unique_fields=['imdb_id'],
+        )
+        self.assertReconciled()
+        
+        models.Review.objects.filter(watchlist__platform=hulu).delete()
+        models.WatchList.objects.filter(platform=prime).delete()
+        self.assertReconciled()
+        
+    def test_random_writes(self):
+        rng = random.Random(0)
+        watchlists = []
+        for step in range(200):
+            action = rng.random()
+            if action < 0.2 or not watchlists:
+                watchlists.append(models.WatchList.objects.create(title=f"Movie {step}", storyline="story",
+                                                                  platform=rng.choice(self.platforms), active=rng.random() < 0.8))
+            elif action < 0.55:
+                watchlist, user = rng.choice(watchlists), rng.choice(self.users)
+                models.Review.objects.update_or_create(review_user=user, watchlist=watchlist,
+                                                       defaults={'rating': rng.randint(1, 5), 'active': rng.random() < 0.9})
+            elif action < 0.7:
+                review = models.Review.objects.order_by('?').first()
+                if review:
+                    review.delete()
+            elif action < 0.85:
+                watchlist = models.WatchList.objects.get(pk=rng.choice(watchlists).pk)
+                watchlist.active = not watchlist.active
+                if rng.random() < 0.5:
+                    watchlist.platform = rng.choice(self.platforms)
+                watchlist.save()
+            else:
+                watchlist = watchlists.pop(rng.randrange(len(watchlists)))
+                models.WatchList.objects.get(pk=watchlist.pk).delete()
+        self.assertReconciled()
+        
+    @deferred
+    def test_deferred_single_writes(self):
+        self.test_single_writes()
+        
+    @deferred
+    def test_deferred_bulk_writes(self):
+        self.test_bulk_writes()
+        
+    @deferred
+    def test_deferred_random_writes(self):
+        self.test_random_writes()
+        
+    @deferred
+    def test_deferred_watchlist_delete(self):
+        netflix = self.platforms[0]
+        first = models.WatchList.objects.create(title="First", storyline="story", platform=netflix)
+        second = models.WatchList.objects.create(title="Second", storyline="story", platform=netflix)
+        models.Review.objects.create(review_user=self.users[0], rating=5, watchlist=first)
+        models.Review.objects.create(review_user=self.users[0], rating=1, watchlist=second)
+        self.assertReconciled()
+        
+        models.WatchList.objects.get(pk=first.pk).delete()
+        # right before a worker comes by
+        netflix.refresh_from_db()
+        self.assertEqual((netflix.active_titles, netflix.rating_sum, netflix.number_rating, netflix.avg_rating), (1, 1, 1, 1.0))
+        self.assertReconciled()
+        
+    @unthrottled
+    def test_served_by_the_stream_endpoints(self):
+        netflix = self.platforms[0]
+        watchlist = models.WatchList.objects.create(title="First", storyline="story", platform=netflix)
+        models.Review.objects.create(review_user=self.users[0], rating=4, watchlist=watchlist)
+        staff = User.objects.create_user(username="staff", password="Password@123", is_staff=True)
+        self.client.force_authenticate(user=staff)
+        
+        response = self.client.get(reverse('stream-details', args=(netflix.id,)))
+        self.assertEqual((response.data['active_titles'], response.data['number_rating'], response.data['avg_rating']), (1, 1, 4.0))
+        self.assertNotIn('watchlist', response.data)
+        response = self.client.get(reverse('stream-list') + '?fields=name,active_titles,avg_rating')
+        self.assertEqual(response.data['results'][0], {'name': 'Netflix', 'active_titles': 1, 'avg_rating': 4.0})
+        
+        # the statistics are read only
+        response = self.client.put(reverse('stream-details', args=(netflix.id,)),
+                                   data={"name": "Netflix", "about": "about", "website": "https://example.com", "active_titles": 99})
+        self.assertEqual(response.data['active_titles'], 1)
+        self.assertReconciled()
+        
+    @unthrottled
+    def test_platform_delete(self):
+        netflix, prime, hulu = self.platforms
+        staff = User.objects.create_user(username="staff", password="Password@123", is_staff=True)
+        self.client.force_authenticate(user=staff)
+        
+        def delete(platform, titles):
+            watchlists = [models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=platform) for i in range(titles)]
+            for watchlist in watchlists:
+                for user in self.users[:3]:
+                    models.Review.objects.create(review_user=user, rating=4, watchlist=watchlist)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(reverse('stream-details', args=(platform.id,)))
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            self.assertFalse(models.WatchList.objects.filter(platform=platform.id).exists())
+            self.assertFalse(models.Review.objects.filter(watchlist__in=[watchlist.id for watchlist in watchlists]).exists())
+            self.assertFalse(models.SearchTerm.objects.filter(watchlist__in=[watchlist.id for watchlist in watchlists]).exists())
+            return len(queries)
+        
+        kept = models.WatchList.objects.create(title="Kept", storyline="story", platform=hulu)
+        models.Review.objects.create(review_user=self.users[0], rating=2, watchlist=kept)
+        # a statement per table whatever the platform holds
+        self.assertEqual(delete(netflix, 1), delete(prime, 5))
+        self.assertEqual(list(models.StreamPlatform.objects.all()), [hulu])
+        self.assertReconciled()
+        
+        response = self.client.delete(reverse('stream-details', args=(netflix.id,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_purge_covers_every_relation(self):
+        '''StreamPlatformQuerySet.purge() deletes table by table, a new relation to what it deletes has to be added there'''
+        purged = (models.StreamPlatform, models.WatchList, models.Review, models.SearchTerm)
+        relations = {(field.model.__name__, field.related_model.__name__, field.name)
+                     for model in purged for field in model._meta.get_fields(include_hidden=True)
+                     if field.many_to_many or (field.is_relation and field.auto_created and not field.concrete)}
+        self.assertEqual(relations, {
+            ('StreamPlatform', 'WatchList', 'watchlist'),
+            ('WatchList', 'Review', 'reviews'),
+            ('WatchList', 'SearchTerm', 'search_terms'),
+        })
+        
+        
+class ConcurrentRatingTestCase(TransactionTestCase):
+    
+    def test_parallel_creates_keep_exact_totals(self):
+        stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=stream)
+        users = [User.objects.create(username=f"user{i}") for i in range(24)]
+        barrier = threading.Barrier(len(users))
+        
+        def review(user, rating):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        return models.Review.objects.create(review_user=user, rating=rating, watchlist=watchlist)
+                    except OperationalError:
+                        # SQLite refuses a second concurrent writer instead of queueing it
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+            
+        ratings = [i % 5 + 1 for i in range(len(users))]
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            list(executor.map(review, users, ratings))
+            
+        watchlist.refresh_from_db()
+        self.assertEqual(watchlist.number_rating, len(users))
+        self.assertEqual(watchlist.rating_sum, sum(ratings))
+        self.assertAlmostEqual(watchlist.avg_rating, sum(ratings) / len(users))
+        
+        
+@skipUnless(connection.vendor == 'sqlite', "query plans are checked against SQLite")
+class ReviewIndexTestCase(APITestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create(username="example")
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        models.Review.objects.create(review_user=self.user, rating=5, watchlist=self.watchlist)
+        
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+        
+    def test_review_list_uses_watchlist_index(self):
+        queryset = models.Review.objects.filter(watchlist=self.watchlist.id, active=True).order_by('-created')
+        self.assertUsesIndex(queryset, 'review_wl_active_created_idx')
+        
+    def test_user_reviews_use_user_index(self):
+        queryset = models.Review.objects.filter(review_user__username=self.user.username).order_by('-created')
+        self.assertUsesIndex(queryset, 'review_user_created_idx')
+        
+    def test_platform_catalog_uses_platform_index(self):
+        queryset = models.WatchList.objects.filter(platform=self.stream, active=True).order_by('-created')
+        self.assertUsesIndex(queryset, 'watchlist_platform_active_idx')
+        
+    def test_duplicate_review_is_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Review.objects.create(review_user=self.user, rating=1, watchlist=self.watchlist)
+            
+    def test_other_integrity_errors_are_not_taken_for_duplicates(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username="other"))
+        url = reverse("review-create", args=(self.watchlist.id,))
+        with mock.patch.object(serializers.ReviewSerializer, 'save', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.client.post(url, data={"rating": 4, "description": "Good", "active": True})
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"rating": 4, "description": "Good", "active": True})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            
+            
+@unthrottled
+class ResponseCacheTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example")
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        
+    def assertServedFromCache(self, url):
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.json(), second.json())
+        
+    def test_catalog_reads_are_cached(self):
+        self.assertServedFromCache(reverse('movie-list'))
+        self.assertServedFromCache(reverse('movie-details', args=(self.watchlist.id,)))
+        self.assertServedFromCache(reverse('stream-list'))
+        self.assertServedFromCache(reverse('stream-details', args=(self.stream.id,)))
+        
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with self.settings(CACHES={'default': backend}):
+                self.assertServedFromCache(reverse('movie-details', args=(self.watchlist.id,)))
+                
+                self.watchlist.title = "Renamed movie"
+                self.watchlist.save()
+                response = self.client.get(reverse('movie-details', args=(self.watchlist.id,)))
+                self.assertEqual(response.data['title'], "Renamed movie")
+        
+    def test_writes_invalidate_immediately(self):
+        url = reverse('movie-details', args=(self.watchlist.id,))
+        self.client.get(url)
+        
+        models.Review.objects.create(review_user=self.user, rating=4, watchlist=self.watchlist)
+        self.assertEqual(self.client.get(url).data['avg_rating'], 4)
+        
+        self.stream.name = "Netflix Premium"
+        self.stream.save()
+        self.assertEqual(self.client.get(url).data['platform'], "Netflix Premium")
+        
+        models.WatchList.objects.filter(pk=self.watchlist.pk).update(title="Bulk renamed")
+        self.assertEqual(self.client.get(url).data['title'], "Bulk renamed")
+        
+        self.watchlist.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        
+        
+class ConditionalRequestTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example", is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        self.review = models.Review.objects.create(review_user=self.user, rating=5, watchlist=self.watchlist)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertFalse(response['ETag'].startswith('W/'))
+        
+        etag = response['ETag']
+        
+        # one narrow query when the validators are not cached, none once they are
+        cache.clear()
+        for queries in (1, 0):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+        
+    def test_detail_endpoints_answer_not_modified(self):
+        self.assertRevalidates(reverse('movie-details', args=(self.watchlist.id,)))
+        self.assertRevalidates(reverse('stream-details', args=(self.stream.id,)))
+        self.assertRevalidates(reverse('reviews-detail', args=(self.review.id,)))
+        
+    def test_related_changes_move_the_etag(self):
+        url = reverse('stream-details', args=(self.stream.id,))
+        etag = self.client.get(url)['ETag']
+        
+        models.Review.objects.filter(pk=self.review.pk).update(rating=1)
+        response = self.client.get(url + '?expand=watchlist', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['watchlist'][0]['avg_rating'], 1)
+        
+    def test_if_match_guards_writes(self):
+        url = reverse('stream-details', args=(self.stream.id,))
+        etag = self.client.get(url)['ETag']
+        data = {"name": "Netflix", "about": "Streaming", "website": "https://neflix.com"}
+        
+        response = self.client.put(url, data=data, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(response['ETag'], etag)
+        
+        response = self.client.put(url, data={**data, "about": "Lost update"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(models.StreamPlatform.objects.get().about, "Streaming")
+        
+        
+class CounterThrottleTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example")
+        self.request = APIRequestFactory().get('/')
+        self.request.user = self.user
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def throttle(self, now, sliding=True):
+        throttle = throttling.UserCounterThrottle()
+        throttle.rate, throttle.num_requests, throttle.duration = '4/min', 4, 60
+        throttle.sliding = sliding
+        throttle.timer = lambda: now
+        return throttle
+        
+    def allowed(self, now, count, sliding=True):
+        return [self.throttle(now, sliding).allow_request(self.request, None) for _ in range(count)]
+        
+    def test_one_counter_per_window(self):
+        self.assertEqual(self.allowed(600, 5, sliding=False), [True] * 4 + [False])
+        throttle = self.throttle(600)
+        self.assertEqual(cache.get(f'throttle_user_{self.user.pk}:10'), 4)
+        
+        # a denied request does not count
+        self.assertFalse(throttle.allow_request(self.request, None))
+        self.assertEqual(cache.get(f'throttle_user_{self.user.pk}:10'), 4)
+        
+    def test_fixed_window_resets(self):
+        self.assertEqual(self.allowed(659, 5, sliding=False), [True] * 4 + [False])
+        self.assertEqual(self.allowed(660, 4, sliding=False), [True] * 4)
+        
+    def test_sliding_window_weighs_the_previous_window(self):
+        self.assertEqual(self.allowed(659, 4), [True] * 4)
+        
+        # a quarter into the next window three quarters of the previous one still count
+        self.assertEqual(self.allowed(675, 2), [True, False])
+        self.assertEqual(self.allowed(705, 3), [True, True, False])
+        
+    def test_wait(self):
+        self.allowed(600, 4, sliding=False)
+        throttle = self.throttle(615, sliding=False)
+        self.assertFalse(throttle.allow_request(self.request, None))
+        self.assertEqual(throttle.wait(), 45)
+        
+        throttle = self.throttle(615)
+        self.assertFalse(throttle.allow_request(self.request, None))
+        self.assertEqual(throttle.wait(), 60)
+        self.assertFalse(self.throttle(615 + 59).allow_request(self.request, None))
+        self.assertTrue(self.throttle(615 + 60).allow_request(self.request, None))
+        
+    @mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'anon': '1/day'})
+    def test_global_throttles_apply(self):
+        self.assertEqual(self.client.get(reverse('movie-list')).status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('movie-list'))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(response.has_header('Retry-After'))
+        
+        
+class BulkUpsertTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example", is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.other = models.StreamPlatform.objects.create(name="Prime", about="Streaming", website="https://prime.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        self.unchanged = models.WatchList.objects.create(title="Old movie", storyline="Old story", platform=self.stream)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def test_upsert_reports_errors_per_item(self):
+        updated = self.unchanged.updated
+        items = [
+            {"title": "New movie", "storyline": "story", "platform": "Prime"},
+            {"id": self.watchlist.id, "title": "Example movie", "storyline": "Moved", "platform": self.other.id},
+            {"id": self.unchanged.id, "title": "Old movie", "storyline": "Old story", "platform": "Netflix"},
+            {"storyline": "no title", "platform": "Netflix"},
+            {"title": "Lost", "storyline": "story", "platform": "Hulu"},
+            {"id": 9999, "title": "Missing", "storyline": "story", "platform": "Netflix"},
+            "not an object",
+        ]
+        response = self.client.post(reverse('movie-bulk'), data=items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['unchanged']), (1, 1, 1))
+        self.assertEqual([error['index'] for error in response.data['errors']], [3, 4, 5, 6])
+        self.assertIn('title', response.data['errors'][0]['errors'])
+        self.assertIn('platform', response.data['errors'][1]['errors'])
+        self.assertIn('id', response.data['errors'][2]['errors'])
+        
+        self.assertEqual(models.WatchList.objects.get(title="New movie").platform, self.other)
+        self.watchlist.refresh_from_db()
+        self.assertEqual((self.watchlist.storyline, self.watchlist.platform), ("Moved", self.other))
+        self.unchanged.refresh_from_db()
+        self.assertEqual(self.unchanged.updated, updated)
+        
+    def test_json_lines(self):
+        body = b'{"name": "Hulu", "about": "Streaming", "website": "https://hulu.com"}\n\n' \
+               b'{"id": %d, "name": "Netflix", "about": "Changed", "website": "https://neflix.com"}\n' % self.stream.id
+        response = self.client.post(reverse('stream-bulk'), data=body, content_type='application/jsonl')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual(models.StreamPlatform.objects.get(pk=self.stream.pk).about, "Changed")
+        
+        response = self.client.post(reverse('stream-bulk'), data=b'{"name": "Hulu"}\n{oops', content_type='application/jsonl')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line 2', response.data['detail'])
+        
+    def test_queries_do_not_grow_with_the_batch(self):
+        def post(count):
+            items = [{"title": f"Movie {i}", "storyline": "story", "platform": "Netflix"} for i in range(count)]
+            # with the postings and trigrams of the search index
+            with self.assertNumQueries(7):
+                response = self.client.post(reverse('movie-bulk'), data=items, format='json')
+            self.assertEqual(response.data['created'], count)
+        post(5)
+        post(50)
+        
+    def test_ambiguous_platform_name(self):
+        models.StreamPlatform.objects.create(name="Netflix", about="Copy", website="https://neflix.com")
+        items = [{"title": "New movie", "storyline": "story", "platform": "Netflix"}]
+        response = self.client.post(reverse('movie-bulk'), data=items, format='json')
+        self.assertEqual(response.data['errors'][0]['index'], 0)
+        
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=User.objects.create(username="viewer"))
+        response = self.client.post(reverse('stream-bulk'), data=[], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        
+class ImportImdbTestCase(APITestCase):
+    
+    basics = [
+        "tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres",
+        "tt0000001\tmovie\tCarmencita\tCarmencita\t0\t1894\t\\N\t1\tDocumentary,Short",
+        "tt0000002\tshort\tLe clown et ses chiens\tLe clown et ses chiens\t0\t1892\t\\N\t5\tAnimation",
+        "tt0000003\tmovie\tAdult movie\tAdult movie\t1\t1990\t\\N\t90\tDrama",
+        "a malformed line",
+        "tt0000010\tmovie\t" + "Long title " * 10 + "\tx\t0\t\\N\t\\N\t\\N\t\\N",
+        "tt10000001\tmovie\tNewer movie\tNewer movie\t0\t2021\t\\N\t100\tComedy",
+    ]
+    ratings = [
+        "tconst\taverageRating\tnumVotes",
+        "tt0000001\t5.7\t2031",
+        "tt0000002\t5.8\t272",
+        "tt10000001\t7.1\t15",
+    ]
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def dump(self, name, lines):
+        path = os.path.join(self.directory.name, name)
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+        
+    def run_import(self, basics=None, *args):
+        out = io.StringIO()
+        call_command('import_imdb', basics or self.dump('title.basics.tsv.gz', self.basics),
+                     '--ratings', self.dump('title.ratings.tsv.gz', self.ratings), *args, stdout=out)
+        return out.getvalue()
+        
+    def test_import(self):
+        self.assertIn('Imported 3 titles from 6 rows', self.run_import())
+        movies = {movie.imdb_id: movie for movie in models.WatchList.objects.select_related('platform')}
+        self.assertEqual(sorted(movies), ['tt0000001', 'tt0000010', 'tt10000001'])
+        self.assertEqual((movies['tt0000001'].imdb_rating, movies['tt0000001'].imdb_votes), (5.7, 2031))
+        self.assertEqual((movies['tt0000010'].imdb_rating, movies['tt0000010'].imdb_votes), (None, 0))
+        self.assertEqual(movies['tt0000001'].storyline, "movie | 1894 | Documentary, Short | 1 min")
+        self.assertEqual(len(movies['tt0000010'].title), 50)
+        self.assertEqual(movies['tt10000001'].platform.name, "IMDb")
+        
+    def test_import_again_updates_in_place(self):
+        self.run_import()
+        other = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        models.WatchList.objects.filter(imdb_id='tt0000001').update(platform=other)
+        
+        self.ratings = self.ratings[:1] + ["tt0000001\t6.0\t2100"] + self.ratings[2:]
+        self.run_import()
+        self.assertEqual(models.WatchList.objects.count(), 3)
+        movie = models.WatchList.objects.get(imdb_id='tt0000001')
+        self.assertEqual((movie.imdb_rating, movie.imdb_votes, movie.platform), (6.0, 2100, other))
+        
+    def test_resume_from_checkpoint(self):
+        basics = self.dump('title.basics.tsv.gz', self.basics)
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'basics': os.path.abspath(basics), 'lines': 4, 'imported': 1}, file)
+        
+        output = self.run_import(basics, '--checkpoint', self.checkpoint, '--chunk-size', '1')
+        self.assertIn('Resuming after 4 rows', output)
+        self.assertEqual(set(models.WatchList.objects.values_list('imdb_id', flat=True)), {'tt0000010', 'tt10000001'})
+        self.assertFalse(os.path.exists(self.checkpoint))
+        
+    def test_parallel_parsing(self):
+        self.run_import(None, '--workers', '2', '--chunk-size', '2')
+        self.assertEqual(models.WatchList.objects.count(), 3)
+        self.assertEqual(models.WatchList.objects.get(imdb_id='tt10000001').imdb_rating, 7.1)
+        
+    def test_unsorted_dump(self):
+        self.basics = self.basics[:1] + self.basics[6:] + self.basics[1:6]
+        with self.assertRaises(CommandError):
+            self.run_import()
+        
+        
+@unthrottled
+class SearchTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.godfather = models.WatchList.objects.create(title="The Godfather", storyline="A crime family saga", platform=self.stream)
+        self.goodfellas = models.WatchList.objects.create(title="Goodfellas", storyline="The rise of a mobster, like the godfather", platform=self.stream)
+        self.amelie = models.WatchList.objects.create(title="Amélie", storyline="A shy waitress in Paris", platform=self.stream)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def search(self, query, **params):
+        response = self.client.get(reverse('movie-search'), {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [movie['title'] for movie in response.data['results']]
+        
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("godfather"), ["The Godfather", "Goodfellas"])
+        self.assertEqual(self.search("amelie paris"), ["Amélie"])
+        self.assertEqual(self.search("nothing like it"), ["Goodfellas"])
+        self.assertEqual(self.search(""), [])
+        
+    def test_misspelled_words(self):
+        self.assertEqual(self.search("godfater"), ["The Godfather", "Goodfellas"])
+        self.assertEqual(self.search("waitres"), ["Amélie"])
+        
+    def test_index_follows_saves_and_deletes(self):
+        self.amelie.title = "Le fabuleux destin"
+        self.amelie.save()
+        self.assertEqual(self.search("amelie"), [])
+        self.assertEqual(self.search("fabuleux"), ["Le fabuleux destin"])
+        
+        self.godfather.delete()
+        self.assertEqual(self.search("godfather"), ["Goodfellas"])
+        
+    @unthrottled
+    def test_bulk_writes_are_indexed(self):
+        self.client.force_authenticate(User.objects.create_superuser(username="admin", password="Password@123"))
+        response = self.client.post(reverse('movie-bulk'), [
+            {"title": "Vertigo", "storyline": "A detective's fear of heights", "platform": self.stream.id},
+            {"id": self.amelie.id, "title": "Rebecca", "storyline": self.amelie.storyline, "platform": self.stream.id},
+        ], format='json')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(self.search("vertigo"), ["Vertigo"])
+        self.assertEqual(self.search("rebecca"), ["Rebecca"])
+        self.assertEqual(self.search("amelie"), [])
+        
+        casino = models.WatchList(title="Casino", storyline="Las Vegas", platform=self.stream, imdb_id="tt0112641")
+        models.WatchList.objects.bulk_create([casino])
+        casino.title = "Heat"
+        models.WatchList.objects.bulk_create([casino], update_conflicts=True, unique_fields=['imdb_id'], update_fields=['title'])
+        self.assertEqual(self.search("heat"), ["Heat"])
+        self.assertEqual(self.search("casino"), [])
+        
+    def test_rebuild(self):
+        models.WatchList.objects.bulk_create([models.WatchList(title="Casino", storyline="Las Vegas", platform=self.stream)])
+        # as after a write that goes around WatchList
+        models.SearchTerm.objects.all().delete()
+        self.assertEqual(self.search("casino"), [])
+        
+        out = io.StringIO()
+        call_command('rebuild_search_index', '--batch-size', '2', stdout=out)
+        self.assertIn('Indexed 4 watchlists', out.getvalue())
+        self.assertEqual(self.search("casino"), ["Casino"])
+        self.assertEqual(self.search("godfather"), ["The Godfather", "Goodfellas"])
+        
+    def test_ranked_pages_are_disjoint(self):
+        for i in range(5):
+            models.WatchList.objects.create(title=f"Heist {i}", storyline="heist " * i, platform=self.stream)
+        seen = []
+        url = reverse('movie-search') + '?q=heist&size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [movie['title'] for movie in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [f"Heist {i}" for i in reversed(range(5))])
+        
+        
+@unthrottled
+class SparseFieldsTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example")
+        self.client.force_authenticate(user=self.user)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        self.review = models.Review.objects.create(review_user=self.user, rating=5, description="Great", watchlist=self.watchlist)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def get(self, url, queries):
+        with self.assertNumQueries(queries) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, [query['sql'] for query in context.captured_queries]
+        
+    def test_stream_list_does_not_embed_titles(self):
+        data, sql = self.get(reverse('stream-list'), 1)
+        self.assertNotIn('watchlist', data['results'][0])
+        self.assertNotIn('watchlist_app_watchlist', ' '.join(sql))
+        
+        data, sql = self.get(reverse('stream-list') + '?expand=watchlist', 2)
+        self.assertEqual(data['results'][0]['watchlist'][0]['title'], "Example movie")
+        self.assertEqual(data['results'][0]['watchlist'][0]['platform'], "Netflix")
+        
+    def test_fields_narrow_the_select(self):
+        data, sql = self.get(reverse('stream-list') + '?fields=name', 1)
+        self.assertEqual(data['results'][0], {'name': "Netflix"})
+        self.assertNotIn('website', sql[0])
+        
+        data, sql = self.get(reverse('movie-list') + '?fields=title,platform', 1)
+        self.assertEqual(data['results'][0], {'title': "Example movie", 'platform': "Netflix"})
+        self.assertNotIn('storyline', sql[0])
+        self.assertNotIn('"website"', sql[0])
+        
+        data, sql = self.get(reverse('movie-details', args=(self.watchlist.id,)) + '?fields=title', 2)
+        self.assertEqual(data, {'title': "Example movie"})
+        self.assertNotIn('streamplatform', sql[-1])
+        
+    def test_fields_and_expand_together(self):
+        data, sql = self.get(reverse('stream-details', args=(self.stream.id,)) + '?fields=name,watchlist&expand=watchlist', 3)
+        self.assertEqual(set(data), {'name', 'watchlist'})
+        self.assertEqual(data['watchlist'][0]['platform'], "Netflix")
+        
+        data, sql = self.get(reverse('reviews-detail', args=(self.review.id,)) + '?fields=rating,review_user&expand=watchlist', 2)
+        self.assertEqual(data['review_user'], "example")
+        self.assertEqual(data['watchlist']['title'], "Example movie")
+        
+        data, sql = self.get(reverse('reviews-list', args=(self.watchlist.id,)) + '?fields=rating', 1)
+        self.assertEqual(data['results'], [{'rating': 5}])
+        
+    def assertChangeMovesTheETag(self, url, change):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.data
+        
+    def test_expanded_reviews_are_validated(self):
+        url = reverse('movie-details', args=(self.watchlist.id,)) + '?expand=reviews'
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(reverse('movie-details', args=(self.watchlist.id,)))['ETag'])
+        
+        def edit():
+            self.review.description = "Still great"
+            self.review.save()
+        self.assertEqual(self.assertChangeMovesTheETag(url, edit)['reviews'][0]['description'], "Still great")
+        self.assertEqual(self.assertChangeMovesTheETag(url, self.review.delete)['reviews'], [])
+        
+    @mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'review-throttle': None})
+    def test_expanded_watchlist_is_validated(self):
+        url = reverse('reviews-detail', args=(self.review.id,)) + '?expand=watchlist'
+        
+        def rename():
+            self.watchlist.title = "Renamed movie"
+            self.watchlist.save()
+        self.assertEqual(self.assertChangeMovesTheETag(url, rename)['watchlist']['title'], "Renamed movie")
+        
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('movie-list') + '?fields=title,secret&expand=nothing')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+        self.assertIn('expand', response.data)
+        
+        
+@unthrottled
+class FastPathParityTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example")
+        self.client.force_authenticate(user=self.user)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.other = models.StreamPlatform.objects.create(name="Canal+ Séries", about="", website="https://canalplus.com")
+        self.watchlist = models.WatchList.objects.create(title="Amélie", storyline="Paris", platform=self.other, imdb_id="tt0211915", imdb_rating=8.3, imdb_votes=780000)
+        self.inactive = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream, active=False)
+        for i, description in enumerate(["Great", None, "Ünïcode ✓"]):
+            user = User.objects.create(username=f"user{i}")
+            models.Review.objects.create(review_user=user, rating=i + 3, description=description, watchlist=self.watchlist, active=bool(i % 2))
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def assertSameJSON(self, first, second):
+        self.assertEqual(JSONRenderer().render(first), JSONRenderer().render(second))
+        
+    def test_extractors_match_the_serializers(self):
+        cases = [
+            (serializers.WatchListSerializer, models.WatchList.objects.select_related('platform'), [None, ['title', 'platform'], ['imdb_rating', 'created']]),
+            (serializers.ReviewSerializer, models.Review.objects.select_related('review_user'), [None, ['review_user', 'description']]),
+            (serializers.StreamPlatformSerializers, models.StreamPlatform.objects.all(), [None, ['name']]),
+        ]
+        for serializer_class, queryset, selections in cases:
+            for fields in selections:
+                with self.subTest(serializer=serializer_class.__name__, fields=fields):
+                    selection = {'fields': fields, 'expand': []}
+                    extractor = fastpath.get_extractor(serializer_class, selection)
+                    self.assertIsNotNone(extractor)
+                    queryset = queryset.order_by('id')
+                    expected = serializer_class(queryset, many=True, **selection).data
+                    self.assertSameJSON(extractor(queryset.values(*extractor.columns)), expected)
+                    
+    def test_datetimes_follow_the_active_timezone(self):
+        queryset = models.WatchList.objects.select_related('platform').order_by('id')
+        extractor = fastpath.get_extractor(serializers.WatchListSerializer, {})
+        with timezone.override('Asia/Kolkata'):
+            expected = serializers.WatchListSerializer(queryset, many=True).data
+            self.assertSameJSON(extractor(queryset.values(*extractor.columns)), expected)
+        self.assertIn('+05:30', expected[0]['created'])
+        
+    def test_expansions_keep_the_stock_path(self):
+        self.assertIsNone(fastpath.get_extractor(serializers.StreamPlatformSerializers, {'fields': None, 'expand': ['watchlist']}))
+        
+    def test_endpoints_match_the_stock_path(self):
+        urls = [
+            reverse('movie-list'),
+            reverse('movie-list') + '?fields=id,platform&size=1',
+            reverse('stream-list'),
+            reverse('reviews-list', args=(self.watchlist.id,)),
+            reverse('user-reviews') + '?username=user1',
+            reverse('movie-search') + '?q=amelie',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                fast = self.client.get(url)
+                cache.clear()
+                with mock.patch.object(fastpath, 'get_extractor', return_value=None):
+                    stock = self.client.get(url)
+                self.assertEqual(fast.status_code, status.HTTP_200_OK)
+                self.assertEqual(fast.content, stock.content)
+        
+        
+@unthrottled
+class ExportTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="example")
+        self.client.force_authenticate(user=self.user)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        for i in range(5):
+            watchlist = models.WatchList.objects.create(title=f"Movie {i} ✓", storyline="Example story", platform=self.stream)
+            models.Review.objects.create(review_user=self.user, rating=i % 5 + 1, description=None if i % 2 else "Good", watchlist=watchlist)
+            
+    def tearDown(self):
+        cache.clear()
+        
+    def expected(self, serializer_class, queryset, **selection):
+        return json.loads(JSONRenderer().render(serializer_class(queryset.order_by('id'), many=True, **selection).data))
+        
+    @mock.patch.object(export.ExportAV, 'chunk_size', 2)
+    def test_json_lines_match_the_serializers(self):
+        for name, serializer_class, queryset in [
+            ('movie-export', serializers.WatchListSerializer, models.WatchList.objects.all()),
+            ('stream-export', serializers.StreamPlatformSerializers, models.StreamPlatform.objects.all()),
+            ('reviews-export', serializers.ReviewSerializer, models.Review.objects.all()),
+        ]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response['Content-Type'], 'application/jsonl')
+                lines = b''.join(response.streaming_content).decode().splitlines()
+                self.assertEqual([json.loads(line) for line in lines], self.expected(serializer_class, queryset))
+                
+    @mock.patch.object(export.ExportAV, 'chunk_size', 2)
+    def test_json_array(self):
+        for query, selection in [
+            ('?format=json', {}),
+            ('?format=json&fields=id,title', {'fields': ['id', 'title']}),
+            ('?format=json&expand=reviews', {'expand': ['reviews']}),
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(reverse('movie-export') + query)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                expected = self.expected(serializers.WatchListSerializer, models.WatchList.objects.all(), **selection)
+                self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+                
+    def test_empty_table(self):
+        models.StreamPlatform.objects.all().delete()
+        response = self.client.get(reverse('stream-export') + '?format=json')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        
+    def test_unknown_field(self):
+        response = self.client.get(reverse('movie-export') + '?fields=nope')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', json.loads(response.content))
+        
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('movie-export'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+    def peak_memory(self, rows):
+        models.WatchList.objects.bulk_create(
+            [models.WatchList(title=f"Bulk {i}", storyline="Example story " * 10, platform=self.stream) for i in range(rows - models.WatchList.objects.count())])
+        tracemalloc.start()
+        try:
+            response = self.client.get(reverse('movie-export'))
+            size = sum(map(len, response.streaming_content))
+            return tracemalloc.get_traced_memory()[1], size
+        finally:
+            tracemalloc.stop()
+            
+    @mock.patch.object(export.ExportAV, 'chunk_size', 100)
+    def test_memory_stays_flat(self):
+        small, small_size = self.peak_memory(500)
+        large, large_size = self.peak_memory(5000)
+        self.assertGreater(large_size, small_size * 9)
+        self.assertLess(large, small * 1.5)
+        
+        
+@unthrottled
+class InstrumentationTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def server_timing(self, response):
+        metrics = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+        
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('movie-details', args=(self.watchlist.id,)))
+        metrics = self.server_timing(response)
+        self.assertEqual(set(metrics), {'db', 'serialize', 'render', 'total'})
+        self.assertGreater(float(metrics['serialize']['dur']), 0)
+        self.assertGreater(float(metrics['render']['dur']), 0)
+        self.assertGreaterEqual(float(metrics['total']['dur']), float(metrics['db']['dur']))
+        
+        # the cached response is served without serializing or querying the catalog
+        metrics = self.server_timing(self.client.get(reverse('movie-details', args=(self.watchlist.id,))))
+        self.assertEqual(float(metrics['serialize']['dur']), 0)
+        
+    def test_serializers_are_timed_without_patching_drf(self):
+        from rest_framework.serializers import BaseSerializer
+        self.client.get(reverse('movie-details', args=(self.watchlist.id,)))
+        self.assertEqual(BaseSerializer.data.fget.__qualname__, 'BaseSerializer.data')
+        self.assertIsInstance(serializers.WatchListSerializer([self.watchlist], many=True), instrumentation.TimedListSerializer)
+        
+        timings = instrumentation.Timings()
+        token = instrumentation.current.set(timings)
+        try:
+            serializers.WatchListSerializer([self.watchlist], many=True).data
+        finally:
+            instrumentation.current.reset(token)
+        self.assertGreater(timings.serialize, 0)
+        
+    def test_query_count(self):
+        cache.clear()
+        url = reverse('stream-details', args=(self.stream.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(self.server_timing(response)['db']['desc'], f'"{len(queries)} queries"')
+        
+    def test_log_line(self):
+        with self.assertLogs('watchmate.requests', 'INFO') as logs:
+            self.client.get(reverse('movie-list'))
+        self.assertIn('view=movie-list', logs.output[0])
+        self.assertEqual(logs.records[0].timing['status'], 200)
+        
+    def count(self, text, view):
+        prefix = f'watchmate_request_duration_seconds_count{{view="{view}",method="GET"}} '
+        return next((int(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)), 0)
+        
+    def test_metrics(self):
+        self.client.force_authenticate(user=self.staff)
+        before = self.count(self.client.get(reverse('metrics')).content.decode(), 'stream-list')
+        for _ in range(3):
+            self.client.get(reverse('stream-list'))
+        
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertEqual(self.count(text, 'stream-list'), before + 3)
+        self.assertIn('watchmate_request_duration_seconds_bucket{view="stream-list",method="GET",le="+Inf"}', text)
+        self.assertIn('# TYPE watchmate_db_queries_total counter', text)
+        
+    def test_metrics_are_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create(username="example"))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = instrumentation.Histogram((0.1, 1))
+        for duration in (0.05, 0.1, 0.5, 2):
+            histogram.observe(('view', 'GET'), duration, instrumentation.Timings())
+        text = histogram.exposition()
+        self.assertIn('watchmate_request_duration_seconds_bucket{view="view",method="GET",le="0.1"} 2', text)
+        self.assertIn('watchmate_request_duration_seconds_bucket{view="view",method="GET",le="1.0"} 3', text)
+        self.assertIn('watchmate_request_duration_seconds_bucket{view="view",method="GET",le="+Inf"} 4', text)
+        self.assertIn('watchmate_request_duration_seconds_count{view="view",method="GET"} 4', text)
+        
+        
+@unthrottled
+class AsyncViewsTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="example", password="Password@123", is_staff=True)
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        self.watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=self.stream)
+        models.WatchList.objects.create(title="Other movie", storyline="Other story", platform=self.stream)
+        models.Review.objects.create(review_user=self.user, rating=5, description=None, watchlist=self.watchlist)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def async_get(self, view_class, url, token=True, **headers):
+        if token:
+            headers['Authorization'] = 'Token ' + self.token.key
+        request = AsyncRequestFactory().get(url, headers=headers)
+        match = urls_resolve(url.partition('?')[0])
+        return async_to_sync(view_class.as_view())(request, **match.kwargs)
+        
+    def test_responses_match_the_sync_views(self):
+        cases = [
+            (views.AsyncWatchListAV, reverse('movie-list')),
+            (views.AsyncWatchListAV, reverse('movie-list') + '?fields=id,title&size=1'),
+            (views.AsyncWatchListAV, reverse('movie-list') + '?expand=reviews'),
+            (views.AsyncWatchDetailAV, reverse('movie-details', args=(self.watchlist.id,))),
+            (views.AsyncWatchDetailAV, reverse('movie-details', args=(self.watchlist.id,)) + '?expand=reviews'),
+            (views.AsyncWatchDetailAV, reverse('movie-details', args=(999,))),
+            (views.AsyncStreamPlatformListAV, reverse('stream-list')),
+            (views.AsyncStreamPlatformDetailAV, reverse('stream-details', args=(self.stream.id,)) + '?expand=watchlist'),
+            (views.AsyncReviewList, reverse('reviews-list', args=(self.watchlist.id,))),
+            (views.AsyncReviewList, reverse('reviews-list', args=(self.watchlist.id,)) + '?expand=watchlist&active=true'),
+            (views.AsyncWatchListAV, reverse('movie-list') + '?fields=nope'),
+        ]
+        for view_class, url in cases:
+            with self.subTest(url=url):
+                cache.clear()
+                expected = self.client.get(url)
+                cache.clear()
+                response = self.async_get(view_class, url)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+                
+                # and again from the response cache
+                self.assertEqual(self.async_get(view_class, url).content, expected.content)
+                
+    def test_conditional_get(self):
+        url = reverse('movie-details', args=(self.watchlist.id,))
+        etag = self.async_get(views.AsyncWatchDetailAV, url)['ETag']
+        response = self.async_get(views.AsyncWatchDetailAV, url, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+    def test_permissions(self):
+        response = self.async_get(views.AsyncReviewList, reverse('reviews-list', args=(self.watchlist.id,)), token=False)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+    def test_throttles(self):
+        with mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'review-list': '1/day'}):
+            url = reverse('reviews-list', args=(self.watchlist.id,))
+            self.assertEqual(self.async_get(views.AsyncReviewList, url).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.async_get(views.AsyncReviewList, url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            
+    def test_writes_keep_the_sync_handlers(self):
+        url = reverse('stream-details', args=(self.stream.id,))
+        data = {"name": "Netflix", "about": "Renamed", "website": "https://neflix.com"}
+        request = AsyncRequestFactory().put(url, data=data, content_type='application/json', headers={'Authorization': 'Token ' + self.token.key})
+        response = async_to_sync(views.AsyncStreamPlatformDetailAV.as_view())(request, pk=self.stream.id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.stream.refresh_from_db()
+        self.assertEqual(self.stream.about, "Renamed")
+        
+    def test_read_view_follows_the_setting(self):
+        with override_settings(ASYNC_READ_VIEWS=True):
+            view = asynchronous.read_view(views.WatchListAV, views.AsyncWatchListAV)
+            self.assertIs(view.view_class, views.AsyncWatchListAV)
+            self.assertTrue(iscoroutinefunction(view))
+        with override_settings(ASYNC_READ_VIEWS=False):
+            self.assertIs(asynchronous.read_view(views.WatchListAV, views.AsyncWatchListAV).view_class, views.WatchListAV)
+            
+    async def test_timings_follow_queries_into_the_sync_thread(self):
+        response = await self.async_client.get(reverse('stream-details', args=(self.stream.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+        
+        
+@override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+class ReplicaRoutingTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.router = replicas.ReplicaRouter()
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def routed(self, pinned=False):
+        # test cases run inside a transaction, which keeps reads on default
+        patcher = mock.patch.object(connection, 'in_atomic_block', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routing = replicas.Routing(pinned)
+        token = replicas.current.set(routing)
+        self.addCleanup(replicas.current.reset, token)
+        return routing
+        
+    def through_middleware(self, request, write=False):
+        seen = {}
+        
+        def get_response(request):
+            seen['routing'] = replicas.current.get()
+            if write:
+                self.write()
+            return HttpResponse()
+        response = replicas.ReplicaPinningMiddleware(get_response)(request)
+        return response, seen['routing']
+        
+    def write(self):
+        models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        
+    def test_reads_outside_requests_use_default(self):
+        self.assertEqual(self.router.db_for_read(models.WatchList), DEFAULT_DB_ALIAS)
+        
+    def test_a_request_reads_from_one_replica(self):
+        self.routed()
+        first = self.router.db_for_read(models.WatchList)
+        self.assertIn(first, ['replica1', 'replica2'])
+        self.assertEqual({self.router.db_for_read(model) for model in [models.Review, models.StreamPlatform, User]}, {first})
+        
+    def test_writes_and_what_follows_use_default(self):
+        routing = self.routed()
+        self.assertEqual(self.router.db_for_write(models.Review), DEFAULT_DB_ALIAS)
+        # asking is not writing, authentication points a Token at its user for instance
+        models.Review(review_user=User(username="example"), rating=5)
+        self.assertFalse(routing.wrote)
+        self.assertNotEqual(self.router.db_for_read(models.Review), DEFAULT_DB_ALIAS)
+        
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.write()
+        self.assertTrue(routing.wrote)
+        self.assertEqual(self.router.db_for_read(models.Review), DEFAULT_DB_ALIAS)
+        
+    def test_default_inside_transactions_pins_and_primary(self):
+        self.routed()
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(models.WatchList), DEFAULT_DB_ALIAS)
+        with replicas.primary():
+            self.assertEqual(self.router.db_for_read(models.WatchList), DEFAULT_DB_ALIAS)
+        self.assertNotEqual(self.router.db_for_read(models.WatchList), DEFAULT_DB_ALIAS)
+        
+        self.routed(pinned=True)
+        self.assertEqual(self.router.db_for_read(models.WatchList), DEFAULT_DB_ALIAS)
+        
+    def test_only_default_migrates(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'watchlist_app'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'watchlist_app'))
+        
+    def test_writes_pin_the_client(self):
+        factory = RequestFactory()
+        response, routing = self.through_middleware(factory.get('/'))
+        self.assertFalse(routing.pinned)
+        self.assertNotIn('read_primary_until', response.cookies)
+        
+        response, routing = self.through_middleware(factory.post('/', HTTP_AUTHORIZATION='Token one'), write=True)
+        self.assertTrue(routing.pinned)
+        cookie = response.cookies['read_primary_until']
+        self.assertEqual(cookie['max-age'], 10)
+        
+        # by the cookie, and by the credentials for clients that drop cookies
+        factory.cookies['read_primary_until'] = cookie.value
+        self.assertTrue(self.through_middleware(factory.get('/'))[1].pinned)
+        del factory.cookies['read_primary_until']
+        self.assertTrue(self.through_middleware(factory.get('/', HTTP_AUTHORIZATION='Token one'))[1].pinned)
+        self.assertFalse(self.through_middleware(factory.get('/', HTTP_AUTHORIZATION='Token two'))[1].pinned)
+        
+        factory.cookies['read_primary_until'] = str(int(time.time()) - 1)
+        self.assertFalse(self.through_middleware(factory.get('/'))[1].pinned)
+        
+    def test_writes_read_from_default(self):
+        self.routed()
+        read = {}
+        
+        def get_response(request):
+            read[request.method] = self.router.db_for_read(models.Review)
+            return HttpResponse()
+        for method in ('get', 'put', 'patch', 'post', 'delete'):
+            replicas.ReplicaPinningMiddleware(get_response)(getattr(RequestFactory(), method)('/'))
+        self.assertNotEqual(read.pop('GET'), DEFAULT_DB_ALIAS)
+        self.assertEqual(set(read.values()), {DEFAULT_DB_ALIAS})
+        # nothing was written, the client is not pinned afterwards
+        response = replicas.ReplicaPinningMiddleware(get_response)(RequestFactory().put('/'))
+        self.assertNotIn('read_primary_until', response.cookies)
+        
+    def test_async_requests(self):
+        middleware = replicas.ReplicaPinningMiddleware(self.async_get_response)
+        response = async_to_sync(middleware)(AsyncRequestFactory().post('/', headers={'Authorization': 'Token one'}))
+        self.assertIn('read_primary_until', response.cookies)
+        self.assertTrue(async_to_sync(middleware)(AsyncRequestFactory().get('/', headers={'Authorization': 'Token one'})).pinned)
+        
+    async def async_get_response(self, request):
+        response = HttpResponse()
+        response.pinned = replicas.current.get().pinned
+        if request.method == 'POST':
+            await models.StreamPlatform.objects.acreate(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        return response
+        
+    @unthrottled
+    def test_api_writes_set_the_cookie(self):
+        user = User.objects.create_user(username="example", password="Password@123")
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        stream = models.StreamPlatform.objects.create(name="Netflix", about="#1 streaming platform", website="https://neflix.com")
+        watchlist = models.WatchList.objects.create(title="Example movie", storyline="Example story", platform=stream)
+        
+        response = self.client.get(reverse('movie-details', args=(watchlist.id,)))
+        self.assertNotIn('read_primary_until', response.cookies)
+        response = self.client.post(reverse('review-create', args=(watchlist.id,)), {'rating': 5, 'description': 'Great', 'active': True})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('read_primary_until', response.cookies)
+        
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        response, routing = self.through_middleware(RequestFactory().post('/'), write=True)
+        self.assertIsNone(routing)
+        self.assertNotIn('read_primary_until', response.cookies)
+        with self.assertRaises(CommandError):
+            call_command('sync_replicas')
+            
+class LeaderboardTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.netflix = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        self.prime = models.StreamPlatform.objects.create(name="Prime", about="about", website="https://example.com")
+        self.users = [User.objects.create_user(username=f"user{i}", password="Password@123") for i in range(12)]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=self.users[0]).key)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def title(self, name, ratings, platform=None, active=True):
+        watchlist = models.WatchList.objects.create(title=name, storyline="story", platform=platform or self.netflix, active=active)
+        for user, rating in zip(self.users, ratings):
+            models.Review.objects.create(review_user=user, rating=rating, watchlist=watchlist)
+        return watchlist
+        
+    def ranked(self, name, *args, query=''):
+        response = self.client.get(reverse(name, args=args) + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']], response
+        
+    def test_weighted_rating_follows_the_reviews(self):
+        watchlist = self.title("Lonely", [5])
+        watchlist.refresh_from_db()
+        self.assertAlmostEqual(watchlist.weighted_rating, (5 + 10 * 3.0) / 11)
+        models.Review.objects.filter(watchlist=watchlist).delete()
+        watchlist.refresh_from_db()
+        self.assertAlmostEqual(watchlist.weighted_rating, 3.0)
+        
+        self.title("Loved", [5] * 4)
+        models.WatchList.objects.update(weighted_rating=0)
+        call_command('recompute_ratings', stdout=io.StringIO())
+        self.assertEqual(sorted(models.WatchList.objects.values_list('weighted_rating', flat=True)),
+                         [3.0, (20 + 10 * 3.0) / 14])
+        
+    @unthrottled
+    def test_top_rated_ranks_by_the_bayesian_average(self):
+        # one 5 star review does not beat a dozen good ones
+        self.title("One hit", [5])
+        self.title("Acclaimed", [5, 5, 4, 5, 4, 5, 5, 4, 5, 5, 4, 5])
+        self.title("Panned", [1, 2, 1, 1])
+        self.title("Unseen", [])
+        self.title("Taken down", [5] * 12, active=False)
+        self.title("Elsewhere", [5, 5, 5], platform=self.prime)
+        
+        titles, _ = self.ranked('movie-top-rated')
+        self.assertEqual(titles, ["Acclaimed", "Elsewhere", "One hit", "Panned"])
+        titles, _ = self.ranked('stream-top-rated', self.netflix.id)
+        self.assertEqual(titles, ["Acclaimed", "One hit", "Panned"])
+        with override_settings(LEADERBOARDS={**settings.LEADERBOARDS, 'MIN_REVIEWS': 0}):
+            titles, _ = self.ranked('stream-top-rated', self.netflix.id)
+        self.assertEqual(titles, ["Acclaimed", "One hit", "Unseen", "Panned"])
+        
+        titles, response = self.ranked('movie-top-rated', query='?size=2&fields=title')
+        self.assertEqual(titles, ["Acclaimed", "Elsewhere"])
+        self.assertEqual(set(response.data['results'][0]), {'title'})
+        titles, _ = self.ranked('movie-top-rated', query='?' + response.data['next'].partition('?')[2])
+        self.assertEqual(titles, ["One hit", "Panned"])
+        
+    def test_top_rated_reads_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('reads the SQLite query plan')
+        for platform_id in [None, self.netflix.id]:
+            queryset = leaderboards.top_rated(platform_id).order_by('-weighted_rating', '-id')[:10]
+            with self.subTest(platform=platform_id):
+                plan = queryset.explain()
+                self.assertIn('_top', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+                
+    @unthrottled
+    def test_trending_counts_recent_reviews(self):
+        recent = self.title("Recent", [4, 3, 5])
+        steady = self.title("Steady", [5] * 8)
+        self.title("Elsewhere", [2, 2], platform=self.prime)
+        self.title("Taken down", [5] * 10, active=False)
+        # most of the reviews of Steady are older than the window
+        week_ago = timezone.now() - timezone.timedelta(seconds=settings.LEADERBOARDS['TRENDING_WINDOW'] + 60)
+        models.Review.objects.filter(watchlist=steady, review_user__in=self.users[:7]).update(created=week_ago)
+        
+        titles, response = self.ranked('movie-trending')
+        self.assertEqual(titles, ["Recent", "Elsewhere", "Steady"])
+        self.assertEqual([item['recent_reviews'] for item in response.data['results']], [3, 2, 1])
+        self.assertEqual(response.data['count'], 3)
+        titles, _ = self.ranked('stream-trending', self.netflix.id)
+        self.assertEqual(titles, ["Recent", "Steady"])
+        titles, response = self.ranked('movie-trending', query='?limit=1&offset=1&fields=id,title')
+        self.assertEqual(titles, ["Elsewhere"])
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'recent_reviews'})
+        
+        # the ranking is kept until it is refreshed, titles taken down since drop out of it
+        for user in self.users[10:]:
+            models.Review.objects.create(review_user=user, rating=1, watchlist=steady)
+        recent.active = False
+        recent.save()
+        # the token is cached as well, the page of titles is all that is read
+        with self.assertNumQueries(1):
+            titles, _ = self.ranked('movie-trending')
+        self.assertEqual(titles, ["Elsewhere", "Steady"])
+        cache.clear()
+        titles, response = self.ranked('movie-trending')
+        self.assertEqual(titles, ["Steady", "Elsewhere"])
+        self.assertEqual(response.data['results'][0]['recent_reviews'], 3)
+        
+@skipUnless(recommendations.available(), "recommendations need numpy and scipy")
+class RecommendationsTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'neighbours.npy')
+        override = override_settings(RECOMMENDATIONS={'PATH': self.path, 'NEIGHBOURS': 10, 'LIKE_RATING': 4, 'MIN_COMMON': 1})
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        self.watchlists = [models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=self.stream) for i in range(8)]
+        # no passwords, hashing 16 of them would be most of the test
+        self.users = [User.objects.create(username=f"user{i}") for i in range(16)]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=self.users[0]).key)
+        rng = random.Random(7)
+        for user in self.users[:12]:
+            for watchlist in rng.sample(self.watchlists, rng.randint(1, 5)):
+                models.Review.objects.create(review_user=user, rating=rng.randint(1, 5), watchlist=watchlist)
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def expected(self):
+        '''{watchlist id: [(neighbour id, similarity)]} by brute force over the likes'''
+        likes = {}
+        for user, watchlist in recommendations.liked().values_list('review_user_id', 'watchlist_id'):
+            likes.setdefault(watchlist, set()).add(user)
+        neighbours = {}
+        for one, viewers in likes.items():
+            scored = [(other, len(viewers & others) / (len(viewers) * len(others)) ** 0.5)
+                      for other, others in likes.items() if other != one and len(viewers & others) >= settings.RECOMMENDATIONS['MIN_COMMON']]
+            if scored:
+                neighbours[one] = self.ranked(scored)[:settings.RECOMMENDATIONS['NEIGHBOURS']]
+        return neighbours
+        
+    def ranked(self, scored):
+        return sorted(((watchlist, round(score, 5)) for watchlist, score in scored), key=lambda pair: (-pair[1], pair[0]))
+        
+    def built(self):
+        rows = recommendations.neighbours.rows()
+        self.assertTrue((rows['watchlist'][1:] > rows['watchlist'][:-1]).all())
+        return {int(row['watchlist']): self.ranked(recommendations.also_liked(int(row['watchlist']))) for row in rows}
+        
+    def test_build_matches_brute_force(self):
+        for min_common in (1, 2):
+            with self.subTest(min_common=min_common), self.settings(RECOMMENDATIONS={**settings.RECOMMENDATIONS, 'MIN_COMMON': min_common}):
+                recommendations.build()
+                self.assertEqual(self.built(), self.expected())
+        
+        # only the most similar are kept
+        with self.settings(RECOMMENDATIONS={**settings.RECOMMENDATIONS, 'NEIGHBOURS': 2}):
+            recommendations.build()
+            for watchlist, neighbours in self.expected().items():
+                kept = self.ranked(recommendations.also_liked(watchlist))
+                self.assertEqual(len(kept), min(2, len(neighbours)))
+                self.assertLessEqual(neighbours[len(kept) - 1][1], kept[-1][1])
+        
+    def test_refresh_recomputes_what_new_reviews_touched(self):
+        recommendations.build()
+        untouched = self.built()
+        
+        viewer, newcomer = self.users[0], self.users[15]
+        for watchlist in self.watchlists[:3]:
+            models.Review.objects.update_or_create(review_user=viewer, watchlist=watchlist, defaults={'rating': 5})
+            models.Review.objects.create(review_user=newcomer, rating=5, watchlist=watchlist)
+        touched = set(models.Review.objects.filter(review_user=viewer, rating__gte=4).values_list('watchlist_id', flat=True))
+        
+        self.assertEqual(recommendations.refresh(), len(touched))
+        expected, built = self.expected(), self.built()
+        for watchlist in touched:
+            self.assertEqual(built.get(watchlist), expected.get(watchlist))
+        self.assertEqual({watchlist: built[watchlist] for watchlist in untouched.keys() - touched},
+                         {watchlist: untouched[watchlist] for watchlist in untouched.keys() - touched})
+        self.assertEqual(recommendations.refresh(), 0)
+        
+        # a refresh without a previous build is a build
+        os.remove(self.path)
+        call_command('build_recommendations', incremental=True, stdout=io.StringIO())
+        self.assertEqual(self.built(), self.expected())
+        
+    @unthrottled
+    def test_endpoint(self):
+        first, second, third = self.watchlists[:3]
+        for user in self.users[12:]:
+            for watchlist in (first, second):
+                models.Review.objects.create(review_user=user, rating=5, watchlist=watchlist)
+        call_command('build_recommendations', stdout=io.StringIO())
+        
+        response = self.client.get(reverse('movie-also-liked', args=(first.id,)) + '?fields=id,title&limit=3')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([(item['id'], round(item['similarity'], 5)) for item in results], self.expected()[first.id][:3])
+        self.assertEqual(results[0]['id'], second.id)
+        self.assertEqual(set(results[0]), {'id', 'title', 'similarity'})
+        
+        # taken down titles drop out, rebuilt files are picked up
+        second.active = False
+        second.save()
+        response = self.client.get(reverse('movie-also-liked', args=(first.id,)))
+        self.assertNotIn(second.id, [item['id'] for item in response.data['results']])
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual(self.ranked(recommendations.also_liked(first.id)), self.expected()[first.id])
+        
+        response = self.client.get(reverse('movie-also-liked', args=(0,)))
+        self.assertEqual(response.data['results'], [])
+        with mock.patch.object(recommendations, 'available', return_value=False):
+            response = self.client.get(reverse('movie-also-liked', args=(first.id,)))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+@unthrottled
+class ReviewStatsTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        self.watchlists = [models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=self.stream) for i in range(3)]
+        self.users = [User.objects.create(username=f"user{i}") for i in range(8)]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=self.users[0]).key)
+        first, second, _ = self.watchlists
+        for user, rating, active in zip(self.users, [5, 5, 4, 1, 3, 5, 2, 2], [True] * 6 + [False] * 2):
+            models.Review.objects.create(review_user=user, rating=rating, active=active, watchlist=first)
+        models.Review.objects.create(review_user=self.users[0], rating=4, watchlist=second)
+        # two reviews from before the window and one from three days ago
+        now = timezone.now()
+        models.Review.objects.filter(review_user__in=self.users[:2], watchlist=first).update(created=now - timezone.timedelta(days=30))
+        models.Review.objects.filter(review_user=self.users[2], watchlist=first).update(created=now - timezone.timedelta(days=3))
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def expected(self, watchlist):
+        '''the statistics of watchlist counted from the table'''
+        reviews = models.Review.objects.filter(watchlist=watchlist)
+        histogram = {str(rating): reviews.filter(active=True, rating=rating).count() for rating in range(1, 6)}
+        today = timezone.now().date()
+        daily = [reviews.filter(created__date=today - timezone.timedelta(days=days)).count() for days in range(6, -1, -1)]
+        return {
+            'watchlist': watchlist.id, 'histogram': histogram, 'active_reviews': sum(histogram.values()),
+            'inactive_reviews': reviews.filter(active=False).count(), 'recent_reviews': sum(daily),
+            'reviews_per_day': round(sum(daily) / 7, 2), 'daily_reviews': daily,
+        }
+        
+    def stats(self, watchlist):
+        response = self.client.get(reverse('movie-stats', args=(watchlist.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+        
+    def test_stats(self):
+        first = self.watchlists[0]
+        data = self.stats(first)
+        self.assertEqual(data, self.expected(first))
+        self.assertEqual(data['histogram'], {'1': 1, '2': 0, '3': 1, '4': 1, '5': 3})
+        self.assertEqual((data['active_reviews'], data['inactive_reviews'], data['recent_reviews']), (6, 2, 6))
+        self.assertEqual(data['daily_reviews'][3], 1)
+        
+        # served from the cached counters, and the token from the token cache
+        with self.assertNumQueries(0):
+            self.stats(first)
+        self.assertEqual(self.stats(self.watchlists[2])['histogram'], dict.fromkeys('12345', 0))
+        response = self.client.get(reverse('movie-stats', args=(0,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_counters_follow_review_writes(self):
+        first, second, third = self.watchlists
+        for watchlist in self.watchlists:
+            self.stats(watchlist)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            created = models.Review.objects.create(review_user=self.users[1], rating=1, watchlist=second)
+        with self.captureOnCommitCallbacks(execute=True):
+            review = models.Review.objects.get(review_user=self.users[0], watchlist=first)
+            review.rating, review.active = 2, False
+            review.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = models.Review.objects.get(review_user=self.users[3], watchlist=first)
+            moved.watchlist = third
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Review.objects.get(review_user=self.users[6], watchlist=first).delete()
+            created.delete()
+        # a write that is rolled back moves nothing
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            models.Review.objects.create(review_user=self.users[7], rating=5, watchlist=third)
+            transaction.set_rollback(True)
+        
+        # the counters moved in place, nothing was counted again
+        with self.assertNumQueries(0):
+            cached = [self.stats(watchlist) for watchlist in self.watchlists]
+        self.assertEqual(cached, [self.expected(watchlist) for watchlist in self.watchlists])
+        
+        # bulk writes send no signals, the counters of what they touched are dropped
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Review.objects.bulk_create([models.Review(review_user=user, rating=3, watchlist=second) for user in self.users[2:5]])
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Review.objects.filter(watchlist=first).update(active=True)
+        for watchlist in self.watchlists:
+            with self.subTest(watchlist=watchlist.title):
+                self.assertEqual(self.stats(watchlist), self.expected(watchlist))
+        
+    def test_batch(self):
+        first, second, third = self.watchlists
+        url = reverse('movie-stats-batch')
+        # every watchlist in one grouped query, and the token lookup
+        with self.assertNumQueries(2):
+            response = self.client.get(url + f'?ids={third.id},{first.id},0,{first.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [self.expected(third), self.expected(first)])
+        
+        # only the watchlists not cached yet are counted
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + f'?ids={first.id},{second.id}')
+        self.assertEqual([item['watchlist'] for item in response.data['results']], [first.id, second.id])
+        self.assertIn(f'IN ({second.id})', queries.captured_queries[-1]['sql'])
+        
+        for query in ['', '?ids=', '?ids=1,x', '?ids=' + ','.join(map(str, range(1, 102)))]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(url + query).status_code, status.HTTP_400_BAD_REQUEST)
+                
+    def test_deleted_watchlists_are_forgotten(self):
+        first, second, _ = self.watchlists
+        deleted = first.id
+        self.stats(first)
+        self.client.get(reverse('movie-stats-batch') + f'?ids={deleted},{second.id}')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.client.get(reverse('movie-stats', args=(deleted,))).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('movie-stats-batch') + f'?ids={deleted},{second.id}')
+        self.assertEqual([item['watchlist'] for item in response.data['results']], [second.id])
+        
+@deferred
+class TaskQueueTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.stream = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        self.watchlists = [models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=self.stream) for i in range(2)]
+        self.users = [User.objects.create(username=f"user{i}") for i in range(5)]
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def drain(self):
+        return tasks.work(threading.Event(), once=True)
+        
+    def test_review_writes_are_recomputed_in_one_batch(self):
+        first, second = self.watchlists
+        for user, rating in zip(self.users, [5, 4, 3, 2, 1]):
+            models.Review.objects.create(review_user=user, rating=rating, watchlist=first)
+        moved = models.Review.objects.get(review_user=self.users[0])
+        moved.watchlist = second
+        moved.save()
+        models.Review.objects.get(review_user=self.users[4]).delete()
+        
+        # the reviews are in, the ratings wait for a worker with a job per watchlist
+        self.assertEqual(models.Job.objects.count(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.number_rating, 0)
+        
+        with mock.patch.object(models.recompute_watchlist_ratings, 'function', wraps=models.recompute_watchlist_ratings.function) as run:
+            self.assertEqual(self.drain(), 2)
+        run.assert_called_once_with([[first.id], [second.id]])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.stream.refresh_from_db()
+        self.assertEqual((first.rating_sum, first.number_rating, first.avg_rating), (9, 3, 3.0))
+        self.assertEqual((second.rating_sum, second.number_rating), (5, 1))
+        self.assertEqual((self.stream.rating_sum, self.stream.number_rating), (14, 4))
+        self.assertFalse(models.Job.objects.exists())
+        
+    def test_review_create_leaves_the_rating_to_the_queue(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post(reverse('review-create', args=(self.watchlists[0].id,)), data={"rating": 4, "description": "Good", "active": True})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(models.Job.objects.values_list('task', 'args')), [(models.recompute_watchlist_ratings.name, [self.watchlists[0].id])])
+        self.assertEqual(models.WatchList.objects.get(pk=self.watchlists[0].pk).avg_rating, 0.0)
+        self.drain()
+        self.assertEqual(models.WatchList.objects.get(pk=self.watchlists[0].pk).avg_rating, 4.0)
+        
+    def test_key_is_released_when_the_job_is_claimed(self):
+        first = self.watchlists[0]
+        models.recompute_ratings_later([first.id])
+        models.recompute_ratings_later([first.id])
+        jobs = tasks.claim(10)
+        self.assertEqual([(job.state, job.key, job.attempts) for job in jobs], [(tasks.RUNNING, None, 1)])
+        
+        # it may have read the reviews before this write, so the write queues another run
+        models.recompute_ratings_later([first.id])
+        self.assertTrue(tasks.run(jobs))
+        self.assertEqual(list(models.Job.objects.values_list('state', flat=True)), [tasks.PENDING])
+        
+    def test_a_claim_takes_one_task(self):
+        failing_task.defer('boom')
+        models.recompute_ratings_later([watchlist.id for watchlist in self.watchlists])
+        self.assertEqual([job.task for job in tasks.claim(10)], [failing_task.name])
+        self.assertEqual(len(tasks.claim(1)), 1)
+        self.assertEqual(len(tasks.claim(10)), 1)
+        self.assertEqual(tasks.claim(10), [])
+        
+    @override_settings(TASKS={**settings.TASKS, 'EAGER': False, 'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 60})
+    def test_failed_jobs_are_retried_then_kept(self):
+        failing_task.defer('boom')
+        with self.assertLogs('watchmate.tasks', 'ERROR'):
+            self.assertEqual(self.drain(), 0)
+        job = models.Job.objects.get()
+        self.assertEqual((job.state, job.attempts), (tasks.PENDING, 1))
+        self.assertIn('ValueError: boom', job.error)
+        self.assertGreater(job.run_after, timezone.now() + timezone.timedelta(seconds=50))
+        
+        # not due yet
+        self.assertEqual(tasks.claim(10), [])
+        models.Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('watchmate.tasks', 'ERROR'):
+            self.drain()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (tasks.FAILED, 2))
+        self.assertEqual(tasks.claim(10), [])
+        
+    def test_stale_jobs_go_back_to_the_queue(self):
+        models.recompute_ratings_later([self.watchlists[0].id])
+        tasks.claim(10)
+        self.assertEqual(tasks.requeue_stale(), 0)
+        models.Job.objects.update(claimed=timezone.now() - timezone.timedelta(seconds=settings.TASKS['TIMEOUT'] + 1))
+        self.assertEqual(tasks.requeue_stale(), 1)
+        self.assertEqual(self.drain(), 1)
+        
+    @override_settings(TASKS={**settings.TASKS, 'EAGER': True})
+    def test_eager_tasks_run_at_once(self):
+        first = self.watchlists[0]
+        models.Review.objects.create(review_user=self.users[0], rating=4, watchlist=first)
+        models.WatchList.objects.filter(pk=first.pk).update(rating_sum=0, number_rating=0)
+        models.recompute_ratings_later([first.id])
+        self.assertFalse(models.Job.objects.exists())
+        first.refresh_from_db()
+        self.assertEqual((first.rating_sum, first.number_rating), (4, 1))
+        
+@deferred
+class RunTasksCommandTestCase(TransactionTestCase):
+    
+    def test_run_tasks(self):
+        stream = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        watchlists = [models.WatchList.objects.create(title=f"Movie {i}", storyline="story", platform=stream) for i in range(3)]
+        users = [User.objects.create(username=f"user{i}") for i in range(4)]
+        models.Review.objects.bulk_create([models.Review(review_user=user, rating=5, watchlist=watchlist) for user in users for watchlist in watchlists])
+        
+        # the worker threads read what this one committed through connections of their own
+        output = io.StringIO()
+        call_command('run_tasks', '--once', '--threads', '1', stdout=output)
+        self.assertIn('Ran 3 jobs', output.getvalue())
+        self.assertEqual(list(models.WatchList.objects.values_list('number_rating', flat=True)), [4, 4, 4])
+        self.assertFalse(models.Job.objects.exists())
+        
+        with self.assertRaises(CommandError):
+            call_command('run_tasks', '--threads', '0')
+        
+class SeekPaginationTestCase(APITestCase):
+    
+    class Pages(pagination.SeekPageNumberPagination):
+        page_size = 10
+        last_page_strings = ('end',)
+        
+    def setUp(self):
+        cache.clear()
+        stream = models.StreamPlatform.objects.create(name="Netflix", about="about", website="https://example.com")
+        self.watchlist = models.WatchList.objects.create(title="Movie", storyline="story", platform=stream)
+        self.users = [User.objects.create(username=f"user{i}") for i in range(26)]
+        models.Review.objects.bulk_create([models.Review(review_user=user, rating=5, watchlist=self.watchlist) for user in self.users[:25]])
+        # a tie on every created, the id orders them
+        models.Review.objects.update(created=timezone.now())
+        self.ids = list(models.Review.objects.order_by('-created', '-id').values_list('id', flat=True))
+        
+    def tearDown(self):
+        cache.clear()
+        
+    def page(self, paginator, url):
+        request = Request(APIRequestFactory().get(url))
+        rows = paginator.paginate_queryset(models.Review.objects.all(), request)
+        return paginator.get_paginated_response([row.id for row in rows]).data
+        
+    def test_pages_are_not_counted(self):
+        url, seen = '/reviews/?limit=10', []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                data = self.page(pagination.SeekLimitOffsetPagination(), url)
+                self.assertNotIn('count', data)
+                seen += data['results']
+                url = data['next']
+        self.assertEqual(seen, self.ids)
+        self.assertFalse(data['has_next'])
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        
+    def test_deep_offsets_seek_to_the_rows_offset_finds(self):
+        for offset in range(0, 27, 3):
+            url = f'/reviews/?limit=4&offset={offset}'
+            with override_settings(PAGINATION={**settings.PAGINATION, 'SEEK_OFFSET': 0}):
+                sought = self.page(pagination.SeekLimitOffsetPagination(), url)
+            skipped = self.page(pagination.SeekLimitOffsetPagination(), url)
+            self.assertEqual(sought, skipped)
+            self.assertEqual(sought['results'], self.ids[offset:offset + 4])
+            
+    def test_next_link_survives_inserts(self):
+        first = self.page(pagination.SeekLimitOffsetPagination(), '/reviews/?limit=10')
+        models.Review.objects.create(review_user=self.users[25], rating=1, watchlist=self.watchlist)
+        second = self.page(pagination.SeekLimitOffsetPagination(), first['next'])
+        self.assertEqual(second['results'], self.ids[10:20])
+        self.assertNotIn('after', second['previous'])
+        
+        with self.assertRaises(NotFound):
+            self.page(pagination.SeekLimitOffsetPagination(), '/reviews/?limit=10&after=bm90IGEga2V5')
+            
+    @deferred
+    def test_estimated_count_is_counted_again_by_a_task(self):
+        reviews = models.Review.objects.filter(watchlist=self.watchlist)
+        everything = models.Review.objects.all()
+        self.assertEqual(pagination.estimated_count(reviews), 25)
+        self.assertEqual(pagination.estimated_count(everything), 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(pagination.estimated_count(reviews.order_by('id')), 25)
+        models.Review.objects.create(review_user=self.users[25], rating=1, watchlist=self.watchlist)
+        self.assertEqual(pagination.estimated_count(reviews), 25)
+        
+        with override_settings(PAGINATION={**settings.PAGINATION, 'COUNT_REFRESH': 0}):
+            # the stale count is served until a worker counts again
+            self.assertEqual(pagination.estimated_count(everything), 25)
+            self.assertEqual(pagination.estimated_count(reviews, {'watchlist': self.watchlist.id}), 25)
+            jobs = models.Job.objects.filter(task=pagination.recount.name).order_by('id')
+            self.assertEqual([job.args[1:] for job in jobs], [['watchlist_app.Review', {}], ['watchlist_app.Review', {'watchlist': self.watchlist.id}]])
+            # with the rating job of the new review
+            self.assertEqual(tasks.work(threading.Event(), once=True), 3)
+            self.assertEqual(pagination.estimated_count(everything), 26)
+            self.assertEqual(pagination.estimated_count(reviews), 26)
+            
+            # a filtered queryset that comes without its lookups is counted again by the request
+            models.Review.objects.filter(review_user=self.users[25]).delete()
+            queued = jobs.count()
+            self.assertEqual(pagination.estimated_count(reviews), 25)
+            self.assertEqual(jobs.count(), queued)
+        self.assertEqual(pagination.estimated_count(reviews.none()), 0)
+        
+    @unthrottled
+    @mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'review-list': None})
+    @override_settings(PAGINATION={**settings.PAGINATION, 'REVIEW_LIST': 'seek'})
+    def test_review_list_can_be_sought(self):
+        self.client.force_authenticate(self.users[25])
+        url = reverse('reviews-list', args=(self.watchlist.id,)) + '?limit=10'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 25)
+            seen += [review['id'] for review in response.data['results']]
+            url = response.data['next']
+            if url:
+                self.assertIn('after=', url)
+        self.assertEqual(seen, self.ids)
+        
+    @deferred
+    @unthrottled
+    @mock.patch.dict(throttling.CounterRateThrottle.THROTTLE_RATES, {'review-list': None})
+    @override_settings(PAGINATION={**settings.PAGINATION, 'REVIEW_LIST': 'seek', 'COUNT_REFRESH': 0})
+    def test_review_list_is_counted_in_the_background(self):
+        self.client.force_authenticate(self.users[25])
+        url = reverse('reviews-list', args=(self.watchlist.id,))
+        self.assertEqual(self.client.get(url).data['count'], 25)
+        self.assertEqual(self.client.get(url + '?active=true').data['count'], 25)
+        models.Review.objects.create(review_user=self.users[25], rating=1, watchlist=self.watchlist)
+        
+        self.assertEqual(self.client.get(url).data['count'], 25)
+        self.assertEqual(self.client.get(url + '?active=true').data['count'], 25)
+        jobs = models.Job.objects.filter(task=pagination.recount.name).order_by('id')
+        self.assertEqual([job.args[2] for job in jobs], [{'watchlist': self.watchlist.id}, {'watchlist': self.watchlist.id, 'active': True}])
+        tasks.work(threading.Event(), once=True)
+        self.assertEqual(self.client.get(url).data['count'], 26)
+        self.assertEqual(self.client.get(url + '?active=true').data['count'], 26)
+        
+    def test_page_numbers(self):
+        data = self.page(self.Pages(), '/reviews/?page=2')
+        self.assertEqual(data['results'], self.ids[10:20])
+        self.assertEqual(data['previous'], 'http://testserver/reviews/')
+        self.assertEqual(self.page(self.Pages(), data['next'])['results'], self.ids[20:])
+        
+        for url in ('/reviews/?page=4', '/reviews/?page=0', '/reviews/?page=end'):
+            with self.assertRaises(NotFound):
+                self.page(self.Pages(), url)
+        counted = self.Pages()
+        counted.count_mode = 'exact'
+        data = self.page(counted, '/reviews/?page=end')
+        self.assertEqual((data['count'], data['results'], data['next']), (25, self.ids[20:], None))
@@ -0,0 +1,236 @@
+"""
+Per-request timings: how many queries a request ran and how long they, serialization and rendering took.
+TimingMiddleware reports them in a Server-Timing header and a log line on the watchmate.requests logger,
+and adds the request to per view histograms that MetricsView serves to staff in the Prometheus text
+format. Histograms are kept in process memory, so each worker reports its own.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework import serializers
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger('watchmate.requests')
+current = ContextVar('request_timings', default=None)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Timings:
+    '''what one request spent, in seconds'''
+    __slots__ = ('queries', 'db', 'serialize', 'render', 'depth')
+    
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.depth = 0
+        
+def record_query(execute, sql, params, many, context):
+    '''
+    execute wrapper of every connection. the timings come from the request's context, which follows it into
+    the thread async views run their queries in, where the connections are not the request thread's
+    '''
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+        
+@receiver(connection_created)
+def install(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+        
+@contextmanager
+def measuring(phase):
+    '''add the time spent inside to phase of the current request, once however deeply the calls nest'''
+    timings = current.get()
+    if timings is None or timings.depth:
+        yield
+        return
+    timings.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, phase, getattr(timings, phase) + time.perf_counter() - start)
+        timings.depth -= 1
+        
+def serializing():
+    return measuring('serialize')
+    
+def rendering():
+    return measuring('render')
+    
+class TimedSerializerMixin:
+    '''
+    serializer whose .data counts as the serialization of the current request. nested serializers are timed
+    as part of their parent, a list of them needs TimedListSerializer as its Meta.list_serializer_class
+    '''
+    
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+    
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+    
+class Histogram:
+    '''request durations and the time spent on queries, serialization and rendering, per (view, method)'''
+    
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}
+    
+    def observe(self, labels, duration, timings):
+        bucket = bisect_left(self.buckets, duration)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {'buckets': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0,
+                                                'queries': 0, 'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+            series['buckets'][bucket] += 1
+            series['count'] += 1
+            series['sum'] += duration
+            series['queries'] += timings.queries
+            series['db'] += timings.db
+            series['serialize'] += timings.serialize
+            series['render'] += timings.render
+    
+    def exposition(self):
+        with self.lock:
+            series = {labels: {**values, 'buckets': list(values['buckets'])} for labels, values in self.series.items()}
+    
+        lines = ['# HELP watchmate_request_duration_seconds Time spent handling requests.',
+                 '# TYPE watchmate_request_duration_seconds histogram']
+        for (view, method), values in sorted(series.items()):
+            labels = f'view="{escape(view)}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip([*map(repr, map(float, self.buckets)), '+Inf'], values['buckets']):
+                cumulative += count
+                lines.append(f'watchmate_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'watchmate_request_duration_seconds_sum{{{labels}}} {values["sum"]!r}')
+            lines.append(f'watchmate_request_duration_seconds_count{{{labels}}} {values["count"]}')
+    
+        for name, key, help_text in [
+            ('watchmate_db_queries_total', 'queries', 'Database queries run by requests.'),
+            ('watchmate_db_duration_seconds_total', 'db', 'Time requests spent in database queries.'),
+            ('watchmate_serialize_duration_seconds_total', 'serialize', 'Time requests spent in serializers.'),
+            ('watchmate_render_duration_seconds_total', 'render', 'Time requests spent rendering responses.'),
+        ]:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (view, method), values in sorted(series.items()):
+                lines.append(f'{name}{{view="{escape(view)}",method="{method}"}} {values[key]!r}')
+        return '\n'.join(lines) + '\n'
+    
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+histogram = Histogram(settings.REQUEST_TIMING['BUCKETS'])
+
+class TimingMiddleware:
+    '''time every request, first in MIDDLEWARE so the timings cover the other middleware too'''
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.server_timing = settings.REQUEST_TIMING['SERVER_TIMING_HEADER']
+        # connections opened before this was imported never sent connection_created to it
+        for connection in connections.all(initialized_only=True):
+            install(None, connection)
+            
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        # a streamed body is produced after this, the timings stop at its first byte
+        self.report(request, response, timings, time.perf_counter() - start)
+        return response
+        
+    async def __acall__(self, request):
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.report(request, response, timings, time.perf_counter() - start)
+        return response
+        
+    def process_template_response(self, request, response):
+        # runs right before the response renders, the callback right after
+        timings = current.get()
+        start = time.perf_counter()
+    
+        def rendered(response):
+            timings.render += time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+    
+    def report(self, request, response, timings, duration):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        method = request.method if request.method in METHODS else 'OTHER'
+        histogram.observe((view, method), duration, timings)
+    
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries", '
+                f'serialize;dur={timings.serialize * 1000:.2f}, render;dur={timings.render * 1000:.2f}, '
+                f'total;dur={duration * 1000:.2f}'
+            )
+        if logger.isEnabledFor(logging.INFO):
+            fields = {
+                'method': request.method, 'path': request.path, 'view': view, 'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2), 'queries': timings.queries, 'db_ms': round(timings.db * 1000, 2),
+                'serialize_ms': round(timings.serialize * 1000, 2), 'render_ms': round(timings.render * 1000, 2),
+            }
+            logger.info(' '.join(f'{key}={value}' for key, value in fields.items()), extra={'timing': fields})
+    
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else json.dumps(data)
+    
+class MetricsView(APIView):
+    '''the request histograms of this process, for a Prometheus scraper authenticated as staff'''
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+    throttle_classes = []
+    
+    def get(self, request):
+        return Response(histogram.exposition())
+    
\ No newline at end of file
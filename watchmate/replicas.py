@@ -0,0 +1,175 @@
+"""
+Read replicas. ReplicaRouter sends the reads of a safe request to one of REPLICA_DATABASES and every
+write, and the reads of a request that may write, to default. A client that wrote reads from default for
+REPLICA_PINNING['SECONDS'] afterwards, long enough for the replicas to catch up, so it always reads its
+own writes: ReplicaPinningMiddleware marks it with a cookie, and token clients, which may not keep
+cookies, with a cache entry keyed on their Authorization header. Outside requests, in management
+commands, migrations and shells, everything goes to default.
+"""
+import hashlib
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+current = ContextVar('replica_routing', default=None)
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Routing:
+    '''where the current request reads from'''
+    __slots__ = ('pinned', 'wrote', 'replica')
+    
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+        # picked once, so a request reads one replica's view of the data
+        self.replica = None
+    
+def record_write(execute, sql, params, many, context):
+    '''
+    execute wrapper of every connection. the router is asked for a database to write to when nothing gets
+    written to, a model instance pointed at another for instance, so writes are told by their SQL
+    '''
+    routing = current.get()
+    if routing is not None and not routing.wrote and sql.lstrip()[:7].upper().startswith(WRITES):
+        routing.wrote = True
+    return execute(sql, params, many, context)
+    
+@receiver(connection_created)
+def install(sender, connection, **kwargs):
+    if record_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_write)
+    
+@contextmanager
+def primary():
+    '''read from default inside, for reads that outlive the request such as the cached responses'''
+    routing = current.get()
+    if routing is None or routing.pinned:
+        yield
+        return
+    routing.pinned = True
+    try:
+        yield
+    finally:
+        routing.pinned = False
+    
+@contextmanager
+def unrecorded():
+    '''writes made inside do not pin the client, for writes it never reads back such as a queued job'''
+    routing = current.get()
+    wrote = routing is not None and routing.wrote
+    try:
+        yield
+    finally:
+        if routing is not None:
+            routing.wrote = wrote
+    
+class ReplicaRouter:
+    '''
+    reads from a replica while a request that has not written runs them outside a transaction, from
+    default otherwise; writes and migrations go to default
+    '''
+    
+    def db_for_read(self, model, **hints):
+        routing = current.get()
+        if routing is None or routing.pinned or routing.wrote or not settings.REPLICA_DATABASES:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if routing.replica is None:
+            routing.replica = random.choice(settings.REPLICA_DATABASES)
+        return routing.replica
+    
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas follow the schema of their primary
+        return db not in settings.REPLICA_DATABASES
+    
+def pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'replica-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+    
+class ReplicaPinningMiddleware:
+    '''route the reads of every request, and pin clients that wrote to default for a while'''
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.seconds = settings.REPLICA_PINNING['SECONDS']
+        self.cookie = settings.REPLICA_PINNING['COOKIE']
+        self.cache_alias = settings.REPLICA_PINNING['CACHE_ALIAS']
+        # connections opened before this was imported never sent connection_created to it
+        for connection in connections.all(initialized_only=True):
+            install(None, connection)
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        key = pin_key(request) if self.cache_alias else None
+        # a write reads what it changes from default, or it would build on a replica's stale rows
+        routing = Routing(request.method not in SAFE_METHODS or self.pinned_by_cookie(request) or
+                          (key is not None and caches[self.cache_alias].get(key, False)))
+        token = current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if routing.wrote:
+            self.pin(response)
+            if key is not None:
+                caches[self.cache_alias].set(key, True, self.seconds)
+        return response
+    
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        key = pin_key(request) if self.cache_alias else None
+        routing = Routing(request.method not in SAFE_METHODS or self.pinned_by_cookie(request) or
+                          (key is not None and await caches[self.cache_alias].aget(key, False)))
+        token = current.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        if routing.wrote:
+            self.pin(response)
+            if key is not None:
+                await caches[self.cache_alias].aset(key, True, self.seconds)
+        return response
+    
+    def pinned_by_cookie(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
+    
+    def pin(self, response):
+        # the expiry is in the value too, clients keep cookies past max-age
+        response.set_cookie(self.cookie, f'{time.time() + self.seconds:.0f}', max_age=self.seconds, httponly=True, samesite='Lax')
+    
\ No newline at end of file
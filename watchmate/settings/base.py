@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'watchmate.instrumentation.TimingMiddleware',
+    'watchmate.replicas.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,119 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Catalog read responses are cached under per-model version numbers (watchlist_app.caching),
+# any cache backend works, locmem and file based ones included
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Token -> user lookups of user_app.api.authentication.CachedTokenAuthentication are kept in a per-process
+# LRU and, when SHARED_CACHE_ALIAS names a cache, in that cache too. Logout and user changes purge both,
+# other processes' LRUs catch up within TTL seconds
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 30,
+    'SHARED_CACHE_ALIAS': None,
+    'SHARED_TTL': 5 * 60,
+}
+
+# watchlist_app.leaderboards. Top rated ranks active titles with at least MIN_REVIEWS reviews by their mean
+# rating pulled towards PRIOR_MEAN as though PRIOR_REVIEWS more reviews had given it; changing either takes
+# `python manage.py recompute_ratings`. Trending ranks the TRENDING_SIZE titles reviewed most in the last
+# TRENDING_WINDOW seconds, a ranking computed at most once every TRENDING_REFRESH seconds
+LEADERBOARDS = {
+    'PRIOR_MEAN': 3.0,
+    'PRIOR_REVIEWS': 10,
+    'MIN_REVIEWS': 1,
+    'TRENDING_WINDOW': 7 * 24 * 60 * 60,
+    'TRENDING_SIZE': 100,
+    'TRENDING_REFRESH': 5 * 60,
+}
+
+# watchlist_app.review_stats keeps the review statistics of every watchlist asked for as counters in the
+# response cache for TIMEOUT seconds, with reviews per day over the last VELOCITY_DAYS days
+REVIEW_STATS = {
+    'VELOCITY_DAYS': 7,
+    'TIMEOUT': 60 * 60,
+}
+
+# watchlist_app.tasks. `python manage.py run_tasks` runs deferred tasks on THREADS threads, a batch task up to
+# BATCH_SIZE jobs at a time, and looks for due jobs every POLL_INTERVAL seconds when there are none. A failed
+# job is retried RETRY_DELAY seconds later, doubling every time, until it has been tried MAX_ATTEMPTS times,
+# and a job still running after TIMEOUT seconds goes back to the queue. EAGER runs tasks where they are deferred
+TASKS = {
+    'EAGER': False,
+    'THREADS': 4,
+    'BATCH_SIZE': 500,
+    'POLL_INTERVAL': 1.0,
+    'RETRY_DELAY': 10,
+    'MAX_ATTEMPTS': 5,
+    'TIMEOUT': 10 * 60,
+}
+
+# "also liked" neighbours of watchlist_app.recommendations: a review of LIKE_RATING or more is a like, the
+# NEIGHBOURS watchlists most liked by the same viewers are kept, counting those that share at least
+# MIN_COMMON of them. `python manage.py build_recommendations` writes them to PATH, --incremental refreshes them
+RECOMMENDATIONS = {
+    'PATH': BASE_DIR / 'recommendations.npy',
+    'NEIGHBOURS': 20,
+    'LIKE_RATING': 4,
+    'MIN_COMMON': 2,
+}
+
+# the seek paginators of watchlist_app.api.pagination read the row at an offset of SEEK_OFFSET or more from
+# the index alone and seek to it. An estimated count is kept in the response cache for COUNT_TTL seconds
+# and counted again in the background once it is COUNT_REFRESH seconds old. REVIEW_LIST is 'cursor' or 'seek', the paginator
+# of a watchlist's reviews
+PAGINATION = {
+    'REVIEW_LIST': 'cursor',
+    'SEEK_OFFSET': 1000,
+    'COUNT_REFRESH': 60,
+    'COUNT_TTL': 24 * 60 * 60,
+}
+
+# watchmate.replicas.ReplicaRouter spreads the reads of requests over the REPLICA_DATABASES aliases of
+# DATABASES, see settings_prod and settings_dev. A client that wrote reads from default for SECONDS after,
+# marked by COOKIE and, for token clients, an entry in CACHE_ALIAS, which every process has to share
+DATABASE_ROUTERS = ['watchmate.replicas.ReplicaRouter']
+REPLICA_DATABASES = []
+REPLICA_PINNING = {
+    'SECONDS': 10,
+    'COOKIE': 'read_primary_until',
+    'CACHE_ALIAS': 'default',
+}
+
+# watchmate/asgi.py turns this on: the movie, stream platform and review read paths are then served by the
+# async views of watchlist_app.api.views, which leave the event loop free while they wait on the database
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# watchmate.instrumentation.TimingMiddleware adds a Server-Timing header to every response, logs one line
+# per request on the watchmate.requests logger at INFO and keeps per view duration histograms, with these
+# bucket bounds in seconds, for the staff only metrics/ endpoint
+REQUEST_TIMING = {
+    'SERVER_TIMING_HEADER': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'watchmate.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'watchmate.tasks': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -105,15 +220,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'user_app.api.authentication.CachedTokenAuthentication',
     ],
-    'DEFAUL_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+    'DEFAULT_THROTTLE_CLASSES': [
+        'watchlist_app.api.throttling.AnonCounterThrottle',
+        'watchlist_app.api.throttling.UserCounterThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '1/day',
-        'user': '5/day',
+        # applied to every endpoint, the public catalog included
+        'anon': '60/minute',
+        'user': '120/minute',
         # 'review-throttle':'1/minute',
         'review-throttle':'2/day',
         'review-create':'2/day',
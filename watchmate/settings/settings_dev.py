@@ -39,6 +39,19 @@ DATABASES = {
     }
 }
 
+# REPLICAS=2 adds db_replica1.sqlite3 and db_replica2.sqlite3 as read replicas, which only catch up with
+# db.sqlite3 when `python manage.py sync_replicas` copies it over them. Tests read them through default
+REPLICA_DATABASES = [f'replica{number}' for number in range(1, int(os.environ.get('REPLICAS', 0)) + 1)]
+for alias in REPLICA_DATABASES:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# runserver and the tests need no worker, deferred tasks run inside the write that defers them
+TASKS = {**TASKS, 'EAGER': True}
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
@@ -36,6 +36,12 @@ DATABASES = {
     }
 }
 
+# DB_REPLICA_HOSTS=replica-1,replica-2 adds read replicas reached with the primary's credentials
+REPLICA_DATABASES = []
+for number, host in enumerate(env("DB_REPLICA_HOSTS", cast=list, default=[]), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica{number}')
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from watchmate.instrumentation import MetricsView
+
 urlpatterns = [
     path('dashboard/', admin.site.urls),
     path('api/watch/', include('watchlist_app.api.urls')),
-    path('api/account/', include('user_app.api.urls'))
+    path('api/account/', include('user_app.api.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     # path('api-auth/', include('rest_framework.urls')),
 ]